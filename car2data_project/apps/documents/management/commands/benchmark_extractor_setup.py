@@ -0,0 +1,50 @@
+import time
+import logging
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from services.pdf_extractor import PDFExtractor, get_pdf_extractor, reset_pdf_extractor
+
+
+class Command(BaseCommand):
+    help = 'Compara el costo de construir PDFExtractor por trabajo frente al extractor compartido del proceso'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Número de trabajos simulados',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        # La construcción no hace llamadas de red, así que una clave ficticia basta
+        logging.disable(logging.INFO)
+        with override_settings(GEMINI_API_KEY='benchmark-key'):
+            reset_pdf_extractor()
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                PDFExtractor()
+            per_job = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                get_pdf_extractor()
+            shared = time.perf_counter() - start
+
+            reset_pdf_extractor()
+        logging.disable(logging.NOTSET)
+
+        self.stdout.write(f'Iteraciones: {iterations}')
+        self.stdout.write(
+            f'PDFExtractor() por trabajo: {per_job * 1000:.2f} ms total, '
+            f'{per_job / iterations * 1e6:.1f} µs por trabajo'
+        )
+        self.stdout.write(
+            f'get_pdf_extractor():       {shared * 1000:.2f} ms total, '
+            f'{shared / iterations * 1e6:.1f} µs por trabajo'
+        )
+        if shared:
+            self.stdout.write(self.style.SUCCESS(f'Aceleración: {per_job / shared:.1f}x'))
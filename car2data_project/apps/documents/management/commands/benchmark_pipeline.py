@@ -0,0 +1,185 @@
+import io
+import os
+import time
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from reportlab.pdfgen import canvas
+from apps.documents.models import Document, ExtractionJob
+from apps.forms_generation.models import GeneratedForm
+from services.extraction_queue import ExtractionWorkerPool, enqueue_extraction
+from services.form_generation_jobs import generate_form
+from services.form_rendering import build_form_data
+from services.pdf_extractor import reset_pdf_extractor
+
+BENCHMARK_USERNAME = 'benchmark_pipeline'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta el flujo completo carga → extracción → generación sin red, usando el backend '
+        'local de fixtures, y reporta rendimiento y latencias'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=50, help='Documentos a procesar')
+        parser.add_argument('--concurrency', type=int, default=4, help='Workers de extracción')
+        parser.add_argument('--latency', type=float, default=0.2, help='Latencia simulada del modelo (s)')
+        parser.add_argument('--jitter', type=float, default=0.05, help='Variación de la latencia simulada (s)')
+        parser.add_argument('--batch-size', type=int, default=1, help='Documentos por petición al modelo')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Probabilidad de fallo transitorio')
+        parser.add_argument(
+            '--form-type',
+            default='contrato_compraventa',
+            choices=['contrato_compraventa', 'contrato_mandato', 'formulario_tramite', 'none'],
+            help="Formulario a generar por documento ('none' para omitir la generación)",
+        )
+        parser.add_argument('--timeout', type=float, default=600, help='Tiempo máximo de espera (s)')
+        parser.add_argument('--keep', action='store_true', help='No eliminar los datos generados')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'EXTRACTION_BACKEND': 'local',
+            'EXTRACTION_FIXTURE_LATENCY': options['latency'],
+            'EXTRACTION_FIXTURE_JITTER': options['jitter'],
+            'EXTRACTION_FIXTURE_FAILURE_RATE': options['failure_rate'],
+            'EXTRACTION_WORKERS_IN_PROCESS': False,
+            'EXTRACTION_CACHE_ENABLED': False,
+            'EXTRACTION_MAX_RUNNING_PER_USER': options['concurrency'],
+            'GEMINI_RETRY_BASE_DELAY': 0.05,
+            'EXTRACTION_BATCH_SIZE': options['batch_size'],
+            'EXTRACTION_BATCH_MAX_WAIT': 0.2,
+        }
+        # Los logs por documento distorsionan las mediciones
+        logging.disable(logging.CRITICAL)
+        try:
+            with override_settings(**overrides):
+                reset_pdf_extractor()
+                user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+                try:
+                    self._run(user, options)
+                finally:
+                    if not options['keep']:
+                        self._cleanup(user)
+                    reset_pdf_extractor()
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _run(self, user, options):
+        count = options['documents']
+
+        start = time.perf_counter()
+        documents = []
+        for index in range(count):
+            document = Document(user=user, name=f'benchmark_{index}.pdf', document_type='ownership')
+            document.file.save(f'benchmark_{index}.pdf', ContentFile(self._sample_pdf(index)), save=True)
+            enqueue_extraction(document)
+            documents.append(document)
+        upload_time = time.perf_counter() - start
+
+        pool = ExtractionWorkerPool(concurrency=options['concurrency'], poll_interval=0.05)
+        start = time.perf_counter()
+        pool.start(recover=False)
+        jobs = ExtractionJob.objects.filter(document__in=documents)
+        while jobs.filter(status__in=['queued', 'running']).exists():
+            if time.perf_counter() - start > options['timeout']:
+                self.stdout.write(self.style.WARNING('Tiempo máximo alcanzado; hay trabajos sin terminar'))
+                break
+            time.sleep(0.05)
+        extraction_time = time.perf_counter() - start
+        pool.stop()
+
+        latencies = [
+            (finished - created).total_seconds()
+            for created, finished in jobs.filter(finished_at__isnull=False).values_list('created_at', 'finished_at')
+        ]
+        completed = Document.objects.filter(id__in=[d.id for d in documents], status='completed')
+
+        generation_times = []
+        generation_errors = 0
+        if options['form_type'] != 'none':
+            form_type = options['form_type']
+            for document in completed:
+                started = time.perf_counter()
+                # Renderizado directo, sin el executor en segundo plano de la vista
+                form_data = build_form_data(form_type, document.get_structured_data(), self._form_payload(document))
+                if generate_form(document, form_type, form_data):
+                    generation_times.append(time.perf_counter() - started)
+                else:
+                    generation_errors += 1
+
+        self.stdout.write(f"Documentos: {count}  concurrencia: {options['concurrency']}  lote: {options['batch_size']}  "
+                          f"latencia simulada: {options['latency']}s  tasa de fallo: {options['failure_rate']}")
+        self.stdout.write(f'Carga + encolado: {upload_time:.2f}s ({count / upload_time:.1f} doc/s)')
+        self.stdout.write(
+            f'Extracción: {extraction_time:.2f}s ({len(latencies) / extraction_time:.1f} doc/s), '
+            f'completados {completed.count()}, fallidos {jobs.filter(status="failed").count()}'
+        )
+        self.stdout.write(
+            f'Latencia por trabajo: p50 {percentile(latencies, 0.5):.2f}s  '
+            f'p95 {percentile(latencies, 0.95):.2f}s  máx {max(latencies, default=0):.2f}s'
+        )
+        if generation_times:
+            total = sum(generation_times)
+            self.stdout.write(
+                f'Generación ({options["form_type"]}): {total:.2f}s ({len(generation_times) / total:.1f} form/s), '
+                f'p95 {percentile(generation_times, 0.95) * 1000:.0f}ms, errores {generation_errors}'
+            )
+
+    def _cleanup(self, user):
+        for generated in GeneratedForm.objects.filter(user=user):
+            path = os.path.join(settings.MEDIA_ROOT, str(generated.generated_file))
+            if os.path.exists(path):
+                os.remove(path)
+        for document in Document.objects.filter(user=user):
+            document.file.delete(save=False)
+        user.delete()
+
+    @staticmethod
+    def _sample_pdf(index):
+        """PDF pequeño y distinto por documento (para que la placa simulada varíe)"""
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer)
+        pdf.drawString(72, 720, f'TARJETA DE PROPIEDAD - documento de prueba {index}')
+        pdf.save()
+        return buffer.getvalue()
+
+    @staticmethod
+    def _form_payload(document):
+        """Datos adicionales mínimos para que el formulario pase la validación"""
+        structured = document.get_structured_data()
+        propietario = structured.get('propietario', {})
+        persona = {
+            'nombre': propietario.get('nombre') or 'PRUEBA',
+            'documento': propietario.get('identificacion') or '1020304050',
+            'tipo_documento': 'CC',
+            'ciudad': 'MEDELLIN',
+        }
+        vehiculo = structured.get('vehiculo', {})
+        return {
+            'vendedor': persona,
+            'comprador': dict(persona, nombre='COMPRADOR DE PRUEBA', documento='9080706050'),
+            'valor_venta': 35000000,
+            'forma_pago': 'CONTADO',
+            'ciudad_contrato': 'MEDELLIN',
+            'fecha_contrato': '2025-01-15',
+            'mandante': persona,
+            'mandatario': {},
+            'placa': vehiculo.get('placa', ''),
+            'marca': vehiculo.get('marca', ''),
+            'linea': vehiculo.get('linea', ''),
+            'modelo': vehiculo.get('modelo', ''),
+            'color': vehiculo.get('color', ''),
+            'propietario_nombres': persona['nombre'],
+            'propietario_documento': persona['documento'],
+        }
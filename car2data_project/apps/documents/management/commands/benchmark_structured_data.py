@@ -0,0 +1,152 @@
+import copy
+import time
+import logging
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from apps.documents.models import Document
+from apps.forms_generation.models import GeneratedForm
+from apps.vehicles.models import Persona, Vehiculo
+from services.extraction_backends import LocalFixtureBackend
+
+BENCHMARK_USERNAME = 'benchmark_structured_data'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide consultas SQL, tiempo de CPU y construcciones de datos estructurados en las vistas '
+        'que leen la extracción, con y sin la memorización de Document.structured_data, y verifica '
+        'que el historial use un número fijo de consultas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=10, help='Documentos (y formularios) de prueba')
+        parser.add_argument('--iterations', type=int, default=20, help='Peticiones por vista')
+
+    def handle(self, *args, **options):
+        logging.disable(logging.CRITICAL)
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        try:
+            documents, forms = self._create_data(user, options['documents'])
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            scenarios = [
+                ('Generar formulario', lambda i: reverse('forms_generation:generate') + (
+                    f'?document_id={documents[i % len(documents)].id}&form_type=contrato_compraventa')),
+                ('Descargar PDF', lambda i: reverse(
+                    'forms_generation:download_pdf', kwargs={'form_id': forms[i % len(forms)].id})),
+                ('Historial', lambda i: reverse('forms_generation:history')),
+            ]
+
+            self.stdout.write(f"Documentos: {len(documents)}  peticiones por vista: {options['iterations']}")
+            for label, url in scenarios:
+                for mode, memoized in (('sin memoria', False), ('memorizado', True)):
+                    result = self._measure(client, url, options['iterations'], memoized)
+                    self.stdout.write(
+                        f'{label:<20} {mode:<12} {result["queries"]:6.1f} consultas  '
+                        f'{result["builds"]:5.1f} construcciones  '
+                        f'{result["cpu"] * 1000:7.2f} ms CPU  {result["wall"] * 1000:7.2f} ms'
+                    )
+            self._check_history_queries(client, user, forms)
+        finally:
+            self._cleanup(user)
+            logging.disable(logging.NOTSET)
+
+    def _measure(self, client, url, iterations, memoized):
+        """Promedios por petición; sin memoria reproduce el cálculo en cada llamada"""
+        builds = 0
+        build = Document._build_structured_data
+
+        def counting_build(document):
+            nonlocal builds
+            builds += 1
+            return build(document)
+
+        patches = [mock.patch.object(Document, '_build_structured_data', counting_build)]
+        if not memoized:
+            patches.append(mock.patch.object(Document, 'get_structured_data', counting_build))
+
+        # Pasada previa sin medir: crea Vehiculo/Persona y calienta plantillas
+        for index in range(iterations):
+            client.get(url(index))
+
+        queries = cpu = wall = 0.0
+        for patch in patches:
+            patch.start()
+        try:
+            for index in range(iterations):
+                with CaptureQueriesContext(connection) as captured:
+                    cpu_start, wall_start = time.process_time(), time.perf_counter()
+                    response = client.get(url(index))
+                    if hasattr(response, 'render') and not response.is_rendered:
+                        response.render()
+                    cpu += time.process_time() - cpu_start
+                    wall += time.perf_counter() - wall_start
+                queries += len(captured.captured_queries)
+        finally:
+            for patch in patches:
+                patch.stop()
+        return {
+            'queries': queries / iterations,
+            'builds': builds / iterations,
+            'cpu': cpu / iterations,
+            'wall': wall / iterations,
+        }
+
+    def _check_history_queries(self, client, user, forms):
+        """El historial debe costar el mismo número de consultas con una fila que con la página llena"""
+        url = reverse('forms_generation:history')
+        counts = {}
+        for rows in (1, min(len(forms), 10)):
+            keep = [form.id for form in forms[:rows]]
+            # Ocultar las demás filas fuera de la ventana de 30 días del historial
+            GeneratedForm.objects.filter(user=user).exclude(id__in=keep).update(created_at='2000-01-01T00:00Z')
+            GeneratedForm.objects.filter(id__in=keep).update(created_at=timezone.now())
+            with CaptureQueriesContext(connection) as captured:
+                client.get(url)
+            counts[rows] = len(captured.captured_queries)
+
+        summary = ', '.join(f'{rows} filas: {queries} consultas' for rows, queries in counts.items())
+        if len(set(counts.values())) == 1:
+            self.stdout.write(self.style.SUCCESS(f'Historial con consultas constantes ({summary})'))
+        else:
+            self.stdout.write(self.style.WARNING(f'El historial crece con las filas ({summary})'))
+
+    @staticmethod
+    def _create_data(user, count):
+        fixture = LocalFixtureBackend().fixture
+        documents, forms = [], []
+        for index in range(count):
+            data = copy.deepcopy(fixture)
+            data['informacion_vehiculo']['placa'] = f'BSD{index:03d}'
+            data['informacion_propietario']['identificacion'] = f'C.C. 99{index:08d}'
+            document = Document(user=user, name=f'benchmark_{index}.pdf', document_type='ownership',
+                                status='completed')
+            document.file.save(f'benchmark_{index}.pdf', ContentFile(b'%PDF-1.4\n%%EOF\n'), save=False)
+            document.set_extracted_data(data)
+            documents.append(document)
+
+            form = GeneratedForm(user=user, document=document, form_type='contrato_compraventa')
+            form.generated_file.save(f'benchmark_{index}.pdf', ContentFile(b'%PDF-1.4\n%%EOF\n'), save=True)
+            forms.append(form)
+        return documents, forms
+
+    @staticmethod
+    def _cleanup(user):
+        placas, identificaciones = [], []
+        for document in Document.objects.filter(user=user).select_related('extraction'):
+            structured = document.get_structured_data()
+            placas.append(structured.get('vehiculo', {}).get('placa'))
+            identificaciones.append(structured.get('propietario', {}).get('identificacion'))
+            document.file.delete(save=False)
+        for form in GeneratedForm.objects.filter(user=user):
+            form.generated_file.delete(save=False)
+        Vehiculo.objects.filter(placa__in=placas).delete()
+        Persona.objects.filter(numero_documento__in=identificaciones).delete()
+        user.delete()
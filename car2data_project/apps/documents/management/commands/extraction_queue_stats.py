@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from services.extraction_scheduler import ExtractionScheduler
+
+
+class Command(BaseCommand):
+    help = 'Muestra la profundidad de la cola de extracción y los tiempos de espera por plan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window',
+            type=int,
+            default=3600,
+            help='Ventana en segundos para calcular la espera media de los trabajos iniciados',
+        )
+
+    def handle(self, *args, **options):
+        stats = ExtractionScheduler().queue_stats(window_seconds=options['window'])
+
+        self.stdout.write(
+            f"{'Plan':<12}{'En cola':>9}{'Aplazados':>11}{'Ejecución':>11}{'Espera máx (s)':>16}"
+            f"{'Espera media (s)':>18}{'Espera inicio (s)':>19}"
+        )
+        for plan in sorted(stats):
+            entry = stats[plan]
+            start_wait = entry['avg_start_wait_seconds']
+            self.stdout.write(
+                f"{plan:<12}{entry['queued']:>9}{entry['parked']:>11}{entry['running']:>11}"
+                f"{entry['oldest_wait_seconds']:>16.1f}{entry['avg_queued_wait_seconds']:>18.1f}"
+                f"{(f'{start_wait:.1f}' if start_wait is not None else '-'):>19}"
+            )
@@ -0,0 +1,65 @@
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from services.extraction_queue import ExtractionWorkerPool, recover_stale_jobs
+from services.pdf_extractor import get_pdf_extractor, reset_pdf_extractor
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta el pool de workers de extracción fuera del proceso web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'EXTRACTION_WORKER_CONCURRENCY', 2),
+            help='Número de workers concurrentes',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'EXTRACTION_JOB_POLL_INTERVAL', 2),
+            help='Segundos de espera entre consultas a la cola cuando está vacía',
+        )
+        parser.add_argument(
+            '--recover-all',
+            action='store_true',
+            help='Reencola todos los trabajos en ejecución al arrancar (usar solo con un único proceso de workers)',
+        )
+
+    def handle(self, *args, **options):
+        if options['recover_all']:
+            recovered = recover_stale_jobs(stale_after=0)
+            self.stdout.write(self.style.WARNING(f'Trabajos recuperados: {recovered}'))
+
+        pool = ExtractionWorkerPool(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+        )
+        stop_requested = threading.Event()
+
+        def request_stop(signum, frame):
+            stop_requested.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        # Inicializar el cliente compartido antes de aceptar trabajos
+        try:
+            get_pdf_extractor()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'No se pudo inicializar el extractor: {e}'))
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Workers de extracción en ejecución (concurrencia={options['concurrency']}). Ctrl+C para detener."
+        ))
+
+        while not stop_requested.wait(1):
+            pass
+
+        self.stdout.write('Deteniendo workers, esperando trabajos en curso...')
+        pool.stop()
+        reset_pdf_extractor()
+        self.stdout.write(self.style.SUCCESS('Workers detenidos'))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0004_alter_document_document_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractionCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model_name", models.CharField(blank=True, max_length=100)),
+                ("data", models.JSONField()),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+            ],
+            options={
+                "verbose_name": "Entrada de caché de extracción",
+                "verbose_name_plural": "Entradas de caché de extracción",
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0005_extractioncacheentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "En cola"),
+                            ("running", "En ejecución"),
+                            ("done", "Completado"),
+                            ("failed", "Fallido"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                ("priority", models.IntegerField(default=0)),
+                ("use_cache", models.BooleanField(default=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("worker", models.CharField(blank=True, max_length=100)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="extraction_jobs",
+                        to="documents.document",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Trabajo de extracción",
+                "verbose_name_plural": "Trabajos de extracción",
+                "ordering": ["-priority", "created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "-priority", "created_at"],
+                        name="extraction_job_queue_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("documents", "0006_extractionjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="extractionjob",
+            name="plan",
+            field=models.CharField(default="starter", max_length=20),
+        ),
+        migrations.AddField(
+            model_name="extractionjob",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="extraction_jobs",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="extractionjob",
+            index=models.Index(
+                fields=["status", "plan", "created_at"], name="extraction_job_plan_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0007_extractionjob_plan"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="extractionjob",
+            name="available_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
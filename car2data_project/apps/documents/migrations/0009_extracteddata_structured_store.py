@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0008_extractionjob_available_at"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="extracteddata",
+            options={
+                "verbose_name": "Datos extraídos",
+                "verbose_name_plural": "Datos extraídos",
+            },
+        ),
+        migrations.AddField(
+            model_name="extracteddata",
+            name="data",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="extracteddata",
+            name="engine_number",
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="color",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="document",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="extraction",
+                to="documents.document",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="license_plate",
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="make",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="model",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="owner_document",
+            field=models.CharField(blank=True, db_index=True, max_length=30),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="owner_phone",
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.AlterField(
+            model_name="extracteddata",
+            name="vin",
+            field=models.CharField(blank=True, db_index=True, max_length=30),
+        ),
+    ]
@@ -0,0 +1,125 @@
+import json
+import re
+
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 500
+
+# Copia congelada de services.extracted_fields al crear esta migración: sus cambios
+# posteriores no deben alterar lo que hace la migración en una base de datos nueva.
+PROMOTED_FIELDS = {
+    "license_plate": (("informacion_vehiculo", "placa"), 20),
+    "vin": (("informacion_vehiculo", "vin"), 30),
+    "engine_number": (("informacion_vehiculo", "numero_motor"), 50),
+    "make": (("informacion_vehiculo", "marca"), 100),
+    "model": (("informacion_vehiculo", "linea"), 100),
+    "color": (("informacion_vehiculo", "color"), 50),
+    "owner_name": (("informacion_propietario", "nombre"), 200),
+    "owner_document": (("informacion_propietario", "identificacion"), 30),
+    "owner_address": (("informacion_propietario", "direccion"), None),
+    "owner_phone": (("informacion_propietario", "telefono"), 30),
+}
+IDENTIFIER_FIELDS = {"license_plate", "vin", "engine_number"}
+
+
+def _value(data, path):
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return ""
+        value = value.get(key)
+    if value is None:
+        return ""
+    value = str(value).strip()
+    return "" if value == "No disponible" else value
+
+
+def promoted_fields(data):
+    """Valores de las columnas promovidas de ExtractedData a partir del JSON de extracción"""
+    values = {}
+    for column, (path, max_length) in PROMOTED_FIELDS.items():
+        value = _value(data, path)
+        if column in IDENTIFIER_FIELDS:
+            value = re.sub(r"[\s\-.]", "", value).upper()
+        elif column == "owner_document":
+            value = re.sub(r"\D", "", value) or value
+        values[column] = value[:max_length] if max_length else value
+    match = re.search(r"(19|20)\d{2}", _value(data, ("informacion_vehiculo", "modelo")))
+    values["year"] = int(match.group()) if match else None
+    return values
+
+
+def backfill_extracted_data(apps, schema_editor):
+    """
+    Copia extracted_data_json a ExtractedData por bloques de CHUNK_SIZE documentos,
+    cada bloque en su propia transacción para no bloquear la tabla completa.
+    """
+    Document = apps.get_model("documents", "Document")
+    ExtractedData = apps.get_model("documents", "ExtractedData")
+    pending = (
+        Document.objects.filter(
+            extracted_data_json__isnull=False, extraction__isnull=True
+        )
+        .exclude(extracted_data_json="")
+        .order_by("pk")
+    )
+
+    last_pk = 0
+    while True:
+        chunk = list(
+            pending.filter(pk__gt=last_pk).values_list("pk", "extracted_data_json")[
+                :CHUNK_SIZE
+            ]
+        )
+        if not chunk:
+            break
+        rows = []
+        for pk, raw in chunk:
+            try:
+                data = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                rows.append(
+                    ExtractedData(document_id=pk, data=data, **promoted_fields(data))
+                )
+        with transaction.atomic():
+            ExtractedData.objects.bulk_create(rows, ignore_conflicts=True)
+            Document.objects.filter(pk__in=[row.document_id for row in rows]).update(
+                extracted_data_json=None
+            )
+        last_pk = chunk[-1][0]
+
+
+def restore_extracted_data_json(apps, schema_editor):
+    """
+    Vuelve a escribir el JSON en el TextField y elimina las filas copiadas, para que
+    volver a aplicar la migración las reconstruya con el esquema nuevo.
+    """
+    Document = apps.get_model("documents", "Document")
+    ExtractedData = apps.get_model("documents", "ExtractedData")
+    rows = ExtractedData.objects.order_by("pk")
+
+    while True:
+        chunk = list(rows.values_list("pk", "document_id", "data")[:CHUNK_SIZE])
+        if not chunk:
+            break
+        with transaction.atomic():
+            for _, document_id, data in chunk:
+                Document.objects.filter(pk=document_id).update(
+                    extracted_data_json=json.dumps(data, ensure_ascii=False, indent=2)
+                )
+            ExtractedData.objects.filter(pk__in=[pk for pk, _, _ in chunk]).delete()
+
+
+class Migration(migrations.Migration):
+    # Cada bloque se confirma por separado (ver backfill_extracted_data)
+    atomic = False
+
+    dependencies = [
+        ("documents", "0009_extracteddata_structured_store"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_extracted_data, restore_extracted_data_json),
+    ]
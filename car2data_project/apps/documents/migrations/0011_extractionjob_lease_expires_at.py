@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0010_backfill_extracteddata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="extractionjob",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
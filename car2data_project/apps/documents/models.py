@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
 import json
+from services.extracted_fields import promoted_fields
 
 
 class Document(models.Model):
@@ -32,6 +35,11 @@ class Document(models.Model):
 
     def get_extracted_data(self):
         """Retorna los datos extraídos como diccionario"""
+        try:
+            return self.extraction.data or {}
+        except ExtractedData.DoesNotExist:
+            pass
+        # Documentos anteriores al almacenamiento estructurado
         if self.extracted_data_json:
             try:
                 return json.loads(self.extracted_data_json)
@@ -40,20 +48,53 @@ class Document(models.Model):
         return {}
 
     def set_extracted_data(self, data_dict):
-        """Guarda los datos extraídos como JSON"""
-        self.extracted_data_json = json.dumps(data_dict, ensure_ascii=False, indent=2)
+        """Guarda los datos extraídos en ExtractedData (JSON y campos indexados)"""
+        self.extracted_data_json = None
+        self.invalidate_structured_data()
         self.save()
+        # Sin update_or_create: su transacción lectura/escritura choca con los workers en SQLite
+        values = {'data': data_dict, **promoted_fields(data_dict)}
+        if ExtractedData.objects.filter(document=self).update(updated_at=timezone.now(), **values):
+            self.extraction = ExtractedData.objects.get(document=self)
+        else:
+            self.extraction = ExtractedData.objects.create(document=self, **values)
+
+    def clear_extracted_data(self):
+        """Elimina los datos extraídos (p. ej. antes de reprocesar)"""
+        ExtractedData.objects.filter(document=self).delete()
+        self.extracted_data_json = None
+        self.invalidate_structured_data()
+        if hasattr(self, '_state') and 'extraction' in self._state.fields_cache:
+            del self._state.fields_cache['extraction']
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self.invalidate_structured_data()
+
+    def invalidate_structured_data(self):
+        """Descarta los datos estructurados memorizados en esta instancia"""
+        self.__dict__.pop('structured_data', None)
+
+    @cached_property
+    def structured_data(self):
+        """
+        Datos estructurados calculados una sola vez por instancia (ver get_structured_data).
+        El diccionario es compartido: quien necesite modificarlo debe copiarlo.
+        """
+        return self._build_structured_data()
 
     def get_structured_data(self):
         """
         Retorna los datos extraídos en un formato estructurado para autodiligenciado
         """
-        if not self.extracted_data_json:
+        return self.structured_data
+
+    def _build_structured_data(self):
+        data = self.get_extracted_data()
+        if not data:
             return {}
 
         try:
-            data = json.loads(self.extracted_data_json)
-
             # Crear diccionario de información del vehículo
             info_vehiculo = {
                 'placa': self.safe_get(data, ['informacion_vehiculo', 'placa']),
@@ -106,7 +147,7 @@ class Document(models.Model):
 
             return structured
 
-        except (json.JSONDecodeError, TypeError):
+        except TypeError:
             return {}
 
     def safe_get(self, data, keys):
@@ -199,22 +240,94 @@ class Document(models.Model):
 
 
 class ExtractedData(models.Model):
-    document = models.OneToOneField(Document, on_delete=models.CASCADE)
+    """
+    Resultado de la extracción de un documento: el JSON completo y los campos
+    más consultados promovidos a columnas indexadas (ver services.extracted_fields).
+    """
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='extraction')
+    data = models.JSONField(default=dict, blank=True)
 
     # Datos del vehículo
-    license_plate = models.CharField(max_length=10, blank=True)
-    vin = models.CharField(max_length=17, blank=True)
-    make = models.CharField(max_length=50, blank=True)
-    model = models.CharField(max_length=50, blank=True)
+    license_plate = models.CharField(max_length=20, blank=True, db_index=True)
+    vin = models.CharField(max_length=30, blank=True, db_index=True)
+    engine_number = models.CharField(max_length=50, blank=True, db_index=True)
+    make = models.CharField(max_length=100, blank=True)
+    model = models.CharField(max_length=100, blank=True)
     year = models.IntegerField(null=True, blank=True)
-    color = models.CharField(max_length=30, blank=True)
+    color = models.CharField(max_length=50, blank=True)
 
     # Datos del propietario
     owner_name = models.CharField(max_length=200, blank=True)
-    owner_document = models.CharField(max_length=20, blank=True)
+    owner_document = models.CharField(max_length=30, blank=True, db_index=True)
     owner_address = models.TextField(blank=True)
-    owner_phone = models.CharField(max_length=15, blank=True)
+    owner_phone = models.CharField(max_length=30, blank=True)
     owner_email = models.EmailField(blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Datos extraídos'
+        verbose_name_plural = 'Datos extraídos'
+
+    def __str__(self):
+        return f"{self.license_plate or 'Sin placa'} - documento {self.document_id}"
+
+
+class ExtractionCacheEntry(models.Model):
+    """Resultado de extracción reutilizable, indexado por hash del PDF + prompt + modelo"""
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100, blank=True)
+    data = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Entrada de caché de extracción'
+        verbose_name_plural = 'Entradas de caché de extracción'
+
+    def __str__(self):
+        return f"{self.key[:12]}... ({self.model_name})"
+
+
+class ExtractionJob(models.Model):
+    """Trabajo de extracción persistente procesado por el pool de workers"""
+
+    STATUS_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'En ejecución'),
+        ('done', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='extraction_jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='extraction_jobs')
+    # Plan del usuario al momento de encolar (usado por el planificador)
+    plan = models.CharField(max_length=20, default='starter')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    priority = models.IntegerField(default=0)
+    use_cache = models.BooleanField(default=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Trabajos aplazados (modelo no disponible) no se reservan antes de esta fecha
+    available_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # El worker que lo ejecuta renueva la reserva; si vence, el trabajo vuelve a la cola
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='extraction_job_queue_idx'),
+            models.Index(fields=['status', 'plan', 'created_at'], name='extraction_job_plan_idx'),
+        ]
+        verbose_name = 'Trabajo de extracción'
+        verbose_name_plural = 'Trabajos de extracción'
+
+    def __str__(self):
+        return f"Job {self.id} - documento {self.document_id} ({self.status})"
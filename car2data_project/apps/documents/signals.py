@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from apps.authentication.models import UserSubscription
+from services.status_events import document_event, publish_document_status, register_status_source
+from services.user_stats import invalidate_user_stats
+from .models import Document
+
+
+@receiver(post_save, sender=Document)
+def invalidate_stats_on_document_save(sender, instance, created, update_fields=None, **kwargs):
+    """Invalida los contadores del usuario al crear un documento o cambiar su estado"""
+    if created or update_fields is None or 'status' in update_fields:
+        invalidate_user_stats(instance.user_id)
+
+
+@receiver(post_init, sender=Document)
+def remember_document_status(sender, instance, **kwargs):
+    # __dict__ y no el atributo: con only()/defer() leer status haría una consulta
+    instance._published_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Document)
+def publish_document_status_change(sender, instance, created, update_fields=None, **kwargs):
+    """Publica el estado en el canal de eventos del usuario cuando cambia (pending → processing → completed/error)"""
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if created or instance.status != instance._published_status:
+        instance._published_status = instance.status
+        publish_document_status(instance)
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_stats_on_document_delete(sender, instance, **kwargs):
+    invalidate_user_stats(instance.user_id)
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_stats_on_subscription_change(sender, instance, **kwargs):
+    invalidate_user_stats(instance.user_id)
+
+
+def document_snapshot(user, document_ids):
+    return [document_event(document) for document in Document.objects.filter(user=user, id__in=document_ids)]
+
+
+register_status_source('document', document_snapshot)
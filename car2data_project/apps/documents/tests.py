@@ -0,0 +1,418 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from services.extraction_backends import LocalFixtureBackend
+from services.extraction_scheduler import ExtractionScheduler
+from services.extraction_queue import JobLease, claim_next_job, park_job, recover_stale_jobs, renew_leases
+from services.gemini_resilience import ModelUnavailableError, NoRateLimit, RateLimiter, ResilientModelClient, TokenBucket
+from services.local_ocr import FIELD_RULES, SOURCE_MODEL, SOURCE_TEXT, parse_fields
+from services.model_health import ModelHealth
+from services.pdf_extractor import PDFExtractor
+from .models import Document, ExtractionJob
+
+
+class FakeClock:
+    """Reloj manual para las cubetas de tokens"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeModel:
+    """Modelo falso: lanza o retorna, en orden, los resultados indicados"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def generate_content(self, content, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_health(failure_threshold=3):
+    health = ModelHealth(name='fake')
+    health.failure_threshold = failure_threshold
+    health.probe_interval = 0
+    return health
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_refills_continuously_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)  # un token por segundo
+
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+
+        clock.advance(11)
+        self.assertEqual(bucket.reserve(10), 0.0)
+
+        clock.advance(3600)
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+
+    def test_refund_returns_reserved_tokens(self):
+        bucket = TokenBucket(60, clock=FakeClock())
+        bucket.reserve(60)
+        bucket.refund(30)
+        self.assertEqual(bucket.reserve(30), 0.0)
+
+    def test_rate_limiter_sleeps_or_defers(self):
+        clock = FakeClock()
+        sleeps = []
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_wait=5, clock=clock, sleep=sleeps.append)
+
+        self.assertEqual(limiter.acquire(tokens=6000), 0.0)
+        self.assertAlmostEqual(limiter.acquire(tokens=100), 1.0)
+        self.assertEqual(len(sleeps), 1)
+
+        # Una espera mayor que max_wait no consume cuota: el trabajo se aplaza
+        with self.assertRaises(ModelUnavailableError) as raised:
+            limiter.acquire(tokens=1000)
+        self.assertAlmostEqual(raised.exception.retry_after, 11.0)
+        clock.advance(1)
+        self.assertEqual(limiter.acquire(tokens=0), 0.0)
+
+
+class ResilientModelClientTests(SimpleTestCase):
+    def make_client(self, model, health=None, max_retries=3):
+        self.sleeps = []
+        return ResilientModelClient(
+            model,
+            health=health or make_health(failure_threshold=100),
+            limiter=NoRateLimit(),
+            max_retries=max_retries,
+            base_delay=1.0,
+            max_delay=8.0,
+            sleep=self.sleeps.append,
+        )
+
+    def test_429_is_retried_with_backoff_within_jitter_bounds(self):
+        random.seed(6)
+        quota = google_exceptions.ResourceExhausted('429 cuota agotada')
+        model = FakeModel(quota, quota, quota, 'respuesta')
+        client = self.make_client(model)
+
+        self.assertEqual(client.generate_content('hola'), 'respuesta')
+        self.assertEqual(model.calls, 4)
+        self.assertEqual(len(self.sleeps), 3)
+        for attempt, delay in enumerate(self.sleeps):
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(8.0, 1.0 * 2 ** attempt))
+
+    def test_backoff_is_capped_at_max_delay(self):
+        client = self.make_client(FakeModel())
+        delays = [client.backoff_delay(10) for _ in range(200)]
+        self.assertTrue(all(0.0 <= delay <= 8.0 for delay in delays))
+        self.assertGreater(max(delays), 4.0)
+
+    def test_retry_exhaustion_raises_model_unavailable(self):
+        quota = google_exceptions.ResourceExhausted('429 cuota agotada')
+        model = FakeModel(quota, quota, quota)
+        client = self.make_client(model, max_retries=2)
+
+        with self.assertRaises(ModelUnavailableError) as raised:
+            client.generate_content('hola')
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertEqual(raised.exception.retry_after, 8.0)
+
+    def test_non_retryable_errors_are_raised_without_retry(self):
+        health = make_health(failure_threshold=1)
+        model = FakeModel(ValueError('PDF inválido'))
+        client = self.make_client(model, health=health)
+
+        with self.assertRaises(ValueError):
+            client.generate_content('hola')
+        self.assertEqual(self.sleeps, [])
+        self.assertTrue(health.is_available())
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_breaker_opens_probes_half_open_and_closes(self):
+        health = make_health(failure_threshold=2)
+        unavailable = google_exceptions.ServiceUnavailable('503')
+        model = FakeModel(unavailable, unavailable, 'respuesta')
+        client = ResilientModelClient(
+            model, health=health, limiter=NoRateLimit(), max_retries=5, base_delay=0, sleep=lambda _: None
+        )
+
+        # Abierto tras dos fallos seguidos: la llamada se aplaza sin llegar al modelo
+        with self.assertRaises(ModelUnavailableError):
+            client.generate_content('hola')
+        self.assertEqual(health.state, ModelHealth.OPEN)
+        self.assertEqual(model.calls, 2)
+        with self.assertRaises(ModelUnavailableError):
+            client.generate_content('hola')
+        self.assertEqual(model.calls, 2)
+
+        # Semiabierto: solo la prueba ligera llega al servicio; si falla sigue abierto
+        probes = [False, True]
+        health.probe = lambda: probes.pop(0)
+        health._probe_loop()
+        self.assertEqual(probes, [])
+        self.assertEqual(health.state, ModelHealth.CLOSED)
+
+        # Cerrado: las llamadas vuelven al modelo
+        self.assertEqual(client.generate_content('hola'), 'respuesta')
+        self.assertEqual(health.snapshot()['consecutive_failures'], 0)
+
+    @override_settings(MODEL_HEALTH_WINDOW=4)
+    def test_breaker_opens_on_failure_ratio(self):
+        health = make_health(failure_threshold=100)
+        for success in (True, False, True, False):
+            if success:
+                health.record_success()
+            else:
+                health.record_failure('error')
+        self.assertEqual(health.state, ModelHealth.OPEN)
+
+
+class StatusEventsWsgiTests(TestCase):
+    """Bajo WSGI el canal responde el estado actual y el navegador reconecta sin adelantar el sondeo"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='eventos', password='x')
+        self.client.force_login(self.user)
+        self.document = Document.objects.create(
+            user=self.user, name='eventos.pdf', file='documents/eventos.pdf', status='processing'
+        )
+
+    @override_settings(STATUS_EVENTS_RETRY_MS=500, STATUS_EVENTS_WSGI_RETRY_MS=3000)
+    def test_snapshot_uses_wsgi_retry(self):
+        response = self.client.get(reverse('documents:events'), {'documents': self.document.id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.content.decode()
+        self.assertTrue(content.startswith('retry: 3000\n\n'))
+        self.assertIn('event: document', content)
+        self.assertIn('"status": "processing"', content)
+
+
+class LocalOcrTests(SimpleTestCase):
+    def test_parse_fields_accepts_values_matching_their_pattern(self):
+        text = (
+            "PLACA: abc 123   MARCA: Chevrolet\n"
+            "Línea SAIL  MODELO 2015\n"
+            "Servicio: Particular\n"
+            "Chasis 9GAJM52A0FB012345\n"
+            "Identificación C.C. 1020304050\n"
+            "COLOR: 12\n"
+        )
+        fields = parse_fields(text)
+
+        self.assertEqual(fields['informacion_vehiculo.placa'], 'ABC123')
+        self.assertEqual(fields['informacion_vehiculo.marca'], 'CHEVROLET')
+        self.assertEqual(fields['informacion_vehiculo.linea'], 'SAIL')
+        self.assertEqual(fields['informacion_vehiculo.modelo'], '2015')
+        self.assertEqual(fields['informacion_vehiculo.servicio'], 'PARTICULAR')
+        self.assertEqual(fields['informacion_propietario.identificacion'], 'C.C. 1020304050')
+        # El VIN se reconoce por su formato aunque esté junto a otra etiqueta
+        self.assertEqual(fields['informacion_vehiculo.vin'], '9GAJM52A0FB012345')
+        # Un valor que no cumple el patrón se deja al modelo
+        self.assertNotIn('informacion_vehiculo.color', fields)
+
+    def test_parse_fields_ignores_empty_and_ambiguous_text(self):
+        self.assertEqual(parse_fields(''), {})
+        self.assertEqual(parse_fields('PLACA:\nMODELO: 1890'), {})
+
+
+@override_settings(EXTRACTION_PREPROCESS_ENABLED=False)
+class TieredExtractionTests(SimpleTestCase):
+    """Gemini se omite solo si los niveles locales llenan toda la estructura"""
+
+    def setUp(self):
+        self.extractor = PDFExtractor(backend=LocalFixtureBackend())
+        self.model_data = self.extractor.create_default_structure()
+        self.model_data['detalles_registro']['organismo_transito'] = 'STRIA TTEyTTE MEDELLIN'
+        self.model_data['informacion_vehiculo']['placa'] = 'XYZ999'
+
+    def extract(self, local_fields):
+        sources = {field: SOURCE_TEXT for field in local_fields}
+        with mock.patch('services.pdf_extractor.extract_local_fields', return_value=(dict(local_fields), sources)), \
+                mock.patch.object(self.extractor, '_analyze_with_vision', return_value=self.model_data) as vision:
+            return self.extractor.extract_vehicle_info('tarjeta.pdf'), vision
+
+    def test_model_fills_fields_without_local_rule(self):
+        local_fields = {field: 'LOCAL' for field in FIELD_RULES}
+        local_fields['informacion_vehiculo.placa'] = 'ABC123'
+        data, vision = self.extract(local_fields)
+
+        vision.assert_called_once()
+        self.assertEqual(data['detalles_registro']['organismo_transito'], 'STRIA TTEyTTE MEDELLIN')
+        self.assertEqual(data['fuentes_campos']['detalles_registro.organismo_transito'], SOURCE_MODEL)
+        # Los valores locales tienen prioridad sobre los del modelo
+        self.assertEqual(data['informacion_vehiculo']['placa'], 'ABC123')
+        self.assertEqual(data['fuentes_campos']['informacion_vehiculo.placa'], SOURCE_TEXT)
+
+    def test_model_is_skipped_when_every_field_is_local(self):
+        data, vision = self.extract({field: 'LOCAL' for field in self.extractor.schema_fields()})
+
+        vision.assert_not_called()
+        self.assertEqual(data['detalles_registro']['organismo_transito'], 'LOCAL')
+        self.assertEqual(set(data['fuentes_campos'].values()), {SOURCE_TEXT})
+
+
+@override_settings(EXTRACTION_JOB_LEASE_SECONDS=90, EXTRACTION_WORKERS_IN_PROCESS=False)
+class ExtractionQueueTests(TestCase):
+    """Reserva, aplazamiento y recuperación de trabajos de la cola de extracción"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cola', password='x')
+
+    def create_job(self, status='queued', worker='', started_ago=None, lease_in=None):
+        document = Document.objects.create(
+            user=self.user, name='cola.pdf', file='documents/cola.pdf', status='pending'
+        )
+        now = timezone.now()
+        return ExtractionJob.objects.create(
+            document=document,
+            user=self.user,
+            status=status,
+            worker=worker,
+            started_at=now - timedelta(seconds=started_ago) if started_ago is not None else None,
+            lease_expires_at=now + timedelta(seconds=lease_in) if lease_in is not None else None,
+        )
+
+    def test_claim_takes_a_lease_and_park_returns_the_job_later(self):
+        job = self.create_job()
+
+        claimed = claim_next_job('otro-host:1:0')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual((claimed.status, claimed.worker, claimed.attempts), ('running', 'otro-host:1:0', 1))
+        self.assertGreater(claimed.lease_expires_at, timezone.now() + timedelta(seconds=80))
+        self.assertIsNone(claim_next_job('otro-host:1:1'))
+
+        park_job(claimed, retry_after=30, error='503')
+        claimed.refresh_from_db()
+        self.assertEqual((claimed.status, claimed.worker, claimed.lease_expires_at), ('queued', '', None))
+        # Aplazado: no se reserva antes de available_at
+        self.assertIsNone(claim_next_job('otro-host:1:0'))
+        ExtractionJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        self.assertEqual(claim_next_job('otro-host:1:0').attempts, 2)
+
+    def test_recovery_requeues_only_expired_or_dead_workers(self):
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+
+        # En curso en otro host hace mucho, p. ej. esperando reintentos, pero con la reserva vigente
+        renewed = self.create_job('running', 'otro-host:1:0', started_ago=3600, lease_in=60)
+        expired = self.create_job('running', 'otro-host:2:0', started_ago=120, lease_in=-1)
+        dead = self.create_job('running', f'{socket.gethostname()}:{finished.pid}:0', started_ago=5, lease_in=60)
+        live = self.create_job('running', f'{socket.gethostname()}:{os.getpid()}:0', started_ago=5, lease_in=60)
+        legacy = self.create_job('running', 'otro-host:3:0', started_ago=3600)
+
+        recover_stale_jobs(stale_after=600)
+
+        statuses = dict(ExtractionJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[renewed.id], 'running')
+        self.assertEqual(statuses[live.id], 'running')
+        for job in (expired, dead, legacy):
+            self.assertEqual(statuses[job.id], 'queued')
+
+    def test_running_worker_renews_its_lease(self):
+        job = self.create_job('running', 'otro-host:1:0', started_ago=120, lease_in=1)
+        other = self.create_job('running', 'otro-host:2:0', started_ago=120, lease_in=1)
+
+        self.assertEqual(renew_leases([job.id, other.id], 'otro-host:1:0'), 1)
+        job.refresh_from_db()
+        other.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=80))
+        self.assertLess(other.lease_expires_at, timezone.now() + timedelta(seconds=2))
+
+    def test_lease_renews_while_the_batch_runs(self):
+        renewals = []
+        with mock.patch('services.extraction_queue.renew_leases', side_effect=lambda *args: renewals.append(args)):
+            with JobLease([mock.Mock(id=7)], 'otro-host:1:0', lease_seconds=0.15):
+                for _ in range(100):
+                    if len(renewals) >= 2:
+                        break
+                    time.sleep(0.01)
+        self.assertGreaterEqual(len(renewals), 2)
+        self.assertEqual(renewals[0], ([7], 'otro-host:1:0', 0.15))
+
+
+@override_settings(
+    EXTRACTION_AGING_SECONDS=60,
+    EXTRACTION_MAX_WAIT_SECONDS=900,
+    EXTRACTION_MAX_RUNNING_PER_USER=2,
+    EXTRACTION_FAIRNESS_PENALTY=1.0,
+)
+class ExtractionSchedulerTests(TestCase):
+    """Puntuación por plan y antigüedad, trabajos vencidos y límite por usuario"""
+
+    def setUp(self):
+        self.scheduler = ExtractionScheduler()
+        self.now = timezone.now()
+
+    def make_job(self, plan='starter', priority=0, waited=0):
+        return ExtractionJob(plan=plan, priority=priority, created_at=self.now - timedelta(seconds=waited))
+
+    def test_score_combines_plan_priority_aging_and_running_penalty(self):
+        score, waited = self.scheduler.score(self.make_job('enterprise', priority=1, waited=120), self.now)
+        self.assertEqual(waited, 120)
+        self.assertAlmostEqual(score, 3 + 1 + 2)
+        self.assertAlmostEqual(self.scheduler.score(self.make_job('pro'), self.now, running_for_user=1)[0], 1)
+        # Un plan desconocido pesa como starter
+        self.assertAlmostEqual(self.scheduler.score(self.make_job('otro'), self.now)[0], 1)
+
+    def test_aging_lets_free_jobs_overtake_new_paid_jobs(self):
+        old_starter = self.scheduler.score(self.make_job('starter', waited=181), self.now)[0]
+        new_enterprise = self.scheduler.score(self.make_job('enterprise'), self.now)[0]
+        self.assertGreater(old_starter, new_enterprise)
+
+    def test_overdue_job_scores_infinity(self):
+        score, _ = self.scheduler.score(self.make_job('starter', waited=900), self.now, running_for_user=5)
+        self.assertEqual(score, float('inf'))
+
+    def create_queued(self, user, plan='starter', waited=0, status='queued', priority=0):
+        document = Document.objects.create(user=user, name='plan.pdf', file='documents/plan.pdf', status='pending')
+        job = ExtractionJob.objects.create(document=document, user=user, plan=plan, status=status, priority=priority)
+        ExtractionJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(seconds=waited))
+        return job
+
+    def test_candidates_respect_the_running_cap_per_user(self):
+        busy = User.objects.create_user(username='ocupado', password='x')
+        idle = User.objects.create_user(username='libre', password='x')
+        self.create_queued(busy, status='running')
+        self.create_queued(busy, status='running')
+        busy_job = self.create_queued(busy, plan='enterprise', waited=60)
+        idle_job = self.create_queued(idle, plan='starter')
+
+        self.assertEqual([job.id for job in self.scheduler.ordered_candidates()], [idle_job.id])
+        # Al completar un lote del mismo usuario, su límite no aplica
+        self.assertEqual(
+            [job.id for job in self.scheduler.ordered_candidates(exempt_user_id=busy.id)],
+            [busy_job.id, idle_job.id],
+        )
+
+    def test_overdue_job_goes_first_even_past_the_candidate_window(self):
+        user = User.objects.create_user(username='lote', password='x')
+        self.scheduler.candidates_per_user = 2
+        # Con prioridad mayor, los tres ocupan la ventana de candidatos del usuario
+        for _ in range(3):
+            self.create_queued(user, plan='enterprise', waited=10, priority=1)
+        overdue = self.create_queued(user, plan='starter', waited=1000)
+
+        candidates = self.scheduler.ordered_candidates()
+        self.assertEqual(candidates[0].id, overdue.id)
+        self.assertEqual(len(candidates), 3)
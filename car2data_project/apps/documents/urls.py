@@ -11,4 +11,6 @@ urlpatterns = [
     path('process/<int:pk>/', views.ProcessDocumentView.as_view(), name='process'),
     path('reprocess/<int:pk>/', views.reprocess_document, name='reprocess'),
     path('status/<int:pk>/', views.document_status, name='status'),
+    path('events/', views.status_events, name='events'),
+    path('queue/stats/', views.extraction_queue_stats, name='queue_stats'),
 ]
\ No newline at end of file
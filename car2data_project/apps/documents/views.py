@@ -1,18 +1,28 @@
-import os
-import threading
-import traceback
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView, CreateView, ListView
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
+from django.conf import settings
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from .models import Document, ExtractedData
 from .forms import DocumentUploadForm
-from services.pdf_extractor import PDFExtractor
+from services.document_processing import process_document
+from services.extraction_queue import enqueue_extraction
+from services.extraction_scheduler import ExtractionScheduler
+from services.model_health import get_model_health
+from services.extraction_backends import get_backend_class
+from services.pdf_preprocessor import PDFPreprocessor
+from services.status_events import (FINAL_STATUSES, document_status_data, format_sse, get_status_broker,
+                                    status_snapshot, user_channel)
+from services.user_stats import get_user_stats
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,28 +37,8 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         # Documentos recientes (últimos 5)
         context['recent_documents'] = user_documents.order_by('-uploaded_at')[:5]
         
-        # Contadores
-        context['total_documents'] = user_documents.count()
-        context['processed_documents'] = user_documents.filter(status='completed').count()
-        context['processing_documents'] = user_documents.filter(status__in=['pending', 'processing']).count()
-        
-        # INFORMACIÓN DE SUSCRIPCIÓN
-        try:
-            subscription = self.request.user.subscription
-            context['subscription'] = subscription
-            context['documents_used'] = subscription.documents_used
-            context['documents_limit'] = subscription.get_documents_limit()
-            context['documents_remaining'] = subscription.get_remaining_documents()
-            context['can_upload'] = subscription.can_generate_document()
-            context['plan_name'] = subscription.get_plan_display()
-        except:
-            # Si no tiene suscripción, valores por defecto
-            context['subscription'] = None
-            context['documents_used'] = 0
-            context['documents_limit'] = 3
-            context['documents_remaining'] = 3
-            context['can_upload'] = True
-            context['plan_name'] = 'Starter'
+        # Contadores por estado e información de suscripción (una consulta agrupada, cacheada)
+        context.update(get_user_stats(self.request.user))
         
         return context
 
@@ -78,15 +68,10 @@ class DocumentUploadView(LoginRequiredMixin, CreateView):
         form.instance.user = self.request.user
         response = super().form_valid(form)
         
-        # Iniciar procesamiento en segundo plano
+        # Encolar el procesamiento para el pool de workers
         if self.object.file:
-            logger.info(f"Iniciando procesamiento para documento {self.object.id}")
-            thread = threading.Thread(
-                target=self.process_document_background,
-                args=(self.object.id,)
-            )
-            thread.daemon = True
-            thread.start()
+            logger.info(f"Encolando procesamiento para documento {self.object.id}")
+            enqueue_extraction(self.object)
         
         remaining = subscription.get_remaining_documents() - 1  # -1 porque estamos procesando uno ahora
         messages.success(
@@ -95,95 +80,12 @@ class DocumentUploadView(LoginRequiredMixin, CreateView):
         )
         return response
     
-    def process_document_background(self, document_id):
-        """Procesa el documento en segundo plano"""
-        document = None
-        try:
-            logger.info(f"Iniciando procesamiento en segundo plano para documento {document_id}")
-            
-            document = Document.objects.get(id=document_id)
-            document.status = 'processing'
-            document.save()
-            
-            logger.info(f"Documento marcado como 'processing': {document.name}")
-            
-            # Verificar que el archivo existe
-            if not document.file or not os.path.exists(document.file.path):
-                raise FileNotFoundError(f"No se pudo encontrar el archivo: {document.file.path if document.file else 'No especificado'}")
-            
-            # Obtener la ruta del archivo
-            pdf_path = document.file.path
-            logger.info(f"Ruta del PDF: {pdf_path}")
-            
-            # Crear extractor y probar conexión
-            extractor = PDFExtractor()
-            
-            # Probar conexión antes de procesar
-            if not extractor.test_connection():
-                raise Exception("No se pudo conectar con el servicio de inteligencia artificial. Por favor, verifica tu conexión a internet e inténtalo de nuevo.")
-            
-            logger.info("Conexión con Gemini establecida correctamente")
-            
-            # Extraer información usando Gemini con timeout
-            try:
-                extracted_data = extractor.extract_vehicle_info(pdf_path)
-                logger.info(f"Datos extraídos: {extracted_data}")
-                
-                # Guardar los datos extraídos
-                document.set_extracted_data(extracted_data)
-                
-                # Actualizar el tipo de documento si se identificó
-                if extracted_data.get('tipo_documento') and extracted_data.get('tipo_documento') != 'No identificado':
-                    doc_type = extracted_data.get('tipo_documento', '').lower()
-                    doc_type_mapping = {
-                        'matrícula': 'registration',
-                        'matricula': 'registration',
-                        'registro': 'registration',
-                        'propiedad': 'ownership',
-                        'tarjeta': 'ownership'
-                    }
-                    
-                    for key, value in doc_type_mapping.items():
-                        if key in doc_type:
-                            document.document_type = value
-                            break
-                
-                document.status = 'completed'
-                document.processed_at = timezone.now()
-                document.error_message = ''
-                logger.info(f"Documento procesado exitosamente: {document.name}")
-                
-                # INCREMENTAR CONTADOR DE DOCUMENTOS USADOS
-                try:
-                    subscription = document.user.subscription
-                    subscription.increment_documents()
-                    logger.info(f"Contador incrementado. Documentos usados: {subscription.documents_used}/{subscription.get_documents_limit()}")
-                except Exception as e:
-                    logger.error(f"Error al actualizar el contador de documentos: {str(e)}")
-                
-            except Exception as e:
-                logger.error(f"Error durante el procesamiento del documento: {str(e)}")
-                logger.error(traceback.format_exc())
-                document.status = 'error'
-                document.error_message = f"Error al procesar el documento: {str(e)}"
-            
-            document.save()
-            
-        except FileNotFoundError as e:
-            logger.error(f"Error: Archivo no encontrado - {str(e)}")
-            if document:
-                document.status = 'error'
-                document.error_message = f"No se pudo encontrar el archivo: {str(e)}"
-                document.save()
-        except Exception as e:
-            logger.error(f"Error al procesar el documento: {str(e)}")
-            logger.error(traceback.format_exc())
-            
-            if document:
-                document.status = 'error'
-                document.error_message = f"Ocurrió un error inesperado: {str(e)}"
-                document.save()
-                logger.info(f"Documento {document_id} marcado como error")
+    def process_document_background(self, document_id, use_cache=True):
+        """
+        Procesa el documento de forma síncrona.
+        Se conserva por compatibilidad; el flujo normal pasa por la cola de extracción.
+        """
+        return process_document(document_id, use_cache=use_cache)
 
 class DataPreviewView(LoginRequiredMixin, TemplateView):
     template_name = 'documents/data_preview.html'
@@ -233,19 +135,14 @@ def reprocess_document(request, pk):
         logger.info(f"Reprocessing document {pk}")
         
         # Reiniciar estado
-        document.status = 'processing'
+        document.status = 'pending'
         document.extraction_error = None
-        document.extracted_data_json = None
+        document.clear_extracted_data()
         document.save()
         
-        # Procesar en segundo plano
-        upload_view = DocumentUploadView()
-        thread = threading.Thread(
-            target=upload_view.process_document_background,
-            args=(document.id,)
-        )
-        thread.daemon = True
-        thread.start()
+        # Encolar el reprocesamiento; por defecto se ignora la caché para forzar una nueva extracción
+        use_cache = request.POST.get('use_cache') == '1'
+        enqueue_extraction(document, use_cache=use_cache)
         
         return JsonResponse({'status': 'success', 'message': 'Reprocesamiento iniciado'})
     except Exception as e:
@@ -257,11 +154,102 @@ def document_status(request, pk):
     """Obtiene el estado actual de un documento"""
     try:
         document = get_object_or_404(Document, id=pk, user=request.user)
-        return JsonResponse({
-            'status': document.status,
-            'processed_at': document.processed_at.isoformat() if document.processed_at else None,
-            'error': document.extraction_error
-        })
+        return JsonResponse(document_status_data(document))
     except Exception as e:
         logger.error(f"Error en document_status: {str(e)}")
-        return JsonResponse({'status': 'error', 'message': str(e)})
\ No newline at end of file
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+def _parse_ids(value):
+    return {int(item) for item in (value or '').split(',') if item.strip().isdigit()}
+
+
+def _status_snapshot(user, document_ids, job_ids):
+    """Estado actual de los documentos y trabajos de generación pedidos, como eventos"""
+    return status_snapshot(user, {'document': document_ids, 'form_job': job_ids})
+
+
+def _is_watched(event, document_ids, job_ids):
+    if not document_ids and not job_ids:
+        return True
+    watched = document_ids if event['type'] == 'document' else job_ids
+    return event['id'] in watched
+
+
+async def _status_event_stream(user, document_ids, job_ids, retry):
+    """
+    Emite el estado actual y luego cada cambio publicado para el usuario. Se suscribe
+    antes de leer el estado para no perder una transición entre ambos pasos. Termina al
+    llegar todo lo observado a un estado final o tras STATUS_EVENTS_STREAM_SECONDS (el
+    navegador reconecta solo); entre eventos envía comentarios para mantener viva la
+    conexión a través de proxies.
+    """
+    heartbeat = getattr(settings, 'STATUS_EVENTS_HEARTBEAT_SECONDS', 15)
+    stream_seconds = getattr(settings, 'STATUS_EVENTS_STREAM_SECONDS', 300)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + stream_seconds
+
+    subscription = await get_status_broker().subscribe(user_channel(user.id))
+    try:
+        yield f"retry: {retry}\n\n"
+        pending = set()
+        for event in await sync_to_async(_status_snapshot)(user, document_ids, job_ids):
+            yield format_sse(event)
+            if event['status'] not in FINAL_STATUSES:
+                pending.add((event['type'], event['id']))
+        if (document_ids or job_ids) and not pending:
+            return
+
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(timeout=min(heartbeat, remaining))
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            if not _is_watched(event, document_ids, job_ids):
+                continue
+            yield format_sse(event)
+            if event['status'] in FINAL_STATUSES:
+                pending.discard((event['type'], event['id']))
+                if (document_ids or job_ids) and not pending:
+                    return
+    finally:
+        await subscription.close()
+
+
+async def status_events(request):
+    """
+    Canal server-sent events con los cambios de estado de los documentos y trabajos de
+    generación del usuario. ?documents=1,2&jobs=3 limita el canal a esos ids. Servido
+    por ASGI mantiene la conexión abierta y envía cada transición al publicarse; bajo
+    WSGI responde solo el estado actual y el navegador reconecta tras
+    STATUS_EVENTS_WSGI_RETRY_MS, con la misma carga que el sondeo al que reemplaza.
+    """
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Autenticación requerida'}, status=401)
+
+    document_ids = _parse_ids(request.GET.get('documents'))
+    job_ids = _parse_ids(request.GET.get('jobs'))
+    if not isinstance(request, ASGIRequest):
+        retry = getattr(settings, 'STATUS_EVENTS_WSGI_RETRY_MS', 3000)
+        events = await sync_to_async(_status_snapshot)(user, document_ids, job_ids)
+        content = f"retry: {retry}\n\n" + ''.join(format_sse(event) for event in events)
+        response = HttpResponse(content, content_type='text/event-stream')
+    else:
+        retry = getattr(settings, 'STATUS_EVENTS_RETRY_MS', 2000)
+        response = StreamingHttpResponse(
+            _status_event_stream(user, document_ids, job_ids, retry), content_type='text/event-stream'
+        )
+        # Sin buffering en nginx para que cada evento llegue al publicarse
+        response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@staff_member_required
+def extraction_queue_stats(request):
+    """Estadísticas de la cola de extracción por plan y estado del modelo (solo staff)"""
+    return JsonResponse({
+        'plans': ExtractionScheduler().queue_stats(),
+        'model_health': get_model_health(get_backend_class().name).snapshot(),
+        'preprocessing': PDFPreprocessor.stats(),
+    })
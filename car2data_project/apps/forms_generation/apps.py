@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class FormsGenerationConfig(AppConfig):
+    name = 'apps.forms_generation'
+    label = 'forms_generation'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -360,6 +360,72 @@ class FormularioTramiteForm(forms.ModelForm):
             'fecha_tramite': forms.DateInput(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-lg', 'type': 'date'}),
         }
 
+class TransferPackageForm(ContratoCompraventaForm):
+    """
+    Datos comunes del paquete de traspaso: los de la compraventa más el mandatario
+    opcional, los trámites autorizados y el organismo de tránsito. No se guarda: con él se
+    generan la compraventa, el mandato y el formulario de trámite.
+    """
+    tiene_mandatario = ContratoMandatoForm.base_fields['tiene_mandatario']
+    mandatario_nombre = ContratoMandatoForm.base_fields['mandatario_nombre']
+    mandatario_documento = ContratoMandatoForm.base_fields['mandatario_documento']
+    mandatario_direccion = ContratoMandatoForm.base_fields['mandatario_direccion']
+    mandatario_telefono = ContratoMandatoForm.base_fields['mandatario_telefono']
+    mandatario_ciudad = ContratoMandatoForm.base_fields['mandatario_ciudad']
+    tramites_autorizados = forms.CharField(
+        required=False,
+        initial='TRASPASO',
+        label="Trámites autorizados",
+        widget=forms.Textarea(attrs={
+            'class': 'w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-turquoise focus:border-turquoise',
+            'rows': 2,
+            'placeholder': 'Describa los trámites autorizados'
+        })
+    )
+    organismo_transito = forms.CharField(
+        max_length=100,
+        required=False,
+        label="Organismo de tránsito",
+        widget=forms.TextInput(attrs={
+            'class': 'w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-turquoise focus:border-turquoise',
+            'placeholder': 'Organismo de tránsito'
+        })
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # La plantilla de compraventa no se puede rellenar sin valor de venta
+        self.fields['valor_venta'].required = True
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('tiene_mandatario'):
+            for field_name in ('mandatario_nombre', 'mandatario_documento'):
+                if not (cleaned_data.get(field_name) or '').strip():
+                    self.add_error(field_name, 'Este campo es obligatorio.')
+        return cleaned_data
+
+    def person(self, prefix):
+        """Datos de la persona con el prefijo dado (vendedor, comprador o mandatario)"""
+        return {
+            field: self.cleaned_data.get(f'{prefix}_{field}', '')
+            for field in ('nombre', 'documento', 'direccion', 'telefono', 'ciudad')
+        }
+
+    def package_data(self):
+        """Datos comunes de la venta para services.transfer_package"""
+        return {
+            'vendedor': self.person('vendedor'),
+            'comprador': self.person('comprador'),
+            'mandatario': self.person('mandatario') if self.cleaned_data.get('tiene_mandatario') else None,
+            'valor_venta': self.cleaned_data.get('valor_venta'),
+            'forma_pago': self.cleaned_data.get('forma_pago', ''),
+            'ciudad_contrato': self.cleaned_data.get('ciudad_contrato', ''),
+            'fecha_contrato': self.cleaned_data.get('fecha_contrato'),
+            'organismo_transito': self.cleaned_data.get('organismo_transito', ''),
+            'tramites_autorizados': self.cleaned_data.get('tramites_autorizados', ''),
+        }
+
 class DocumentSelectionForm(forms.Form):
     FORM_TYPE_CHOICES = [
         ('', 'Seleccionar tipo de documento'),
@@ -0,0 +1 @@
+# Este archivo es necesario para que Django reconozca este directorio como un paquete Python
@@ -0,0 +1,134 @@
+import io
+import os
+import time
+import logging
+import tempfile
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from pypdf import PdfReader, PdfWriter
+from services.PdfFormFiller import PDFFormFiller
+from services.pdf_templates import get_template_registry
+
+FORM_TYPES = ('contrato_compraventa', 'contrato_mandato', 'formulario_tramite')
+ENGINES = ('merge', 'xobject', 'incremental')
+
+PERSONA = {'nombre': 'PEREZ GOMEZ JUAN CARLOS', 'documento': '1020304050', 'tipo_documento': 'CC',
+           'ciudad': 'MEDELLIN', 'direccion': 'CALLE 10 # 20-30', 'telefono': '3001234567'}
+VEHICULO = {'placa': 'ABC123', 'marca': 'CHEVROLET', 'linea': 'SAIL', 'modelo': '2019', 'color': 'BLANCO GALAXIA',
+            'vin': '9GASA52M8KB012345', 'numero_motor': 'LCU190512345', 'numero_chasis': '9GASA52M8KB012345',
+            'numero_serie': '9GASA52M8KB012345', 'cilindrada_cc': '1399', 'clase_vehiculo': 'AUTOMOVIL',
+            'tipo_carroceria': 'SEDAN', 'combustible': 'GASOLINA', 'servicio': 'PARTICULAR'}
+
+
+def sample_payload(form_type):
+    """Datos completos de ejemplo para cada tipo de formulario"""
+    if form_type == 'contrato_compraventa':
+        return {
+            'vehiculo': VEHICULO,
+            'vendedor': PERSONA,
+            'comprador': dict(PERSONA, nombre='RAMIREZ LOPEZ ANA MARIA', documento='9080706050'),
+            'valor_venta': 35000000,
+            'forma_pago': 'CONTADO',
+            'ciudad_contrato': 'MEDELLIN',
+            'fecha_contrato': '2025-01-15',
+            'organismo_transito': 'SECRETARIA DE MOVILIDAD DE MEDELLIN',
+        }
+    if form_type == 'contrato_mandato':
+        return {
+            'vehiculo': VEHICULO,
+            'placa': VEHICULO['placa'],
+            'mandante': PERSONA,
+            'mandatario': dict(PERSONA, nombre='RAMIREZ LOPEZ ANA MARIA', documento='9080706050'),
+            'tramites_autorizados': 'TRASPASO',
+            'organismo_transito': 'SECRETARIA DE MOVILIDAD DE MEDELLIN',
+            'ciudad_contrato': 'MEDELLIN',
+            'fecha_contrato': '2025-01-15',
+        }
+    return dict(
+        VEHICULO,
+        propietario_primer_apellido='PEREZ',
+        propietario_segundo_apellido='GOMEZ',
+        propietario_nombres='JUAN CARLOS',
+        propietario_documento='1020304050',
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara formularios por segundo y tamaño de salida de los motores de rellenado '
+        "'merge', 'xobject' e 'incremental' (PDF_FILL_ENGINE) para los tres tipos de formulario "
+        'y valida con pypdf la salida incremental'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Formularios por tipo y motor')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        logging.disable(logging.CRITICAL)
+        try:
+            filler = PDFFormFiller()
+            with tempfile.TemporaryDirectory() as directory:
+                self.stdout.write(f'Iteraciones por tipo y motor: {iterations}')
+                for form_type in FORM_TYPES:
+                    payload = sample_payload(form_type)
+                    texts = {}
+                    for engine in ENGINES:
+                        output_path = os.path.join(directory, f'{form_type}_{engine}.pdf')
+                        with override_settings(PDF_FILL_ENGINE=engine):
+                            # Primera llamada sin medir: carga la plantilla y, en 'xobject', precalcula el XObject
+                            if not filler.fill_pdf_form(form_type, payload, output_path):
+                                self.stdout.write(self.style.ERROR(f'{form_type} ({engine}): error al generar'))
+                                break
+                            start = time.perf_counter()
+                            for _ in range(iterations):
+                                filler.fill_pdf_form(form_type, payload, output_path)
+                            elapsed = time.perf_counter() - start
+                        # Sin espacios: cada motor anida el overlay distinto y pypdf separa las líneas distinto
+                        text = ''.join(page.extract_text() for page in PdfReader(output_path).pages)
+                        texts[engine] = ''.join(text.split())
+                        self.stdout.write(
+                            f'{form_type:<22} {engine:<11} {iterations / elapsed:7.1f} form/s  '
+                            f'{elapsed / iterations * 1000:7.1f} ms/form  {os.path.getsize(output_path) / 1024:7.1f} KB'
+                        )
+                        if engine == 'incremental':
+                            self._check_incremental(form_type, filler, output_path)
+                    if len(texts) == len(ENGINES):
+                        same = len(set(texts.values())) == 1
+                        style = self.style.SUCCESS if same else self.style.WARNING
+                        self.stdout.write(style(f"  texto extraído {'idéntico' if same else 'distinto'} entre motores"))
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _check_incremental(self, form_type, filler, output_path):
+        """
+        Ida y vuelta con pypdf en modo estricto: la salida conserva intactos los bytes de
+        la plantilla como prefijo, tiene sus mismas páginas y se puede reescribir y releer.
+        """
+        template = get_template_registry().load(filler.get_template_path(form_type))
+        with open(output_path, 'rb') as file:
+            data = file.read()
+        problems = []
+        if not data.startswith(template.data):
+            problems.append('no conserva la plantilla como prefijo')
+        try:
+            reader = PdfReader(output_path, strict=True)
+            if len(reader.pages) != template.page_count:
+                problems.append(f'{len(reader.pages)} páginas, se esperaban {template.page_count}')
+            writer = PdfWriter(clone_from=reader)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            buffer.seek(0)
+            reread = PdfReader(buffer, strict=True)
+            if [page.extract_text() for page in reread.pages] != [page.extract_text() for page in reader.pages]:
+                problems.append('el texto cambia al reescribir el archivo')
+        except Exception as e:
+            problems.append(f'error de lectura estricta: {e}')
+
+        if problems:
+            self.stdout.write(self.style.ERROR(f"  incremental: {'; '.join(problems)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'  incremental: lectura estricta correcta, {len(data) - len(template.data)} bytes agregados '
+                f'a los {len(template.data)} de la plantilla'
+            ))
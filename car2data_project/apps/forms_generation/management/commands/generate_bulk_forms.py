@@ -0,0 +1,70 @@
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from services.bulk_generation import generate_bulk, write_merged_pdf
+from services.file_streaming import iter_zip
+from services.form_rendering import FORM_TYPES
+from services.render_pool import RenderPool, render_pool_workers
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera el mismo formulario para varios documentos de un usuario con campos comunes, '
+        'en un pool de procesos, y lo guarda como ZIP o como un único PDF combinado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Nombre de usuario dueño de los documentos')
+        parser.add_argument('--documents', type=int, nargs='+', required=True, help='IDs de los documentos')
+        parser.add_argument('--form-type', required=True, choices=FORM_TYPES)
+        parser.add_argument('--fields', help='Archivo JSON con los campos comunes (p. ej. vendedor, comprador)')
+        parser.add_argument(
+            '--field', action='append', default=[], metavar='CAMPO=VALOR',
+            help='Campo común de primer nivel; se puede repetir y tiene prioridad sobre --fields',
+        )
+        parser.add_argument('--workers', type=int, default=render_pool_workers(), help='Procesos de renderizado')
+        parser.add_argument('--format', choices=('zip', 'pdf'), default='zip')
+        parser.add_argument('--output', required=True, help='Ruta del ZIP o PDF de salida')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuario no encontrado: {options['user']}")
+
+        shared_fields = {}
+        if options['fields']:
+            with open(options['fields'], encoding='utf-8') as file:
+                shared_fields = json.load(file)
+        for item in options['field']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Campo inválido (se espera CAMPO=VALOR): {item}')
+            shared_fields[key] = value
+
+        # El comando es su propio proceso: un pool del tamaño pedido, cerrado al terminar
+        pool = RenderPool(workers=options['workers'])
+        start = time.perf_counter()
+        try:
+            result = generate_bulk(user, options['documents'], options['form_type'], shared_fields, pool=pool)
+        finally:
+            pool.shutdown()
+        elapsed = time.perf_counter() - start
+
+        for document_id, error in result.errors.items():
+            self.stdout.write(self.style.WARNING(f'  documento {document_id}: {error}'))
+        if not result.forms:
+            raise CommandError('No se generó ningún formulario')
+
+        with open(options['output'], 'wb') as output:
+            if options['format'] == 'pdf':
+                write_merged_pdf(result.forms, output)
+            else:
+                for chunk in iter_zip((form.download_filename(), form.generated_file) for form in result.forms):
+                    output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.forms)} formularios ({result.rendered} renderizados, {result.reused} desde caché) "
+            f"en {elapsed:.2f}s con {options['workers']} procesos -> {options['output']}"
+        ))
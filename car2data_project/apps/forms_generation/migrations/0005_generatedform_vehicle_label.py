@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forms_generation", "0004_formulariotramite_reg_numero_chasis_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="generatedform",
+            name="placa",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="generatedform",
+            name="vehicle_label",
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
@@ -0,0 +1,57 @@
+import json
+
+from django.db import migrations, transaction
+
+from services.extracted_fields import compact_plate, vehicle_label
+
+CHUNK_SIZE = 500
+
+
+def _extracted_data(document):
+    extraction = getattr(document, "extraction", None)
+    if extraction is not None:
+        return extraction.data or {}
+    try:
+        return json.loads(document.extracted_data_json or "{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+def backfill_vehicle_fields(apps, schema_editor):
+    """Calcula placa y vehicle_label de los formularios existentes por bloques de CHUNK_SIZE"""
+    GeneratedForm = apps.get_model("forms_generation", "GeneratedForm")
+    pending = (
+        GeneratedForm.objects.filter(vehicle_label="")
+        .select_related("document__extraction")
+        .order_by("pk")
+    )
+
+    last_pk = 0
+    while True:
+        chunk = list(pending.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for form in chunk:
+            data = _extracted_data(form.document)
+            placa = (data.get("informacion_vehiculo") or {}).get("placa") or ""
+            if placa == "No disponible":
+                placa = ""
+            form.placa = compact_plate(str(placa))[:20]
+            form.vehicle_label = vehicle_label(data, form.document.name)[:200]
+        with transaction.atomic():
+            GeneratedForm.objects.bulk_update(chunk, ["placa", "vehicle_label"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Cada bloque se confirma por separado (ver backfill_vehicle_fields)
+    atomic = False
+
+    dependencies = [
+        ("documents", "0010_backfill_extracteddata"),
+        ("forms_generation", "0005_generatedform_vehicle_label"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_vehicle_fields, migrations.RunPython.noop),
+    ]
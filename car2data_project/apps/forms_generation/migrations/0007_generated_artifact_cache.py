@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forms_generation", "0006_backfill_generatedform_vehicle_label"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeneratedArtifact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("form_type", models.CharField(max_length=50)),
+                ("file", models.FileField(upload_to="generated_forms/")),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+            ],
+            options={
+                "verbose_name": "Artefacto generado",
+                "verbose_name_plural": "Artefactos generados",
+                "db_table": "generated_artifact",
+            },
+        ),
+        migrations.AddField(
+            model_name="generatedform",
+            name="artifact",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="forms",
+                to="forms_generation.generatedartifact",
+            ),
+        ),
+    ]
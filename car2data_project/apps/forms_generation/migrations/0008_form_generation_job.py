@@ -0,0 +1,102 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("documents", "0010_backfill_extracteddata"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("forms_generation", "0007_generated_artifact_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FormGenerationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "form_type",
+                    models.CharField(
+                        choices=[
+                            ("contrato_compraventa", "Contrato de Compraventa"),
+                            ("contrato_mandato", "Contrato de Mandato"),
+                            ("formulario_tramite", "Formulario de Trámite"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "payload",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pendiente"),
+                            ("processing", "Generando"),
+                            ("completed", "Completado"),
+                            ("error", "Error"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="form_generation_jobs",
+                        to="documents.document",
+                    ),
+                ),
+                (
+                    "generated_form",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="jobs",
+                        to="forms_generation.generatedform",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="form_generation_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Trabajo de generación",
+                "verbose_name_plural": "Trabajos de generación",
+                "db_table": "form_generation_job",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="form_generation_job_status_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("forms_generation", "0008_form_generation_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="formgenerationjob",
+            name="worker",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
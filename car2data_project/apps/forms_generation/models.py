@@ -1,8 +1,34 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.text import slugify
 from apps.vehicles.models import Vehiculo, Persona
 from apps.documents.models import Document
+from services.extracted_fields import compact_plate, vehicle_label
+
+class GeneratedArtifact(models.Model):
+    """
+    PDF generado reutilizable, indexado por hash del tipo de formulario, los datos
+    normalizados y la versión de la plantilla. Varios GeneratedForm pueden compartir el
+    mismo archivo: ref_count cuenta cuántos lo referencian (ver services.generation_cache).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    form_type = models.CharField(max_length=50)
+    file = models.FileField(upload_to='generated_forms/')
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'generated_artifact'
+        verbose_name = 'Artefacto generado'
+        verbose_name_plural = 'Artefactos generados'
+
+    def __str__(self):
+        return f"{self.key[:12]}... ({self.form_type}, {self.ref_count} refs)"
 
 class GeneratedForm(models.Model):
     FORM_TYPE_CHOICES = [
@@ -16,6 +42,13 @@ class GeneratedForm(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE)
     form_type = models.CharField(max_length=50, choices=FORM_TYPE_CHOICES)
     generated_file = models.FileField(upload_to='generated_forms/', null=True, blank=True)
+    # Copiados del documento al crear el registro, para listar sin leer la extracción
+    placa = models.CharField(max_length=20, blank=True)
+    vehicle_label = models.CharField(max_length=200, blank=True)
+    # Archivo compartido de la caché de generación; None si el archivo es propio del registro
+    artifact = models.ForeignKey(
+        GeneratedArtifact, on_delete=models.SET_NULL, null=True, blank=True, related_name='forms'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -27,7 +60,25 @@ class GeneratedForm(models.Model):
     def __str__(self):
         return f"Formulario {self.id} - {self.get_form_type_display()}"
 
+    def save(self, *args, **kwargs):
+        if not self.vehicle_label and self.document_id:
+            self.set_vehicle_fields()
+        super().save(*args, **kwargs)
+
+    def set_vehicle_fields(self):
+        """Copia la placa y la etiqueta del vehículo desde los datos extraídos del documento"""
+        data = self.document.get_extracted_data()
+        self.placa = compact_plate(self.document.safe_get(data, ['informacion_vehiculo', 'placa']))[:20]
+        self.vehicle_label = vehicle_label(data, self.document.name)[:200]
+
+    def download_filename(self):
+        """Nombre de descarga: tipodedocumento_placa.pdf"""
+        tipo_doc = slugify(self.get_form_type_display()) or 'documento'
+        return f"{tipo_doc}_{self.placa or 'sin_placa'}.pdf"
+
     def get_vehicle_display(self):
+        if self.vehicle_label:
+            return self.vehicle_label
         try:
             data = self.document.get_structured_data()
             veh = data.get('vehiculo', {}) or {}
@@ -43,6 +94,49 @@ class GeneratedForm(models.Model):
             pass
         return self.document.name
 
+class FormGenerationJob(models.Model):
+    """
+    Generación de un formulario en segundo plano (ver services.form_generation_jobs).
+    payload guarda los datos ya combinados con los que se rellena el PDF.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('processing', 'Generando'),
+        ('completed', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='form_generation_jobs')
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='form_generation_jobs')
+    form_type = models.CharField(max_length=50, choices=GeneratedForm.FORM_TYPE_CHOICES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Proceso (host:pid) cuyo executor tiene el trabajo; si ya no existe, otro lo retoma
+    worker = models.CharField(max_length=100, blank=True)
+    generated_form = models.ForeignKey(
+        GeneratedForm, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs'
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'form_generation_job'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='form_generation_job_status_idx'),
+        ]
+        verbose_name = 'Trabajo de generación'
+        verbose_name_plural = 'Trabajos de generación'
+
+    def __str__(self):
+        return f"Job {self.id} - {self.form_type} documento {self.document_id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'error')
+
 class ContratoCompraventa(models.Model):
     id_contrato = models.AutoField(primary_key=True)
     id_vehiculo = models.ForeignKey(Vehiculo, on_delete=models.CASCADE, db_column='id_vehiculo')
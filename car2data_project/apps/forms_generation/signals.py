@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from services.form_generation_jobs import resubmit_if_orphaned
+from services.generation_cache import GenerationCache
+from services.status_events import form_job_event, register_status_source
+from .models import FormGenerationJob, GeneratedForm
+
+
+@receiver(post_delete, sender=GeneratedForm)
+def release_artifact_on_form_delete(sender, instance, **kwargs):
+    """Libera la referencia al archivo compartido, también al borrar en cascada con el documento"""
+    if instance.artifact_id:
+        GenerationCache().release(instance.artifact_id)
+
+
+def form_job_snapshot(user, job_ids):
+    """Estado de los trabajos para el canal de eventos; reencola los abandonados por un proceso caído"""
+    jobs = list(FormGenerationJob.objects.filter(user=user, id__in=job_ids))
+    for job in jobs:
+        resubmit_if_orphaned(job)
+    return [form_job_event(job) for job in jobs]
+
+
+register_status_source('form_job', form_job_snapshot)
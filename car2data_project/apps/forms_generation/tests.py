@@ -0,0 +1,413 @@
+import os
+import copy
+import socket
+import subprocess
+import sys
+import json
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from apps.documents.models import Document
+from services.extraction_backends import LocalFixtureBackend
+from services.bulk_generation import MERGED_DIR
+from services.form_generation_jobs import executor_name, generate_form, recover_stale_jobs, resubmit_if_orphaned
+from services.generation_cache import GenerationCache
+from services.PdfFormFiller import PDFFormFiller
+from services.pdf_templates import get_template_registry
+from .management.commands.benchmark_form_fill import FORM_TYPES, sample_payload
+from .models import FormGenerationJob, GeneratedArtifact, GeneratedForm
+
+# Valores de sample_payload que deben leerse en el texto del PDF de cada tipo
+EXPECTED_VALUES = {
+    'contrato_compraventa': ['ABC123', 'CHEVROLET', 'RAMIREZ LOPEZ ANA MARIA', '35,000,000'],
+    'contrato_mandato': ['ABC123', 'RAMIREZ LOPEZ ANA MARIA', '9080706050', 'TRASPASO'],
+    'formulario_tramite': ['ABC123', 'CHEVROLET', 'SAIL', '1020304050'],
+}
+
+
+# Sin el manifiesto de collectstatic, que no existe al ejecutar las pruebas
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class FormHistoryQueriesTests(TestCase):
+    """El historial debe costar las mismas consultas con una fila que con la página llena"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='historial', password='x')
+        self.client.force_login(self.user)
+        self.fixture = LocalFixtureBackend().fixture
+
+    def create_form(self, index):
+        data = copy.deepcopy(self.fixture)
+        data['informacion_vehiculo']['placa'] = f'HIS{index:03d}'
+        document = Document.objects.create(
+            user=self.user, name=f'historial_{index}.pdf', file=f'documents/historial_{index}.pdf', status='completed'
+        )
+        document.set_extracted_data(data)
+        return GeneratedForm.objects.create(
+            user=self.user,
+            document=document,
+            form_type='contrato_compraventa',
+            generated_file=f'generated_forms/historial_{index}.pdf',
+        )
+
+    def history_queries(self):
+        url = reverse('forms_generation:history')
+        # Petición previa: los contadores del usuario quedan en caché en ambos casos
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured.captured_queries), response
+
+    def test_history_query_count_does_not_grow_with_rows(self):
+        self.create_form(0)
+        one_row, response = self.history_queries()
+        self.assertEqual(len(response.context['generated_forms']), 1)
+
+        for index in range(1, 10):
+            self.create_form(index)
+        self.client.get(reverse('forms_generation:history'))
+        with self.assertNumQueries(one_row):
+            response = self.client.get(reverse('forms_generation:history'))
+        self.assertEqual(len(response.context['generated_forms']), 10)
+        self.assertContains(response, 'HIS009')
+
+
+@override_settings(PDF_FILL_ENGINE='incremental')
+class IncrementalFillEngineTests(SimpleTestCase):
+    """La salida incremental debe ser un PDF válido que conserva la plantilla como prefijo"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.filler = PDFFormFiller()
+
+    def test_incremental_output_round_trips_with_pypdf(self):
+        for form_type in FORM_TYPES:
+            with self.subTest(form_type=form_type):
+                output_path = os.path.join(self.directory, f'{form_type}.pdf')
+                self.assertTrue(self.filler.fill_pdf_form(form_type, sample_payload(form_type), output_path))
+
+                template = get_template_registry().load(self.filler.get_template_path(form_type))
+                with open(output_path, 'rb') as file:
+                    data = file.read()
+                self.assertTrue(data.startswith(template.data))
+                self.assertGreater(len(data), len(template.data))
+
+                reader = PdfReader(output_path, strict=True)
+                self.assertEqual(len(reader.pages), template.page_count)
+
+                # Sin espacios: pypdf puede partir un valor en varias líneas
+                text = ''.join(''.join(page.extract_text().split()) for page in reader.pages)
+                for value in EXPECTED_VALUES[form_type]:
+                    self.assertIn(''.join(value.split()), text)
+
+
+class GenerationCacheTestCase(TestCase):
+    """Caché de generación sobre un MEDIA_ROOT temporal"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media.name
+        self.cache = GenerationCache()
+
+    def store(self, form_type, payload):
+        file_name = f'generated_forms/{form_type}.pdf'
+        os.makedirs(os.path.join(self.media_root, 'generated_forms'), exist_ok=True)
+        with open(os.path.join(self.media_root, file_name), 'wb') as file:
+            file.write(b'%PDF-1.4\n%%EOF\n')
+        return self.cache.store(self.cache.make_key(form_type, payload), form_type, file_name)
+
+    def acquire_on(self, day, form_type, payload):
+        with mock.patch('services.generation_cache.today', return_value=day):
+            return self.cache.acquire(self.cache.make_key(form_type, payload))
+
+
+
+class GenerationCacheDateTests(GenerationCacheTestCase):
+    """Los PDF que imprimen la fecha actual no se reutilizan de un día para otro"""
+
+    def test_dated_forms_miss_on_another_day(self):
+        cases = [
+            ('formulario_tramite', sample_payload('formulario_tramite')),
+            ('contrato_compraventa', dict(sample_payload('contrato_compraventa'), fecha_contrato='')),
+            ('contrato_mandato', dict(sample_payload('contrato_mandato'), fecha_contrato='15/01/2025')),
+        ]
+        for form_type, payload in cases:
+            with self.subTest(form_type=form_type):
+                with mock.patch('services.generation_cache.today', return_value=date(2025, 1, 15)):
+                    self.assertIsNotNone(self.store(form_type, payload))
+                self.assertIsNotNone(self.acquire_on(date(2025, 1, 15), form_type, payload))
+                self.assertIsNone(self.acquire_on(date(2025, 1, 16), form_type, payload))
+
+    def test_contract_with_explicit_date_hits_on_another_day(self):
+        payload = sample_payload('contrato_mandato')
+        with mock.patch('services.generation_cache.today', return_value=date(2025, 1, 15)):
+            self.store('contrato_mandato', payload)
+        self.assertIsNotNone(self.acquire_on(date(2025, 3, 1), 'contrato_mandato', payload))
+
+
+class GenerationCacheReferenceTests(GenerationCacheTestCase):
+    """Una referencia tomada para un formulario que no se llega a crear se devuelve"""
+
+    def test_failed_form_creation_releases_the_reference(self):
+        payload = sample_payload('contrato_mandato')
+        artifact = self.store('contrato_mandato', payload)
+        self.cache.release(artifact.id)
+        user = User.objects.create_user(username='referencias', password='x')
+        document = Document.objects.create(
+            user=user, name='referencias.pdf', file='documents/referencias.pdf', status='completed'
+        )
+
+        with mock.patch.object(GeneratedForm.objects, 'create', side_effect=RuntimeError('sin base de datos')):
+            with self.assertRaises(RuntimeError):
+                generate_form(document, 'contrato_mandato', payload)
+        self.assertEqual(GeneratedArtifact.objects.get(id=artifact.id).ref_count, 0)
+
+        generated_form = generate_form(document, 'contrato_mandato', payload)
+        self.assertEqual(generated_form.artifact_id, artifact.id)
+        self.assertEqual(GeneratedArtifact.objects.get(id=artifact.id).ref_count, 1)
+
+
+@override_settings(FORM_GENERATION_ASYNC=True, FORM_GENERATION_STALE_SECONDS=600)
+class OrphanedGenerationJobTests(TestCase):
+    """Un trabajo cuyo proceso murió no debe quedarse esperando para siempre"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='huerfanos', password='x')
+        self.document = Document.objects.create(
+            user=user, name='huerfano.pdf', file='documents/huerfano.pdf', status='completed'
+        )
+        executor = mock.patch('services.form_generation_jobs.get_generation_executor')
+        self.executor = executor.start().return_value
+        self.addCleanup(executor.stop)
+
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        self.dead_worker = f"{socket.gethostname()}:{finished.pid}"
+
+    def create_job(self, status, worker, age=0):
+        started = timezone.now() - timedelta(seconds=age)
+        job = FormGenerationJob.objects.create(
+            user=self.document.user,
+            document=self.document,
+            form_type='contrato_mandato',
+            payload={},
+            status=status,
+            worker=worker,
+            started_at=started if status == 'processing' else None,
+        )
+        FormGenerationJob.objects.filter(id=job.id).update(created_at=started)
+        job.refresh_from_db()
+        return job
+
+    def test_job_of_dead_process_is_resubmitted_at_once(self):
+        job = self.create_job('processing', self.dead_worker)
+
+        self.assertTrue(resubmit_if_orphaned(job))
+        self.executor.submit.assert_called_once_with(job.id)
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.worker, executor_name())
+        self.assertFalse(resubmit_if_orphaned(job))
+
+    def test_job_of_live_process_is_resubmitted_only_when_stale(self):
+        live_worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.assertFalse(resubmit_if_orphaned(self.create_job('pending', live_worker, age=60)))
+        self.assertTrue(resubmit_if_orphaned(self.create_job('pending', 'otro-host:1', age=601)))
+        self.assertEqual(self.executor.submit.call_count, 1)
+
+    @override_settings(STATUS_EVENTS_WSGI_RETRY_MS=3000)
+    def test_status_channel_resubmits_orphaned_job(self):
+        job = self.create_job('processing', self.dead_worker)
+        self.client.force_login(self.document.user)
+
+        response = self.client.get(reverse('documents:events'), {'jobs': job.id})
+        self.assertIn('"type": "form_job"', response.content.decode())
+        self.assertIn('"status": "pending"', response.content.decode())
+        self.executor.submit.assert_called_once_with(job.id)
+
+    def test_recovery_takes_jobs_of_dead_processes(self):
+        processing = self.create_job('processing', self.dead_worker)
+        pending = self.create_job('pending', self.dead_worker)
+        live = self.create_job('pending', 'otro-host:1')
+
+        self.assertCountEqual(recover_stale_jobs(), [processing.id, pending.id])
+        processing.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual((processing.status, processing.started_at), ('pending', None))
+        self.assertEqual(processing.worker, executor_name())
+        self.assertEqual(live.worker, 'otro-host:1')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BulkMergedPdfTests(TestCase):
+    """El PDF combinado del lote se guarda en el almacenamiento y se envía por bloques"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media.name
+
+        self.user = User.objects.create_user(username='lote', password='x')
+        self.client.force_login(self.user)
+        self.documents = []
+        for index in range(2):
+            data = copy.deepcopy(LocalFixtureBackend().fixture)
+            data['informacion_vehiculo']['placa'] = f'LOT{index:03d}'
+            document = Document.objects.create(
+                user=self.user, name=f'lote_{index}.pdf', file=f'documents/lote_{index}.pdf', status='completed'
+            )
+            document.set_extracted_data(data)
+            self.documents.append(document)
+
+    @mock.patch('services.bulk_generation.get_render_pool')
+    def test_merged_pdf_is_streamed_from_storage(self, get_render_pool):
+        get_render_pool.return_value.render.side_effect = lambda jobs: [
+            self.write_pdf(output_path) for _, _, output_path in jobs
+        ]
+        response = self.client.post(
+            reverse('forms_generation:bulk_generate'),
+            json.dumps({'document_ids': [d.id for d in self.documents], 'form_type': 'contrato_mandato', 'format': 'pdf'}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('ETag', response)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, MERGED_DIR))), 1)
+        with tempfile.TemporaryFile() as merged:
+            merged.write(b''.join(response.streaming_content))
+            merged.seek(0)
+            self.assertEqual(len(PdfReader(merged).pages), 2)
+
+    @staticmethod
+    def write_pdf(output_path):
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        with open(output_path, 'wb') as file:
+            writer.write(file)
+        return True
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', FILE_DOWNLOAD_OFFLOAD='')
+class StoredFormsTestCase(TestCase):
+    """Formularios generados con su PDF en un MEDIA_ROOT temporal"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media.name
+        os.makedirs(os.path.join(self.media_root, 'generated_forms'))
+
+        self.user = User.objects.create_user(username='descargas', password='x')
+        self.client.force_login(self.user)
+        self.document = Document.objects.create(
+            user=self.user, name='descargas.pdf', file='documents/descargas.pdf', status='completed'
+        )
+        self.document.set_extracted_data(LocalFixtureBackend().fixture)
+
+    def create_form(self, name, content=None):
+        file_name = f'generated_forms/{name}'
+        if content is not None:
+            with open(os.path.join(self.media_root, file_name), 'wb') as file:
+                file.write(content)
+        return GeneratedForm.objects.create(
+            user=self.user, document=self.document, form_type='contrato_mandato', generated_file=file_name
+        )
+
+
+class DownloadStreamingTests(StoredFormsTestCase):
+    """Descarga por bloques con Range, If-Range y GET condicional"""
+
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('forms_generation:download_pdf', args=[self.create_form('descarga.pdf', self.content).id])
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_satisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(suffix.status_code, 206)
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_with_a_stale_etag_sends_the_whole_file(self):
+        etag = self.client.get(self.url)['ETag']
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(partial.status_code, 206)
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otra-version"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(b''.join(stale.streaming_content), self.content)
+
+    def test_conditional_get(self):
+        first = self.client.get(self.url)
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+
+class ExportZipTests(StoredFormsTestCase):
+    """El ZIP se arma al vuelo, abre con zipfile y omite los archivos que ya no existen"""
+
+    def test_zip_opens_and_skips_missing_files(self):
+        first = self.create_form('primero.pdf', b'%PDF-1.4 primero')
+        second = self.create_form('segundo.pdf', b'%PDF-1.4 segundo')
+        missing = self.create_form('borrado.pdf')
+
+        response = self.client.get(reverse('forms_generation:export_zip'), {'ids': f'{first.id},{second.id},{missing.id}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        with tempfile.TemporaryFile() as file:
+            for chunk in response.streaming_content:
+                file.write(chunk)
+            file.seek(0)
+            with zipfile.ZipFile(file) as archive:
+                self.assertIsNone(archive.testzip())
+                names = archive.namelist()
+                # Mismo nombre de descarga: la segunda entrada recibe un sufijo
+                self.assertEqual(len(names), 2)
+                self.assertEqual(names[1], names[0].replace('.pdf', '_2.pdf'))
+                contents = sorted(archive.read(name) for name in names)
+        self.assertEqual(contents, [b'%PDF-1.4 primero', b'%PDF-1.4 segundo'])
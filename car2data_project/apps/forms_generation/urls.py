@@ -12,6 +12,13 @@ urlpatterns = [
     # Vista para generar formularios específicos
     path('generate/', views.GenerateFormView.as_view(), name='generate'),
     
+    # Progreso y estado de una generación en segundo plano
+    path('jobs/<int:job_id>/', views.GenerationProgressView.as_view(), name='job_progress'),
+    path('jobs/<int:job_id>/status/', views.generation_job_status, name='job_status'),
+    
+    # Paquete de traspaso: compraventa, mandato y trámite en un solo PDF
+    path('transfer-package/<int:document_id>/', views.TransferPackageView.as_view(), name='transfer_package'),
+    
     # Vista de descarga de formularios generados
     path('download/<int:form_id>/', views.DownloadFormView.as_view(), name='download'),
     
@@ -20,9 +27,14 @@ urlpatterns = [
     
     # Vista del historial de formularios
     path('history/', views.FormHistoryView.as_view(), name='history'),
+    # Exportar varios formularios generados en un ZIP
+    path('export/zip/', views.ExportFormsZipView.as_view(), name='export_zip'),
     # Eliminar un formulario generado
     path('delete/<int:form_id>/', views.DeleteGeneratedFormView.as_view(), name='delete'),
     
+    # API de generación en lote (ZIP o PDF combinado)
+    path('api/bulk-generate/', views.BulkGenerateView.as_view(), name='bulk_generate'),
+    
     # API para obtener datos de vista previa
     path('api/preview-data/', views.PreviewDataView.as_view(), name='preview_data'),
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 # car2data_project/apps/forms_generation/views.py
 
+import io
 import os
 from datetime import datetime
 from datetime import timedelta
@@ -9,17 +10,24 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView, FormView, ListView
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse, HttpResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.contrib import messages
 from django.conf import settings
 from django.utils import timezone
-from django.utils.text import slugify
-from .models import GeneratedForm, ContratoMandato, ContratoCompraventa, FormularioTramite
+from django.utils.http import content_disposition_header
+from .models import GeneratedForm, FormGenerationJob, ContratoMandato, ContratoCompraventa, FormularioTramite
 from .forms import (ContratoMandatoForm, ContratoCompraventaForm, FormularioTramiteForm, 
-                   DocumentSelectionForm)
+                   DocumentSelectionForm, TransferPackageForm)
 from apps.documents.models import Document
 from apps.vehicles.models import Vehiculo, Persona
-from services.DocumentGenerator import DocumentGenerator
+from services.user_stats import get_user_stats
+from services.status_events import form_job_status_data
+from services.file_streaming import iter_zip, stream_file
+from services.bulk_generation import generate_bulk, save_merged_pdf, write_merged_pdf
+from services.form_generation_jobs import enqueue_form_generation, resubmit_if_orphaned
+from services.form_rendering import build_form_data, tramite_base_data
+from services.transfer_package import TransferPackageError, generate_transfer_package
 import logging
 
 logger = logging.getLogger(__name__)
@@ -296,11 +304,10 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
                 logger.info(f"Datos para PDF de contrato de mandato: {pdf_data}")
                 
                 # Generar PDF con todos los datos
-                success = self._generate_pdf_document(document, 'contrato_mandato', pdf_data)
+                job = self._enqueue_pdf_document(document, 'contrato_mandato', pdf_data)
                 
-                if success:
-                    messages.success(request, 'Contrato de mandato generado exitosamente.')
-                    return redirect('forms_generation:download', form_id=success)
+                if job:
+                    return redirect('forms_generation:job_progress', job_id=job.id)
                 else:
                     messages.error(request, 'Error al generar el PDF del contrato.')
                     
@@ -394,7 +401,7 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
                 organismo_transito = extracted_data.get('registro', {}).get('organismo_transito', '')
                 
                 # Generar PDF
-                success = self._generate_pdf_document(document, 'contrato_compraventa', {
+                job = self._enqueue_pdf_document(document, 'contrato_compraventa', {
                     'vendedor': vendedor_info,
                     'comprador': comprador_info,
                     'valor_venta': contrato.valor_venta,
@@ -405,9 +412,8 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
                     'contrato_id': contrato.id_contrato
                 })
                 
-                if success:
-                    messages.success(request, 'Contrato de compraventa generado exitosamente.')
-                    return redirect('forms_generation:download', form_id=success)
+                if job:
+                    return redirect('forms_generation:job_progress', job_id=job.id)
                 else:
                     messages.error(request, 'Error al generar el PDF del contrato.')
                     
@@ -433,70 +439,7 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
         if form.is_valid():
             try:
                 # 1. Cargar datos extraídos originalmente como base
-                extracted_data = document.get_structured_data()
-                # Preferir 'informacion_vehiculo' (como en data_preview), con fallback a 'vehiculo'
-                extracted_vehiculo = extracted_data.get('informacion_vehiculo') or extracted_data.get('vehiculo', {})
-                extracted_propietario = extracted_data.get('propietario', {})
-                extracted_registro = extracted_data.get('registro', {})
-
-                # Helper para separar nombre completo en apellidos y nombres
-                def split_apellidos_nombres(fullname: str):
-                    try:
-                        if not fullname:
-                            return '', '', ''
-                        parts = str(fullname).strip().split()
-                        if len(parts) >= 3:
-                            return parts[0], parts[1], ' '.join(parts[2:])
-                        if len(parts) == 2:
-                            return parts[0], '', parts[1]
-                        return parts[0], '', ''
-                    except Exception:
-                        return '', '', ''
-
-                ap1, ap2, nombres = split_apellidos_nombres(extracted_propietario.get('nombre'))
-
-                # Normalizador reutilizable
-                def _normalize_value(v):
-                    try:
-                        if v is None:
-                            return ''
-                        s = str(v).strip()
-                        if s.lower() in ['no disponible', 'n/a', 'na', 'none', 'null', 'sin dato']:
-                            return ''
-                        return s
-                    except Exception:
-                        return ''
-
-                base_data = {
-                    'placa': extracted_vehiculo.get('placa'),
-                    'marca': _normalize_value(extracted_vehiculo.get('marca')),
-                    'linea': _normalize_value(extracted_vehiculo.get('linea')),
-                    'color': _normalize_value(extracted_vehiculo.get('color')),
-                    'modelo': _normalize_value(extracted_vehiculo.get('modelo')),
-                    'cilindrada': _normalize_value(extracted_vehiculo.get('cilindrada_cc')),
-                    'capacidad': _normalize_value(extracted_vehiculo.get('capacidad_kg_psj')),
-                    'potencia': _normalize_value(extracted_vehiculo.get('potencia_hp')),
-                    'carroceria': _normalize_value(extracted_vehiculo.get('tipo_carroceria')),
-                    'numero_motor': _normalize_value(extracted_vehiculo.get('numero_motor')),
-                    'reg_numero_motor': _normalize_value(extracted_vehiculo.get('reg_numero_motor')),
-                    'numero_chasis': _normalize_value(extracted_vehiculo.get('numero_chasis')),
-                    'reg_numero_chasis': _normalize_value(extracted_vehiculo.get('reg_numero_chasis')),
-                    'numero_serie': _normalize_value(extracted_vehiculo.get('numero_serie')),
-                    'reg_numero_serie': _normalize_value(extracted_vehiculo.get('reg_numero_serie')),
-                    'numero_vin': _normalize_value(extracted_vehiculo.get('vin')),
-                    'tipo_servicio': _normalize_value(extracted_vehiculo.get('servicio')),
-                    'clase_vehiculo': _normalize_value(extracted_vehiculo.get('clase_vehiculo')),
-                    'combustible': _normalize_value(extracted_vehiculo.get('combustible')),
-                    # Propietario (separado automáticamente)
-                    'propietario_primer_apellido': ap1,
-                    'propietario_segundo_apellido': ap2,
-                    'propietario_nombres': nombres,
-                    'propietario_documento': _normalize_value(extracted_propietario.get('identificacion')),
-
-                    # Datos de importación
-                    'declaracion_importacion': _normalize_value(extracted_registro.get('declaracion_importacion')),
-                    'fecha_importacion': _normalize_value(extracted_registro.get('fecha_importacion')),
-                }
+                base_data = tramite_base_data(document.get_structured_data())
 
                 # 2. Combinar con datos del formulario (los datos del form tienen prioridad)
                 # Se filtran los valores None de cleaned_data para no sobreescribir datos existentes con "nada"
@@ -539,12 +482,11 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
                 pdf_data = final_data.copy()
                 pdf_data['placa'] = vehiculo.placa  # Añadir la placa que no está en el form
 
-                success = self._generate_pdf_document(document, 'formulario_tramite', pdf_data)
+                job = self._enqueue_pdf_document(document, 'formulario_tramite', pdf_data)
 
                 
-                if success:
-                    messages.success(request, 'Formulario de trámite generado exitosamente.')
-                    return redirect('forms_generation:download', form_id=success)
+                if job:
+                    return redirect('forms_generation:job_progress', job_id=job.id)
                 else:
                     messages.error(request, 'Error al generar el PDF del formulario.')
                     
@@ -563,83 +505,25 @@ class GenerateFormView(LoginRequiredMixin, TemplateView):
             'extracted_data': document.get_structured_data()
         })
     
-    def _generate_pdf_document(self, document, form_type, additional_data=None):
-        """Genera el documento PDF usando el servicio DocumentGenerator"""
+    def _enqueue_pdf_document(self, document, form_type, additional_data=None):
+        """
+        Registra la generación del PDF como trabajo en segundo plano (ver
+        services.form_generation_jobs) y retorna el FormGenerationJob, o None si falla.
+        """
         try:
-            # Crear directorio si no existe
-            os.makedirs(os.path.join(settings.MEDIA_ROOT, 'generated_forms'), exist_ok=True)
-            
-            generator = DocumentGenerator()
             extracted_data = document.get_structured_data()
-            
-            # Generar nombre único para el archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{form_type}_{document.id}_{timestamp}.pdf"
-            file_path = os.path.join(settings.MEDIA_ROOT, 'generated_forms', filename)
-            
-            success = False
-            
             logger.info(f"Datos extraídos del documento: {extracted_data}")
             
-            if form_type == 'contrato_mandato':
-                # Combinar los datos extraídos con los datos adicionales del formulario
-                # Los datos adicionales tienen prioridad sobre los extraídos
-                form_data = extracted_data.copy()
-                form_data.update(additional_data)
-                
-                success = generator.generate_contrato_mandato(
-                    form_data,  # Pasar todos los datos combinados
-                    additional_data.get('mandante', {}),
-                    additional_data.get('mandatario', {}),
-                    file_path
-                )
-            elif form_type == 'contrato_compraventa':
-                # Construir payload completo y llamar directamente al PDFFormFiller
-                from services.PdfFormFiller import PDFFormFiller
-                vehiculo = extracted_data.get('vehiculo', {})
-                vendedor = additional_data.get('vendedor', {})
-                comprador = additional_data.get('comprador', {})
-                valor_venta = additional_data.get('valor_venta')
-                forma_pago = additional_data.get('forma_pago')
-                ciudad_contrato = additional_data.get('ciudad_contrato')
-                fecha_contrato = additional_data.get('fecha_contrato')
-                organismo_transito = additional_data.get('organismo_transito') or extracted_data.get('registro', {}).get('organismo_transito')
-
-                form_data = {
-                    'vehiculo': vehiculo,
-                    'vendedor': vendedor,
-                    'comprador': comprador,
-                    'valor_venta': valor_venta,
-                    'forma_pago': forma_pago,
-                    'ciudad_contrato': ciudad_contrato,
-                    'fecha_contrato': fecha_contrato,
-                    'organismo_transito': organismo_transito,
-                }
-
-                filler = PDFFormFiller()
-                success = filler.fill_pdf_form('contrato_compraventa', form_data, file_path)
-            elif form_type == 'formulario_tramite':
-                # Los datos completos vienen del formulario en additional_data
-                logger.info(f"Datos del formulario para PDF: {additional_data}")
-                success = generator.generate_formulario_tramite(additional_data, file_path)
-            
-            if success:
-                # Crear registro del formulario generado
-                generated_form = GeneratedForm.objects.create(
-                    user=document.user,
-                    document=document,
-                    form_type=form_type,
-                    generated_file=f'generated_forms/{filename}'
-                )
-                
-                logger.info(f"Documento PDF generado exitosamente: {file_path}")
-                return generated_form.id
-            else:
-                logger.error(f"Fallo en la generación del PDF: {form_type}")
+            # Datos con los que se rellena el formulario (también forman la clave de caché)
+            form_data = build_form_data(form_type, extracted_data, additional_data)
+            if form_data is None:
+                logger.error(f"Tipo de formulario no soportado: {form_type}")
                 return None
+            
+            return enqueue_form_generation(document, form_type, form_data)
                 
         except Exception as e:
-            logger.error(f"Error generando documento PDF: {str(e)}")
+            logger.error(f"Error encolando documento PDF: {str(e)}")
             logger.exception("Detalles del error:")
             return None
 
@@ -670,46 +554,41 @@ class DownloadPDFView(LoginRequiredMixin, TemplateView):
             if not generated_form.generated_file:
                 raise Http404("Archivo no encontrado")
             
-            file_path = generated_form.generated_file.path
-            
-            if not os.path.exists(file_path):
+            # Construir nombre: tipodedocumento_placa.pdf (placa normalizada al generar el formulario)
+            filename = generated_form.download_filename()
+            # Se envía por bloques desde el almacenamiento (con 304, Range y X-Accel-Redirect)
+            try:
+                return stream_file(request, generated_form.generated_file, filename)
+            except FileNotFoundError:
                 raise Http404("Archivo no encontrado en el sistema")
-            
-            with open(file_path, 'rb') as pdf_file:
-                response = HttpResponse(pdf_file.read(), content_type='application/pdf')
-                # Construir nombre: tipodedocumento_placa.pdf
-                try:
-                    # Tipo de documento legible
-                    tipo_doc = slugify(generated_form.get_form_type_display()) or 'documento'
-                except Exception:
-                    tipo_doc = 'documento'
 
-                # Extraer placa desde los datos estructurados del documento
-                placa = 'sin_placa'
-                try:
-                    data = generated_form.document.get_structured_data()
-                    veh = (data or {}).get('vehiculo', {}) or {}
-                    raw_placa = (veh.get('placa') or '').strip()
-                    if raw_placa:
-                        # Normalizar placa: solo letras/números, mayúsculas
-                        import re
-                        placa_clean = re.sub(r'[^A-Za-z0-9]', '', raw_placa).upper()
-                        if placa_clean:
-                            placa = placa_clean
-                except Exception:
-                    pass
-
-                filename = f"{tipo_doc}_{placa}.pdf"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
-                
         except GeneratedForm.DoesNotExist:
             raise Http404("Formulario no encontrado")
+        except Http404:
+            raise
         except Exception as e:
             logger.error(f"Error descargando PDF: {str(e)}")
             messages.error(request, 'Error al descargar el archivo.')
             return redirect('forms_generation:forms')
 
+class GenerationProgressView(LoginRequiredMixin, TemplateView):
+    """Página de espera de un trabajo de generación; redirige a la descarga al completarse"""
+    template_name = 'forms_generation/generation_progress.html'
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(FormGenerationJob, id=kwargs['job_id'], user=request.user)
+        if job.status == 'completed' and job.generated_form_id:
+            return redirect('forms_generation:download', form_id=job.generated_form_id)
+        resubmit_if_orphaned(job)
+        return self.render_to_response(self.get_context_data(job=job, **kwargs))
+
+@login_required
+def generation_job_status(request, job_id):
+    """Obtiene el estado actual de un trabajo de generación"""
+    job = get_object_or_404(FormGenerationJob, id=job_id, user=request.user)
+    resubmit_if_orphaned(job)
+    return JsonResponse(form_job_status_data(job))
+
 class FormHistoryView(LoginRequiredMixin, ListView):
     model = GeneratedForm
     template_name = 'forms_generation/history.html'
@@ -728,33 +607,65 @@ class FormHistoryView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['active_tab'] = 'history'
         
-        # ✅ AGREGAR INFORMACIÓN DE SUSCRIPCIÓN PARA BLOQUEO
-        try:
-            subscription = self.request.user.subscription
-            context['subscription'] = subscription
-            context['documents_used'] = subscription.documents_used
-            context['documents_limit'] = subscription.get_documents_limit()
-            context['documents_remaining'] = subscription.get_remaining_documents()
-            context['can_upload'] = subscription.can_generate_document()
-            context['plan_name'] = subscription.get_plan_display()
-        except:
-            context['subscription'] = None
-            context['documents_used'] = 0
-            context['documents_limit'] = 3
-            context['documents_remaining'] = 3
-            context['can_upload'] = True
-            context['plan_name'] = 'Starter'
+        # Información de suscripción para bloqueo (compartida con el dashboard, cacheada)
+        context.update(get_user_stats(self.request.user))
         
         return context
 
+class ExportFormsZipView(LoginRequiredMixin, View):
+    """
+    Descarga varios formularios generados en un solo ZIP armado al vuelo: sin archivo
+    temporal y con memoria constante (cada PDF se copia por bloques desde el
+    almacenamiento). Las entradas se nombran como en DownloadPDFView (tipo_placa.pdf) y van
+    sin comprimir, porque los PDF ya vienen comprimidos.
+
+    Parámetros GET: ids (seleccionados; repetido o separados por comas) o, si no se
+    envían, los filtros form_type, placa y days (por defecto los 30 días del historial).
+    """
+
+    def get(self, request):
+        forms = GeneratedForm.objects.filter(user=request.user).exclude(generated_file='')
+
+        ids = [value for item in request.GET.getlist('ids') for value in item.split(',') if value.strip()]
+        if ids:
+            try:
+                forms = forms.filter(id__in=[int(value) for value in ids])
+            except ValueError:
+                raise Http404("Selección inválida")
+        else:
+            try:
+                days = int(request.GET.get('days', 30))
+            except ValueError:
+                days = 30
+            forms = forms.filter(created_at__gte=timezone.now() - timedelta(days=days))
+            if request.GET.get('form_type'):
+                forms = forms.filter(form_type=request.GET['form_type'])
+            if request.GET.get('placa'):
+                forms = forms.filter(placa__iexact=request.GET['placa'].strip())
+
+        forms = forms.only('id', 'form_type', 'placa', 'generated_file').order_by('-created_at')
+        if not forms.exists():
+            messages.error(request, 'No hay formularios para exportar.')
+            return redirect('forms_generation:history')
+
+        # El iterador recorre las filas por tramos mientras se envía el ZIP
+        entries = ((form.download_filename(), form.generated_file) for form in forms.iterator(chunk_size=200))
+        response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
+        filename = f"formularios_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.zip"
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
 class DeleteGeneratedFormView(LoginRequiredMixin, View):
     """Elimina un registro de formulario generado y su archivo PDF asociado."""
     def post(self, request, form_id):
         try:
             generated_form = GeneratedForm.objects.get(id=form_id, user=request.user)
 
-            # Eliminar archivo del sistema si existe
-            if generated_form.generated_file and generated_form.generated_file.name:
+            # Eliminar archivo del sistema si existe. Los archivos de la caché de generación
+            # pueden estar compartidos: al borrar el registro se libera su referencia y la
+            # expulsión de la caché elimina el archivo cuando ya nadie lo usa
+            if generated_form.artifact_id is None and generated_form.generated_file and generated_form.generated_file.name:
                 try:
                     file_path = generated_form.generated_file.path
                     if os.path.exists(file_path):
@@ -772,6 +683,104 @@ class DeleteGeneratedFormView(LoginRequiredMixin, View):
 
         return redirect('forms_generation:history')
 
+class BulkGenerateView(LoginRequiredMixin, View):
+    """
+    API de generación en lote: el mismo formulario para varios documentos con campos comunes.
+    Recibe JSON {"document_ids": [...], "form_type": "...", "fields": {...}, "format": "zip"|"pdf"}
+    y responde con un ZIP (un PDF por documento, enviado por bloques) o un único PDF combinado.
+    Los documentos que fallan se indican en la cabecera X-Bulk-Errors.
+    """
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+        document_ids = payload.get('document_ids') or []
+        form_type = payload.get('form_type')
+        output_format = payload.get('format', 'zip')
+        if not isinstance(document_ids, list) or not document_ids:
+            return JsonResponse({'error': 'document_ids requerido'}, status=400)
+        if output_format not in ('zip', 'pdf'):
+            return JsonResponse({'error': 'Formato no soportado'}, status=400)
+
+        try:
+            result = generate_bulk(request.user, document_ids, form_type, payload.get('fields') or {})
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"Error en la generación en lote: {e}")
+            return JsonResponse({'error': 'Error interno del servidor'}, status=500)
+
+        if not result.forms:
+            return JsonResponse({'error': 'No se generó ningún formulario', 'errors': result.errors}, status=400)
+
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if output_format == 'pdf':
+            # Se guarda en el almacenamiento y se envía por bloques, como las descargas individuales
+            file_name = f'{form_type}_lote_{stamp}.pdf'
+            response = stream_file(request, save_merged_pdf(result.forms, file_name), file_name)
+        else:
+            entries = ((form.download_filename(), form.generated_file) for form in result.forms)
+            response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="{form_type}_lote_{stamp}.zip"'
+        if result.errors:
+            response['X-Bulk-Errors'] = ','.join(str(document_id) for document_id in result.errors)
+        return response
+
+class TransferPackageView(LoginRequiredMixin, View):
+    """
+    Paquete de traspaso: con los datos de la venta genera a la vez la compraventa, el
+    mandato y el formulario de trámite del documento (tres registros en el historial) y
+    responde con un único PDF combinado.
+    """
+    template_name = 'forms_generation/transfer_package.html'
+
+    def get(self, request, document_id):
+        document = get_object_or_404(Document, id=document_id, user=request.user)
+        extracted_data = document.get_structured_data()
+        propietario = extracted_data.get('propietario', {})
+        form = TransferPackageForm(initial={
+            'vendedor_nombre': propietario.get('nombre', ''),
+            'vendedor_documento': propietario.get('identificacion', ''),
+            'organismo_transito': extracted_data.get('registro', {}).get('organismo_transito', ''),
+        })
+        return self._render(request, document, form, extracted_data)
+
+    def post(self, request, document_id):
+        document = get_object_or_404(Document, id=document_id, user=request.user)
+        form = TransferPackageForm(request.POST)
+
+        if form.is_valid():
+            try:
+                forms = generate_transfer_package(document, form.package_data())
+                buffer = io.BytesIO()
+                write_merged_pdf(forms, buffer)
+                placa = forms[0].placa or 'sin_placa'
+                stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+                response['Content-Disposition'] = f'attachment; filename="paquete_traspaso_{placa}_{stamp}.pdf"'
+                return response
+            except TransferPackageError as e:
+                messages.error(request, str(e))
+            except Exception as e:
+                logger.error(f"Error generando el paquete de traspaso: {e}")
+                logger.exception("Detalles del error:")
+                messages.error(request, 'Error al generar el paquete de traspaso.')
+        else:
+            logger.error(f"Errores en el paquete de traspaso: {form.errors.as_json()}")
+            messages.error(request, 'Formulario con errores. Revisa los datos.')
+
+        return self._render(request, document, form, document.get_structured_data())
+
+    def _render(self, request, document, form, extracted_data):
+        return render(request, self.template_name, {
+            'document': document,
+            'form': form,
+            'extracted_data': extracted_data,
+        })
+
 # Vista API para obtener datos de vista previa
 class PreviewDataView(LoginRequiredMixin, TemplateView):
     """Vista para obtener datos de vista previa via AJAX"""
@@ -3,6 +3,12 @@ ASGI config for car2data_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El canal de estados (documents:events) solo mantiene la conexión abierta servido por
+ASGI, p. ej. ``uvicorn asgi:application`` desde car2data_project/. Con varios procesos
+configurar STATUS_EVENTS_REDIS_URL para que los eventos lleguen a cualquiera de ellos.
+Bajo WSGI (gunicorn) el canal equivale a consultar el estado cada
+STATUS_EVENTS_WSGI_RETRY_MS: no hay envío inmediato de los cambios.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
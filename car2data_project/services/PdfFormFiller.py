@@ -3,14 +3,15 @@
 import os
 import logging
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from django.conf import settings
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from PyPDF2 import PdfReader, PdfWriter
 import io
+from services.pdf_fonts import fit_font_size, get_font_registry, string_width
+from services.pdf_templates import get_template_registry
 
 logger = logging.getLogger(__name__)
 
@@ -226,38 +227,8 @@ class PDFFormFiller:
         }
     
     def setup_fonts(self):
-        """Configurar fuentes para el PDF con manejo mejorado de errores"""
-        try:
-            # Intentar usar fuentes del sistema en orden de preferencia
-            font_attempts = [
-                ('Arial', [
-                    '/System/Library/Fonts/Arial.ttf',  # macOS
-                    'C:\\Windows\\Fonts\\arial.ttf',    # Windows
-                    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',  # Linux
-                ]),
-                ('Helvetica', [])  # Helvetica es nativa de ReportLab
-            ]
-            
-            for font_name, paths in font_attempts:
-                if font_name == 'Helvetica':
-                    # Helvetica está disponible por defecto
-                    self.default_font = 'Helvetica'
-                    break
-                    
-                for font_path in paths:
-                    if os.path.exists(font_path):
-                        pdfmetrics.registerFont(TTFont(font_name, font_path))
-                        self.default_font = font_name
-                        logger.info(f"Fuente {font_name} configurada desde: {font_path}")
-                        return
-            
-            # Si no encontró ninguna fuente específica, usar Helvetica por defecto
-            self.default_font = 'Helvetica'
-            logger.info("Usando fuente Helvetica por defecto")
-            
-        except Exception as e:
-            logger.warning(f"Error configurando fuentes: {e}")
-            self.default_font = 'Helvetica'
+        """Fuente por defecto, registrada una sola vez por proceso (ver services.pdf_fonts)"""
+        self.default_font = get_font_registry().default_font
     
     def get_template_path(self, form_type):
         """Obtener la ruta de la plantilla PDF según el tipo de formulario"""
@@ -287,12 +258,9 @@ class PDFFormFiller:
         page_size = letter
         try:
             template_path = self.get_template_path(form_type)
-            if template_path and os.path.exists(template_path):
-                tpl_reader = PdfReader(open(template_path, 'rb'))
-                if tpl_reader.pages:
-                    mbox = tpl_reader.pages[0].mediabox
-                    # PyPDF2 devuelve valores tipo DecimalObject; forzar a float
-                    page_size = (float(mbox.width), float(mbox.height))
+            template = get_template_registry().load(template_path) if template_path else None
+            if template and template.page_count:
+                page_size = template.page_size(0)
         except Exception as _e:
             # En caso de error, continuar con tamaño carta por defecto
             pass
@@ -557,33 +525,31 @@ class PDFFormFiller:
             x, y = coords[field_name]
             text_str = str(text).strip()
             page_w, _ = canvas_obj._pagesize
-            # Probar tamaños de fuente decrecientes para encajar
-            for size in [9, 8, 7, 6]:
-                try:
+            # Mayor tamaño de fuente (9 a 6) con el que el texto encaja, midiendo una sola vez
+            try:
+                size = fit_font_size(text_str, self.default_font, max_width)
+                if size is not None:
                     canvas_obj.setFont(self.default_font, size)
-                    from reportlab.pdfbase import pdfmetrics
-                    width = pdfmetrics.stringWidth(text_str, self.default_font, size)
-                    if width <= max_width:
-                        # Evitar desborde a la derecha de la página
-                        x_draw = x
-                        overflow = (x + width) - (page_w - 2)
-                        if overflow > 0:
-                            x_draw = max(2, x - overflow)
-                        canvas_obj.drawString(x_draw, y, text_str)
-                        logger.debug(f"Texto (fit) dibujado en {field_name} ({x_draw}, {y}) size={size}: {text_str}")
-                        # Restaurar tamaño por defecto para otros campos
-                        canvas_obj.setFont(self.default_font, 9)
-                        return
-                except Exception:
-                    # Si falla cálculo, intentar dibujar en tamaño por defecto
-                    pass
+                    width = string_width(text_str, self.default_font, size)
+                    # Evitar desborde a la derecha de la página
+                    x_draw = x
+                    overflow = (x + width) - (page_w - 2)
+                    if overflow > 0:
+                        x_draw = max(2, x - overflow)
+                    canvas_obj.drawString(x_draw, y, text_str)
+                    logger.debug(f"Texto (fit) dibujado en {field_name} ({x_draw}, {y}) size={size}: {text_str}")
+                    # Restaurar tamaño por defecto para otros campos
+                    canvas_obj.setFont(self.default_font, 9)
+                    return
+            except Exception:
+                # Si falla el cálculo, se dibuja truncado en el tamaño mínimo
+                pass
             # Si no cupo, truncar conservando final (por identificadores)
             trunc = text_str[-30:]
             canvas_obj.setFont(self.default_font, 6)
             # Evitar desborde cuando se trunca también
             try:
-                from reportlab.pdfbase import pdfmetrics
-                width_t = pdfmetrics.stringWidth(trunc, self.default_font, 6)
+                width_t = string_width(trunc, self.default_font, 6)
                 x = max(2, min(x, (page_w - 2) - width_t))
             except Exception:
                 pass
@@ -636,6 +602,12 @@ class PDFFormFiller:
         vendedor = data.get('vendedor', {})
         comprador = data.get('comprador', {})
         valor_venta = data.get('valor_venta')
+        if isinstance(valor_venta, str):
+            # Los datos guardados como JSON (trabajos en segundo plano) traen el valor como texto
+            try:
+                valor_venta = Decimal(valor_venta)
+            except InvalidOperation:
+                valor_venta = None
         
         logger.info(f"Rellenando contrato de compraventa - Vendedor: {vendedor.get('nombre', 'N/A')}")
         fs = 10  # tamaño de fuente ligeramente mayor
@@ -805,10 +777,9 @@ class PDFFormFiller:
             text_str = str(text).strip().upper()[:50]  # Máximo 50 caracteres en MAYÚSCULAS
             # Medir y ajustar si se sale del ancho de la página
             try:
-                from reportlab.pdfbase import pdfmetrics
                 page_w, _ = canvas_obj._pagesize
                 canvas_obj.setFont(self.default_font, font_size)
-                width = pdfmetrics.stringWidth(text_str, self.default_font, font_size)
+                width = string_width(text_str, self.default_font, font_size)
                 overflow = (x + width) - (page_w - 2)
                 if overflow > 0:
                     x = max(2, x - overflow)
@@ -845,11 +816,10 @@ class PDFFormFiller:
             xL, yL = coords['placa_letras']
             xN, yN = coords['placa_numeros']
             # Medidas con fuente estándar
-            from reportlab.pdfbase import pdfmetrics
             page_w, _ = canvas_obj._pagesize
             canvas_obj.setFont(self.default_font, 9)
-            wL = pdfmetrics.stringWidth(str(letras), self.default_font, 9)
-            wN = pdfmetrics.stringWidth(str(numeros), self.default_font, 9)
+            wL = string_width(str(letras), self.default_font, 9)
+            wN = string_width(str(numeros), self.default_font, 9)
             # Asegura un gap mínimo entre letras y números para evitar superposición visual
             min_gap = 10  # puntos (aumentado ligeramente)
             xL_draw = xL
@@ -1021,9 +991,10 @@ class PDFFormFiller:
                 logger.error(f"La validación de datos falló: {error_message}")
                 return False
                 
-            # Obtener la ruta de la plantilla
+            # Obtener la plantilla (leída una vez por proceso, ver services.pdf_templates)
             template_path = self.get_template_path(template_type)
-            if not template_path or not os.path.exists(template_path):
+            template = get_template_registry().load(template_path) if template_path else None
+            if template is None:
                 logger.error(f"Plantilla no encontrada: {template_path}")
                 return False
             
@@ -1035,30 +1006,38 @@ class PDFFormFiller:
                 logger.error("No se pudo crear el overlay del formulario")
                 return False
             
-            # Leer la plantilla original
+            # Leer el overlay
             try:
-                template_pdf = PdfReader(open(template_path, 'rb'))
                 overlay_pdf = PdfReader(overlay)
             except Exception as e:
                 logger.error(f"Error al leer archivos PDF: {str(e)}")
                 return False
             
             # Verificar que la plantilla tenga páginas
-            if not template_pdf.pages:
+            if not template.page_count:
                 logger.error(f"La plantilla {template_path} no contiene páginas")
                 return False
             
+            engine = getattr(settings, 'PDF_FILL_ENGINE', 'merge')
+            # En modo incremental no hay PdfWriter: al guardar se copian los bytes de la
+            # plantilla y se agrega el overlay como actualización incremental
+            incremental = engine == 'incremental' and template.supports_incremental
+            
             # Crear el PDF de salida
-            output_pdf = PdfWriter()
+            output_pdf = None if incremental else PdfWriter()
             
-            # Combinar cada página de la plantilla con el overlay
-            for i, page in enumerate(template_pdf.pages):
-                # Si hay overlay para esta página, combinarlo
-                if i < len(overlay_pdf.pages):
-                    page.merge_page(overlay_pdf.pages[i])
-                    logger.debug(f"Página {i+1} combinada con overlay")
-                
-                output_pdf.add_page(page)
+            if incremental:
+                logger.debug("Overlay escrito como actualización incremental de la plantilla")
+            elif engine == 'xobject' and template.supports_xobject:
+                # Plantilla como Form XObject precalculado + flujo del overlay, sin reescribir contenido
+                template.add_xobject_pages_to(output_pdf, overlay_pdf.pages)
+            else:
+                # Combinar cada página copiada con el overlay (la plantilla compartida no se modifica)
+                for i, page in enumerate(template.add_pages_to(output_pdf)):
+                    # Si hay overlay para esta página, combinarlo
+                    if i < len(overlay_pdf.pages):
+                        page.merge_page(overlay_pdf.pages[i])
+                        logger.debug(f"Página {i+1} combinada con overlay")
             
             # Asegurar que el directorio de salida existe
             try:
@@ -1070,7 +1049,10 @@ class PDFFormFiller:
             # Guardar el resultado
             try:
                 with open(output_path, 'wb') as output_file:
-                    output_pdf.write(output_file)
+                    if incremental:
+                        template.write_incremental(output_file, overlay_pdf.pages)
+                    else:
+                        output_pdf.write(output_file)
                     
                 # Verificar que el archivo se creó correctamente
                 if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -0,0 +1,153 @@
+import io
+import os
+import logging
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+from services.form_rendering import FORM_TYPES, generated_file_name, shared_form_data
+from services.generation_cache import GenerationCache
+from services.render_pool import get_render_pool
+
+logger = logging.getLogger(__name__)
+
+# PDFs combinados de la generación en lote, servidos desde el almacenamiento
+MERGED_DIR = 'generated_forms/lotes'
+
+class BulkGenerationResult:
+    """Formularios generados (en el orden pedido) y errores por id de documento"""
+
+    def __init__(self):
+        self.forms = []
+        self.errors = {}
+        self.reused = 0
+        self.rendered = 0
+
+
+def generate_bulk(user, document_ids, form_type, shared_fields=None, pool=None):
+    """
+    Genera el mismo tipo de formulario para varios documentos del usuario con campos
+    comunes (shared_fields). Los formularios ya generados con los mismos datos se toman de
+    la caché de generación; el resto se renderiza en pool (por defecto el pool de
+    renderizado persistente del proceso, ver services.render_pool). Crea un GeneratedForm
+    por documento generado.
+    """
+    from apps.documents.models import Document
+    from apps.forms_generation.models import GeneratedForm
+
+    if form_type not in FORM_TYPES:
+        raise ValueError(f"Tipo de formulario no soportado: {form_type}")
+
+    result = BulkGenerationResult()
+    document_ids = list(dict.fromkeys(int(document_id) for document_id in document_ids))
+    documents = Document.objects.filter(user=user, id__in=document_ids).select_related('extraction')
+    documents = {document.id: document for document in documents}
+
+    cache = GenerationCache()
+    with cache.releasing_on_error([]) as held:
+        planned = []  # (documento, archivo, artefacto o None, clave, pendiente de renderizar)
+        for document_id in document_ids:
+            document = documents.get(document_id)
+            if document is None:
+                result.errors[document_id] = 'Documento no encontrado'
+                continue
+            if document.status != 'completed':
+                result.errors[document_id] = 'El documento no ha sido procesado'
+                continue
+            form_data = shared_form_data(form_type, document.get_structured_data(), shared_fields)
+            key = cache.make_key(form_type, form_data)
+            artifact = cache.acquire(key)
+            if artifact is not None:
+                held.append(artifact)
+                planned.append((document, artifact.file.name, artifact, key, None))
+                result.reused += 1
+            else:
+                planned.append((document, generated_file_name(form_type, document.id), None, key, form_data))
+
+        pending = [entry for entry in planned if entry[4] is not None]
+        outcomes = _render_all(form_type, pending, pool or get_render_pool())
+
+        forms = []
+        for document, file_name, artifact, key, form_data in planned:
+            if form_data is not None:
+                if not outcomes.get(document.id):
+                    result.errors[document.id] = 'Error al generar el PDF'
+                    continue
+                artifact = cache.store(key, form_type, file_name)
+                if artifact is not None:
+                    held.append(artifact)
+                result.rendered += 1
+            generated_form = GeneratedForm(
+                user=user,
+                document=document,
+                form_type=form_type,
+                generated_file=file_name,
+                artifact=artifact,
+            )
+            # bulk_create no llama a save(): se copian aquí la placa y la etiqueta del vehículo
+            generated_form.set_vehicle_fields()
+            forms.append(generated_form)
+
+        result.forms = GeneratedForm.objects.bulk_create(forms)
+    logger.info(
+        f"Generación en lote de {form_type}: {result.rendered} renderizados, {result.reused} desde caché, "
+        f"{len(result.errors)} con error"
+    )
+    return result
+
+
+def _render_all(form_type, pending, pool):
+    """Renderiza los pendientes y retorna {id de documento: éxito}"""
+    if not pending:
+        return {}
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'generated_forms'), exist_ok=True)
+    successes = pool.render([
+        (form_type, form_data, os.path.join(settings.MEDIA_ROOT, file_name))
+        for _, file_name, _, _, form_data in pending
+    ])
+    return {entry[0].id: success for entry, success in zip(pending, successes)}
+
+
+def write_merged_pdf(forms, stream):
+    """Escribe en stream un único PDF con las páginas de todos los formularios, en orden"""
+    writer = PdfWriter()
+    for generated_form in forms:
+        with generated_form.generated_file.open('rb') as file:
+            writer.append(PdfReader(io.BytesIO(file.read())))
+    writer.write(stream)
+
+
+def save_merged_pdf(forms, file_name):
+    """
+    Guarda el PDF combinado de forms en el almacenamiento de los formularios (pasando por
+    un archivo temporal en disco, no en memoria) y retorna su FieldFile para servirlo con
+    services.file_streaming.stream_file. De paso borra los combinados con más de
+    BULK_MERGED_PDF_RETENTION_SECONDS, que ya se descargaron.
+    """
+    from apps.forms_generation.models import GeneratedForm
+
+    field = GeneratedForm._meta.get_field('generated_file')
+    _delete_expired_merged(field.storage)
+    with tempfile.TemporaryFile() as temp:
+        write_merged_pdf(forms, temp)
+        temp.seek(0)
+        name = field.storage.save(f'{MERGED_DIR}/{file_name}', File(temp))
+    return field.attr_class(None, field, name)
+
+
+def _delete_expired_merged(storage):
+    retention = getattr(settings, 'BULK_MERGED_PDF_RETENTION_SECONDS', 3600)
+    threshold = timezone.now() - timedelta(seconds=retention)
+    try:
+        _, file_names = storage.listdir(MERGED_DIR)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for file_name in file_names:
+        name = f'{MERGED_DIR}/{file_name}'
+        try:
+            if storage.get_modified_time(name) < threshold:
+                storage.delete(name)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"No se pudo borrar el PDF combinado {name}: {e}")
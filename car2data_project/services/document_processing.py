@@ -0,0 +1,186 @@
+import os
+import logging
+import traceback
+from django.utils import timezone
+from services.pdf_extractor import PDFExtractor, get_pdf_extractor
+from services.extraction_backends import get_backend_class
+from services.extraction_cache import ExtractionCache
+from services.gemini_resilience import ModelUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DOC_TYPE_MAPPING = {
+    'matrícula': 'registration',
+    'matricula': 'registration',
+    'registro': 'registration',
+    'propiedad': 'ownership',
+    'tarjeta': 'ownership'
+}
+
+
+def process_document(document_id, use_cache=True):
+    """
+    Extrae la información de un documento y actualiza su estado.
+    Con use_cache=False se ignora la caché de extracción y se consulta siempre el modelo.
+
+    Retorna el estado final del documento ('completed' o 'error'), o None si no existe.
+    Si el modelo no está disponible deja el documento en 'pending' y lanza ModelUnavailableError.
+    """
+    return process_documents([document_id], use_cache=use_cache).get(document_id)
+
+
+def process_documents(document_ids, use_cache=True):
+    """
+    Procesa varios documentos consultando al modelo con una sola petición para todos
+    los que no estén en caché (ver PDFExtractor.extract_batch).
+    use_cache puede ser un booleano o un diccionario {document_id: booleano}.
+
+    Retorna {document_id: estado final} (None si el documento no existe). Si el modelo
+    no está disponible, los documentos sin resolver vuelven a 'pending' y se lanza
+    ModelUnavailableError.
+    """
+    from apps.documents.models import Document
+
+    if not isinstance(use_cache, dict):
+        use_cache = dict.fromkeys(document_ids, use_cache)
+
+    documents = Document.objects.select_related('user').in_bulk(document_ids)
+    backend_class = get_backend_class()
+    cache = ExtractionCache()
+    statuses = {}
+    pending = []
+
+    for document_id in document_ids:
+        document = documents.get(document_id)
+        if document is None:
+            logger.error(f"Documento {document_id} no encontrado")
+            statuses[document_id] = None
+            continue
+
+        try:
+            logger.info(f"Iniciando procesamiento en segundo plano para documento {document_id}")
+            document.status = 'processing'
+            document.save()
+            logger.info(f"Documento marcado como 'processing': {document.name}")
+
+            # Verificar que el archivo existe
+            if not document.file or not os.path.exists(document.file.path):
+                raise FileNotFoundError(f"No se pudo encontrar el archivo: {document.file.path if document.file else 'No especificado'}")
+
+            pdf_path = document.file.path
+            logger.info(f"Ruta del PDF: {pdf_path}")
+
+            # Consultar la caché de extracción antes de llamar al modelo
+            cache_key = ExtractionCache.key_for_file(pdf_path, PDFExtractor.base_prompt, backend_class.model_name)
+            extracted_data = cache.get(cache_key) if use_cache.get(document_id, True) else None
+            if extracted_data is not None:
+                logger.info(f"Usando resultado cacheado para documento {document_id}")
+                statuses[document_id] = _complete_document(document, extracted_data)
+            else:
+                pending.append((document, pdf_path, cache_key))
+
+        except FileNotFoundError as e:
+            logger.error(f"Error: Archivo no encontrado - {str(e)}")
+            statuses[document_id] = _fail_document(document, f"No se pudo encontrar el archivo: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error al procesar el documento: {str(e)}")
+            logger.error(traceback.format_exc())
+            statuses[document_id] = _fail_document(document, f"Ocurrió un error inesperado: {str(e)}")
+
+    if not pending:
+        return statuses
+
+    try:
+        # Sin llamada de prueba previa: si el circuito está abierto, el cliente del modelo
+        # lanza ModelUnavailableError (los documentos resueltos localmente no lo necesitan)
+        extractor = get_pdf_extractor()
+    except Exception as e:
+        logger.error(f"Error al procesar el documento: {str(e)}")
+        for document, _, _ in pending:
+            statuses[document.id] = _fail_document(document, f"Ocurrió un error inesperado: {str(e)}")
+        return statuses
+
+    # Extraer información con el backend configurado
+    try:
+        paths = [pdf_path for _, pdf_path, _ in pending]
+        if len(paths) == 1:
+            results = [extractor.extract_vehicle_info(paths[0])]
+        else:
+            results = extractor.extract_batch(paths)
+    except ModelUnavailableError as e:
+        # Se guardan los ya resueltos (p. ej. localmente) y el resto vuelve a pendiente;
+        # quien ejecuta el trabajo decide cuándo reintentar
+        partial_results = getattr(e, 'partial_results', None) or [None] * len(pending)
+        for (document, _, cache_key), extracted_data in zip(pending, partial_results):
+            if extracted_data is not None:
+                statuses[document.id] = _store_result(document, extracted_data, cache, cache_key, backend_class)
+                continue
+            logger.warning(f"Modelo no disponible, documento {document.id} aplazado")
+            document.status = 'pending'
+            document.save(update_fields=['status'])
+        raise
+    except Exception as e:
+        logger.error(f"Error durante el procesamiento del documento: {str(e)}")
+        logger.error(traceback.format_exc())
+        for document, _, _ in pending:
+            statuses[document.id] = _fail_document(document, f"Error al procesar el documento: {str(e)}")
+        return statuses
+
+    for (document, _, cache_key), extracted_data in zip(pending, results):
+        statuses[document.id] = _store_result(document, extracted_data, cache, cache_key, backend_class)
+
+    return statuses
+
+
+def _store_result(document, extracted_data, cache, cache_key, backend_class):
+    """Cachea y guarda el resultado de la extracción de un documento; retorna su estado final"""
+    try:
+        # Solo cachear extracciones reales, no la estructura por defecto de error
+        if not PDFExtractor.is_default_structure(extracted_data):
+            cache.set(cache_key, extracted_data, backend_class.model_name)
+        return _complete_document(document, extracted_data)
+    except Exception as e:
+        logger.error(f"Error durante el procesamiento del documento: {str(e)}")
+        logger.error(traceback.format_exc())
+        return _fail_document(document, f"Error al procesar el documento: {str(e)}")
+
+
+def _complete_document(document, extracted_data):
+    """Guarda los datos extraídos, marca el documento como completado y descuenta del plan"""
+    logger.info(f"Datos extraídos: {extracted_data}")
+
+    # Guardar los datos extraídos
+    document.set_extracted_data(extracted_data)
+
+    # Actualizar el tipo de documento si se identificó
+    if extracted_data.get('tipo_documento') and extracted_data.get('tipo_documento') != 'No identificado':
+        doc_type = extracted_data.get('tipo_documento', '').lower()
+        for key, value in DOC_TYPE_MAPPING.items():
+            if key in doc_type:
+                document.document_type = value
+                break
+
+    document.status = 'completed'
+    document.processed_at = timezone.now()
+    document.extraction_error = None
+    logger.info(f"Documento procesado exitosamente: {document.name}")
+
+    # INCREMENTAR CONTADOR DE DOCUMENTOS USADOS
+    try:
+        subscription = document.user.subscription
+        subscription.increment_documents()
+        logger.info(f"Contador incrementado. Documentos usados: {subscription.documents_used}/{subscription.get_documents_limit()}")
+    except Exception as e:
+        logger.error(f"Error al actualizar el contador de documentos: {str(e)}")
+
+    document.save()
+    return document.status
+
+
+def _fail_document(document, message):
+    """Marca el documento como fallido con el mensaje indicado"""
+    document.status = 'error'
+    document.extraction_error = message
+    document.save()
+    logger.info(f"Documento {document.id} marcado como error")
+    return document.status
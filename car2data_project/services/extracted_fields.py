@@ -0,0 +1,78 @@
+import re
+
+# Columna de ExtractedData -> (ruta en el JSON de extracción, longitud máxima)
+PROMOTED_FIELDS = {
+    'license_plate': (('informacion_vehiculo', 'placa'), 20),
+    'vin': (('informacion_vehiculo', 'vin'), 30),
+    'engine_number': (('informacion_vehiculo', 'numero_motor'), 50),
+    'make': (('informacion_vehiculo', 'marca'), 100),
+    'model': (('informacion_vehiculo', 'linea'), 100),
+    'color': (('informacion_vehiculo', 'color'), 50),
+    'owner_name': (('informacion_propietario', 'nombre'), 200),
+    'owner_document': (('informacion_propietario', 'identificacion'), 30),
+    'owner_address': (('informacion_propietario', 'direccion'), None),
+    'owner_phone': (('informacion_propietario', 'telefono'), 30),
+}
+
+# Identificadores que se normalizan para que las búsquedas exactas funcionen ("ABC-123" -> "ABC123")
+IDENTIFIER_FIELDS = {'license_plate', 'vin', 'engine_number'}
+
+
+def _value(data, path):
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return ''
+        value = value.get(key)
+    if value is None:
+        return ''
+    value = str(value).strip()
+    return '' if value == 'No disponible' else value
+
+
+def normalize_identifier(value: str) -> str:
+    """Mayúsculas y sin espacios ni guiones"""
+    return re.sub(r'[\s\-.]', '', value or '').upper()
+
+
+def normalize_document_number(value: str) -> str:
+    """Solo los dígitos del número de identificación ("C.C. 1.020.304" -> "1020304")"""
+    digits = re.sub(r'\D', '', value or '')
+    return digits or (value or '').strip()
+
+
+def parse_year(value: str):
+    match = re.search(r'(19|20)\d{2}', value or '')
+    return int(match.group()) if match else None
+
+
+def promoted_fields(data: dict) -> dict:
+    """Valores de las columnas promovidas de ExtractedData a partir del JSON de extracción"""
+    if not isinstance(data, dict):
+        data = {}
+    values = {}
+    for column, (path, max_length) in PROMOTED_FIELDS.items():
+        value = _value(data, path)
+        if column in IDENTIFIER_FIELDS:
+            value = normalize_identifier(value)
+        elif column == 'owner_document':
+            value = normalize_document_number(value)
+        values[column] = value[:max_length] if max_length else value
+    values['year'] = parse_year(_value(data, ('informacion_vehiculo', 'modelo')))
+    return values
+
+
+def compact_plate(value: str) -> str:
+    """Placa solo con letras y números, en mayúsculas (la usada en nombres de archivo)"""
+    return re.sub(r'[^A-Za-z0-9]', '', value or '').upper()
+
+
+def vehicle_label(data: dict, fallback: str = '') -> str:
+    """Etiqueta del vehículo para listados: placa, o marca y línea, o el texto alternativo"""
+    if not isinstance(data, dict):
+        data = {}
+    placa = _value(data, ('informacion_vehiculo', 'placa'))
+    if placa:
+        return placa
+    label = f"{_value(data, ('informacion_vehiculo', 'marca'))} {_value(data, ('informacion_vehiculo', 'linea'))}".strip()
+    return label or fallback
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import google.generativeai as genai
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BackendResponse:
+    """Respuesta mínima compatible con la de google.generativeai (atributo text)"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class BackendUnavailableError(ConnectionError):
+    """Fallo transitorio simulado; se trata como reintentable"""
+
+
+class ExtractionBackend:
+    """
+    Interfaz de los backends de extracción.
+
+    Un backend recibe el contenido (prompt y adjuntos) y retorna un objeto con el
+    texto de la respuesta en `.text`. `name` identifica su estado de salud y
+    `model_name` forma parte de la clave de caché de extracción.
+    """
+
+    name = ''
+    model_name = ''
+    # Si sus llamadas consumen la cuota limitada por GEMINI_REQUESTS/TOKENS_PER_MINUTE
+    rate_limited = True
+
+    def generate_content(self, content, **kwargs):
+        raise NotImplementedError
+
+    def test_connection(self) -> bool:
+        response = self.generate_content("Responde con un JSON simple: {\"test\": \"ok\"}")
+        return bool(response and response.text)
+
+
+class GeminiBackend(ExtractionBackend):
+    """Backend de producción: Gemini Vision mediante google.generativeai"""
+
+    name = 'gemini'
+    model_name = 'gemini-2.0-flash-exp'
+
+    def __init__(self):
+        self.api_key = getattr(settings, 'GEMINI_API_KEY', '')
+        if not self.api_key:
+            logger.error("La clave de API de Gemini no está configurada en los ajustes")
+            raise ValueError("La clave de API de Gemini no está configurada en los ajustes")
+        try:
+            genai.configure(api_key=self.api_key)
+            self.model = genai.GenerativeModel(self.model_name)
+            logger.info(f"Gemini configurado correctamente con {self.model_name}")
+        except Exception as e:
+            logger.error(f"Error en la respuesta de Gemini: {str(e)}")
+            raise Exception(f"Error al procesar el documento con la inteligencia artificial: {str(e)}")
+
+    def generate_content(self, content, **kwargs):
+        return self.model.generate_content(content, **kwargs)
+
+
+class LocalFixtureBackend(ExtractionBackend):
+    """
+    Backend local determinista para pruebas de carga sin red.
+
+    Responde con el JSON de EXTRACTION_FIXTURE_PATH tras EXTRACTION_FIXTURE_LATENCY
+    segundos (± EXTRACTION_FIXTURE_JITTER) y falla con probabilidad
+    EXTRACTION_FIXTURE_FAILURE_RATE. La placa se deriva del hash del PDF, de modo que
+    cada documento distinto produce un resultado distinto pero siempre el mismo.
+    """
+
+    name = 'local'
+    model_name = 'local-fixture'
+    rate_limited = False
+
+    default_fixture_path = os.path.join(os.path.dirname(__file__), 'fixtures', 'tarjeta_propiedad.json')
+
+    def __init__(self):
+        fixture_path = getattr(settings, 'EXTRACTION_FIXTURE_PATH', '') or self.default_fixture_path
+        with open(fixture_path, 'r', encoding='utf-8') as file:
+            self.fixture = json.load(file)
+        self.latency = getattr(settings, 'EXTRACTION_FIXTURE_LATENCY', 0.0)
+        self.jitter = getattr(settings, 'EXTRACTION_FIXTURE_JITTER', 0.0)
+        self.failure_rate = getattr(settings, 'EXTRACTION_FIXTURE_FAILURE_RATE', 0.0)
+        self.random = random.Random(getattr(settings, 'EXTRACTION_FIXTURE_SEED', None))
+
+    def generate_content(self, content, **kwargs):
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise BackendUnavailableError("Fallo simulado del backend local")
+
+        attachments = [part['data'] for part in self._parts(content) if isinstance(part, dict) and 'data' in part]
+        if not attachments:
+            return BackendResponse(json.dumps({'test': 'ok'}))
+
+        # Un objeto por adjunto; con varios adjuntos (lotes) se responde un arreglo
+        results = [self._fixture_for(attachment) for attachment in attachments]
+        payload = results[0] if len(results) == 1 else results
+        return BackendResponse(json.dumps(payload, ensure_ascii=False))
+
+    def _fixture_for(self, attachment):
+        data = json.loads(json.dumps(self.fixture))
+        digest = hashlib.sha256(attachment.encode('utf-8')).hexdigest()
+        data.get('informacion_vehiculo', {})['placa'] = self._plate_from_digest(digest)
+        return data
+
+    @staticmethod
+    def _parts(content):
+        return content if isinstance(content, (list, tuple)) else [content]
+
+    @staticmethod
+    def _plate_from_digest(digest):
+        letters = ''.join(chr(ord('A') + int(digest[i:i + 2], 16) % 26) for i in range(0, 6, 2))
+        digits = ''.join(str(int(digest[i], 16) % 10) for i in range(6, 9))
+        return letters + digits
+
+
+EXTRACTION_BACKENDS = {
+    'gemini': GeminiBackend,
+    'local': LocalFixtureBackend,
+}
+
+
+def get_backend_class():
+    """
+    Clase del backend configurado en EXTRACTION_BACKEND: un nombre registrado
+    ('gemini', 'local') o la ruta importable de una subclase de ExtractionBackend.
+    """
+    backend = getattr(settings, 'EXTRACTION_BACKEND', 'gemini')
+    if backend in EXTRACTION_BACKENDS:
+        return EXTRACTION_BACKENDS[backend]
+    return import_string(backend)
+
+
+def get_extraction_backend() -> ExtractionBackend:
+    """Crea una instancia del backend configurado"""
+    return get_backend_class()()
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """
+    Caché persistente de resultados de extracción.
+
+    La clave es el SHA-256 de los bytes del PDF junto con el prompt y la versión del
+    modelo, de modo que un cambio en cualquiera de ellos invalida las entradas previas.
+    Los contadores de aciertos/fallos son por proceso; cada entrada guarda además su
+    propio número de aciertos en la base de datos.
+    """
+
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'EXTRACTION_CACHE_ENABLED', True)
+        self.ttl_seconds = getattr(settings, 'EXTRACTION_CACHE_TTL_SECONDS', 30 * 24 * 3600)
+        self.max_entries = getattr(settings, 'EXTRACTION_CACHE_MAX_ENTRIES', 5000)
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, prompt: str, model_name: str) -> str:
+        """Calcula la clave de caché para un PDF, prompt y modelo"""
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(pdf_bytes).digest())
+        digest.update(hashlib.sha256(prompt.encode('utf-8')).digest())
+        digest.update(model_name.encode('utf-8'))
+        return digest.hexdigest()
+
+    @classmethod
+    def key_for_file(cls, pdf_path: str, prompt: str, model_name: str) -> str:
+        """Calcula la clave de caché leyendo el PDF desde disco"""
+        with open(pdf_path, 'rb') as file:
+            return cls.make_key(file.read(), prompt, model_name)
+
+    def get(self, key: str):
+        """Retorna los datos cacheados para la clave o None si no hay entrada válida"""
+        from apps.documents.models import ExtractionCacheEntry
+
+        if not self.enabled:
+            return None
+
+        entry = ExtractionCacheEntry.objects.filter(key=key).first()
+        if entry is None or self._is_expired(entry):
+            self._record(hit=False)
+            return None
+
+        ExtractionCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now(),
+        )
+        self._record(hit=True)
+        logger.info(f"Acierto en caché de extracción: {key[:12]}...")
+        return entry.data
+
+    def set(self, key: str, data: dict, model_name: str = ''):
+        """Guarda el resultado de una extracción y aplica la política de expulsión"""
+        from apps.documents.models import ExtractionCacheEntry
+
+        if not self.enabled:
+            return
+
+        ExtractionCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'data': data,
+                'model_name': model_name,
+                'hit_count': 0,
+                'created_at': timezone.now(),
+                'last_used_at': timezone.now(),
+            },
+        )
+        self.evict()
+
+    def delete(self, key: str):
+        """Elimina una entrada concreta de la caché"""
+        from apps.documents.models import ExtractionCacheEntry
+        ExtractionCacheEntry.objects.filter(key=key).delete()
+
+    def evict(self) -> int:
+        """Elimina entradas expiradas y las menos usadas si se supera el tamaño máximo"""
+        from apps.documents.models import ExtractionCacheEntry
+
+        removed, _ = ExtractionCacheEntry.objects.filter(created_at__lt=self._expiry_threshold()).delete()
+
+        overflow = ExtractionCacheEntry.objects.count() - self.max_entries
+        if overflow > 0:
+            stale_ids = list(
+                ExtractionCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+            )
+            deleted, _ = ExtractionCacheEntry.objects.filter(pk__in=stale_ids).delete()
+            removed += deleted
+
+        if removed:
+            logger.info(f"Caché de extracción: {removed} entradas expulsadas")
+        return removed
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Retorna los contadores de aciertos y fallos del proceso actual"""
+        with cls._lock:
+            total = cls._hits + cls._misses
+            return {
+                'hits': cls._hits,
+                'misses': cls._misses,
+                'hit_ratio': (cls._hits / total) if total else 0.0,
+            }
+
+    @classmethod
+    def _record(cls, hit: bool):
+        with cls._lock:
+            if hit:
+                cls._hits += 1
+            else:
+                cls._misses += 1
+
+    def _expiry_threshold(self):
+        return timezone.now() - timedelta(seconds=self.ttl_seconds)
+
+    def _is_expired(self, entry) -> bool:
+        return entry.created_at < self._expiry_threshold()
@@ -0,0 +1,375 @@
+import os
+import socket
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from services.document_processing import process_document, process_documents
+from services.extraction_scheduler import ExtractionScheduler, get_user_plan
+from services.gemini_resilience import ModelUnavailableError
+from services.status_events import publish_document_status
+from services.user_stats import invalidate_user_stats
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_extraction(document, use_cache=True, priority=0):
+    """
+    Registra un trabajo de extracción para el documento con el plan actual del usuario.
+    Si los workers corren dentro del proceso web, se asegura de que el pool esté activo.
+    """
+    from apps.documents.models import ExtractionJob
+
+    job = ExtractionJob.objects.create(
+        document=document,
+        user=document.user,
+        plan=get_user_plan(document.user),
+        use_cache=use_cache,
+        priority=priority,
+    )
+    logger.info(f"Trabajo de extracción {job.id} encolado para documento {document.id} (plan={job.plan})")
+
+    if getattr(settings, 'EXTRACTION_WORKERS_IN_PROCESS', True):
+        pool = get_worker_pool()
+        pool.start()
+        pool.notify()
+    return job
+
+
+def claim_next_job(worker_name):
+    """
+    Reserva el siguiente trabajo según el planificador (plan, antigüedad y equidad por usuario).
+    La reserva es una actualización condicional, segura con varios workers y procesos.
+    """
+    return ExtractionScheduler().claim_next(worker_name)
+
+
+def claim_next_batch(worker_name):
+    """
+    Reserva los trabajos a procesar juntos: hasta EXTRACTION_BATCH_SIZE, esperando como
+    máximo EXTRACTION_BATCH_MAX_WAIT segundos a completar el lote. Con tamaño 1 equivale
+    a claim_next_job.
+    """
+    size = getattr(settings, 'EXTRACTION_BATCH_SIZE', 1)
+    if size <= 1:
+        job = claim_next_job(worker_name)
+        return [job] if job else []
+    return ExtractionScheduler().claim_batch(
+        worker_name, size, max_wait=getattr(settings, 'EXTRACTION_BATCH_MAX_WAIT', 2.0)
+    )
+
+
+def park_job(job, retry_after=None, error=''):
+    """
+    Devuelve el trabajo a la cola sin marcarlo fallido, disponible tras retry_after segundos.
+    Tras EXTRACTION_JOB_MAX_ATTEMPTS intentos se marca como fallido.
+    """
+    from apps.documents.models import Document
+
+    max_attempts = getattr(settings, 'EXTRACTION_JOB_MAX_ATTEMPTS', 10)
+    if job.attempts >= max_attempts:
+        job.status = 'failed'
+        job.error = f"Modelo no disponible tras {job.attempts} intentos: {error}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        Document.objects.filter(id=job.document_id).update(
+            status='error',
+            extraction_error="El servicio de inteligencia artificial no está disponible. Inténtalo de nuevo más tarde.",
+        )
+        # update() no emite señales
+        invalidate_user_stats(job.user_id)
+        document = Document.objects.filter(id=job.document_id).first()
+        if document is not None:
+            publish_document_status(document)
+        return job
+
+    if retry_after is None:
+        retry_after = getattr(settings, 'MODEL_HEALTH_PROBE_INTERVAL', 60)
+    job.status = 'queued'
+    job.worker = ''
+    job.started_at = None
+    job.lease_expires_at = None
+    job.error = str(error)
+    job.available_at = timezone.now() + timedelta(seconds=retry_after)
+    job.save(update_fields=['status', 'worker', 'started_at', 'lease_expires_at', 'error', 'available_at'])
+    logger.info(f"Trabajo {job.id} aplazado {retry_after:.0f}s: {error}")
+    return job
+
+
+def run_job(job):
+    """Ejecuta un trabajo reservado y registra su resultado"""
+    try:
+        final_status = process_document(job.document_id, use_cache=job.use_cache)
+    except ModelUnavailableError as e:
+        return park_job(job, retry_after=e.retry_after, error=str(e))
+    except Exception as e:
+        logger.exception(f"Error no controlado en trabajo {job.id}")
+        final_status = 'error'
+        job.error = str(e)
+    return finish_job(job, final_status)
+
+
+def run_batch(jobs):
+    """Ejecuta un lote de trabajos reservados con una sola petición al modelo"""
+    from apps.documents.models import Document
+
+    if len(jobs) == 1:
+        return [run_job(jobs[0])]
+
+    document_ids = [job.document_id for job in jobs]
+    deferred = None
+    try:
+        statuses = process_documents(document_ids, use_cache={job.document_id: job.use_cache for job in jobs})
+    except ModelUnavailableError as e:
+        # Los documentos ya resueltos (p. ej. desde caché) conservan su estado
+        deferred = e
+        statuses = dict(Document.objects.filter(id__in=document_ids).values_list('id', 'status'))
+    except Exception as e:
+        logger.exception(f"Error no controlado en lote de {len(jobs)} trabajos")
+        statuses = {}
+        for job in jobs:
+            job.error = str(e)
+
+    for job in jobs:
+        status = statuses.get(job.document_id)
+        if deferred is not None and status == 'pending':
+            park_job(job, retry_after=deferred.retry_after, error=str(deferred))
+        else:
+            finish_job(job, status)
+    return jobs
+
+
+def finish_job(job, final_status):
+    """Registra el resultado de un trabajo según el estado final de su documento"""
+    job.status = 'done' if final_status == 'completed' else 'failed'
+    if job.status == 'failed' and not job.error:
+        job.document.refresh_from_db(fields=['extraction_error'])
+        job.error = job.document.extraction_error or 'Error en la extracción'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def renew_leases(job_ids, worker_name, lease_seconds=None):
+    """Extiende la reserva de los trabajos que el worker sigue ejecutando"""
+    from apps.documents.models import ExtractionJob
+
+    if lease_seconds is None:
+        lease_seconds = getattr(settings, 'EXTRACTION_JOB_LEASE_SECONDS', 90)
+    return ExtractionJob.objects.filter(id__in=job_ids, status='running', worker=worker_name).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds)
+    )
+
+
+class JobLease:
+    """
+    Renueva, en un thread aparte, la reserva de los trabajos mientras el worker los ejecuta
+    (cada tercio de EXTRACTION_JOB_LEASE_SECONDS). Así un trabajo que sigue en curso, p. ej.
+    esperando los reintentos del modelo, no se retoma ni se cobra dos veces; si el proceso
+    muere deja de renovarse y recover_stale_jobs lo devuelve a la cola al vencer.
+    """
+
+    def __init__(self, jobs, worker_name, lease_seconds=None):
+        self.job_ids = [job.id for job in jobs]
+        self.worker_name = worker_name
+        self.lease_seconds = lease_seconds or getattr(settings, 'EXTRACTION_JOB_LEASE_SECONDS', 90)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._renew_loop, name=f"lease-{worker_name}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _renew_loop(self):
+        try:
+            while not self._stopped.wait(self.lease_seconds / 3):
+                try:
+                    renew_leases(self.job_ids, self.worker_name, self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f"No se pudo renovar la reserva de {self.job_ids}: {e}")
+        finally:
+            connection.close()
+
+
+def is_dead_local_worker(worker):
+    """
+    True si el worker (host:pid:índice) es de este host y su proceso ya no existe:
+    sus trabajos en ejecución quedaron abandonados por una caída o un reinicio
+    """
+    host, _, rest = worker.partition(':')
+    pid = rest.split(':', 1)[0]
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def recover_stale_jobs(stale_after=None):
+    """
+    Devuelve a la cola los trabajos que quedaron en ejecución: los de procesos de este
+    host que ya no existen, de inmediato, y los de cualquier host cuya reserva venció
+    (su worker dejó de renovarla, ver JobLease). Encola también los documentos pendientes
+    que llevan más de stale_after segundos sin trabajo asociado.
+    """
+    from apps.documents.models import Document, ExtractionJob
+
+    if stale_after is None:
+        stale_after = getattr(settings, 'EXTRACTION_JOB_STALE_SECONDS', 600)
+    now = timezone.now()
+    threshold = now - timedelta(seconds=stale_after)
+
+    running = ExtractionJob.objects.filter(status='running')
+    dead_workers = [
+        worker for worker in running.values_list('worker', flat=True).distinct()
+        if is_dead_local_worker(worker)
+    ]
+    requeued = running.filter(
+        Q(lease_expires_at__lt=now)
+        | Q(worker__in=dead_workers)
+        # Reservados sin plazo (antes de existir la renovación)
+        | Q(lease_expires_at__isnull=True, started_at__lt=threshold)
+    ).update(status='queued', worker='', started_at=None, lease_expires_at=None)
+
+    active_jobs = ExtractionJob.objects.filter(status__in=['queued', 'running'])
+    orphans = Document.objects.filter(
+        status__in=['pending', 'processing'],
+        uploaded_at__lt=threshold,
+    ).exclude(id__in=active_jobs.values('document_id'))
+    orphan_jobs = [
+        ExtractionJob(document=document, user=document.user, plan=get_user_plan(document.user))
+        for document in orphans.select_related('user__subscription')
+    ]
+    ExtractionJob.objects.bulk_create(orphan_jobs)
+
+    if requeued or orphan_jobs:
+        logger.warning(
+            f"Recuperación de trabajos: {requeued} reencolados, {len(orphan_jobs)} documentos huérfanos encolados"
+        )
+    return requeued + len(orphan_jobs)
+
+
+class ExtractionWorkerPool:
+    """
+    Pool de tamaño fijo que consume la tabla de trabajos de extracción.
+    Puede ejecutarse dentro del proceso web o en un proceso dedicado (run_extraction_workers).
+    """
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or getattr(settings, 'EXTRACTION_WORKER_CONCURRENCY', 2)
+        self.poll_interval = poll_interval or getattr(settings, 'EXTRACTION_JOB_POLL_INTERVAL', 2)
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.recovery_interval = getattr(settings, 'EXTRACTION_JOB_RECOVERY_INTERVAL', 60)
+        self._next_recovery = 0.0
+
+    @property
+    def is_running(self):
+        return self._pid == os.getpid() and any(t.is_alive() for t in self._threads)
+
+    def start(self, recover=True):
+        """Arranca los threads del pool (idempotente por proceso)"""
+        with self._lock:
+            if self.is_running:
+                return
+            if recover:
+                try:
+                    recover_stale_jobs()
+                except Exception as e:
+                    logger.error(f"No se pudieron recuperar los trabajos pendientes: {e}")
+
+            self._pid = os.getpid()
+            self._next_recovery = time.monotonic() + self.recovery_interval
+            self._stopping.clear()
+            prefix = f"{socket.gethostname()}:{self._pid}"
+            self._threads = [
+                threading.Thread(
+                    target=self._worker_loop,
+                    args=(f"{prefix}:{index}",),
+                    name=f"extraction-worker-{index}",
+                    daemon=True,
+                )
+                for index in range(self.concurrency)
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"Pool de extracción iniciado con {self.concurrency} workers ({prefix})")
+
+    def notify(self):
+        """Despierta a los workers en espera para que revisen la cola"""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Detiene el pool esperando a que terminen los trabajos en curso"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info("Pool de extracción detenido")
+
+    def _recover_periodically(self):
+        """
+        Revisión periódica de trabajos abandonados, hecha por un solo worker del pool cada
+        EXTRACTION_JOB_RECOVERY_INTERVAL segundos: sin ella, los trabajos de un proceso
+        caído esperarían al próximo arranque del pool
+        """
+        with self._lock:
+            if time.monotonic() < self._next_recovery:
+                return
+            self._next_recovery = time.monotonic() + self.recovery_interval
+        try:
+            if recover_stale_jobs():
+                self.notify()
+        except Exception as e:
+            logger.error(f"Error en la revisión de trabajos abandonados: {e}")
+
+    def _worker_loop(self, worker_name):
+        while not self._stopping.is_set():
+            close_old_connections()
+            self._recover_periodically()
+            jobs = []
+            try:
+                jobs = claim_next_batch(worker_name)
+            except Exception as e:
+                logger.error(f"Error reservando trabajo en {worker_name}: {e}")
+
+            if not jobs:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            logger.info(
+                f"{worker_name} procesando trabajos {[job.id for job in jobs]} "
+                f"(documentos {[job.document_id for job in jobs]})"
+            )
+            with JobLease(jobs, worker_name):
+                run_batch(jobs)
+        close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Retorna el pool compartido del proceso, creándolo al primer uso"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExtractionWorkerPool()
+        return _pool
@@ -0,0 +1,209 @@
+import time
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, F, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Peso base de cada plan; un peso mayor adelanta los trabajos en la cola
+DEFAULT_PLAN_WEIGHTS = {
+    'enterprise': 3,
+    'pro': 2,
+    'starter': 1,
+}
+
+
+def get_user_plan(user):
+    """Retorna el plan activo del usuario ('starter' si no tiene suscripción activa)"""
+    try:
+        subscription = user.subscription
+        if subscription.is_active:
+            return subscription.plan
+    except Exception:
+        pass
+    return 'starter'
+
+
+class ExtractionScheduler:
+    """
+    Decide qué trabajo de extracción se ejecuta a continuación.
+
+    La puntuación de cada trabajo combina:
+    - el peso del plan del usuario (enterprise > pro > starter),
+    - la prioridad explícita del trabajo,
+    - el envejecimiento: cada EXTRACTION_AGING_SECONDS de espera suma un punto, de modo
+      que los trabajos de planes gratuitos acaban adelantando a los nuevos de pago,
+    - una penalización por cada trabajo que el usuario ya tiene en ejecución.
+
+    Además, ningún usuario puede superar EXTRACTION_MAX_RUNNING_PER_USER trabajos
+    simultáneos y los trabajos que superan EXTRACTION_MAX_WAIT_SECONDS pasan al frente.
+    """
+
+    # Trabajos que se consideran por usuario en cada decisión (los de mayor prioridad y más
+    # antiguos); por usuario y no por plan, para que un lote grande de un usuario no oculte
+    # los trabajos de los demás
+    candidates_per_user = 10
+
+    def __init__(self):
+        self.plan_weights = getattr(settings, 'EXTRACTION_PLAN_WEIGHTS', DEFAULT_PLAN_WEIGHTS)
+        self.aging_seconds = getattr(settings, 'EXTRACTION_AGING_SECONDS', 60)
+        self.max_wait_seconds = getattr(settings, 'EXTRACTION_MAX_WAIT_SECONDS', 900)
+        self.max_running_per_user = getattr(settings, 'EXTRACTION_MAX_RUNNING_PER_USER', 2)
+        self.fairness_penalty = getattr(settings, 'EXTRACTION_FAIRNESS_PENALTY', 1.0)
+        self.lease_seconds = getattr(settings, 'EXTRACTION_JOB_LEASE_SECONDS', 90)
+
+    def score(self, job, now, running_for_user=0):
+        """Calcula la puntuación de un trabajo en cola (mayor = antes)"""
+        waited = (now - job.created_at).total_seconds()
+        if waited >= self.max_wait_seconds:
+            # Anti-inanición: los trabajos que esperaron demasiado se atienden primero
+            return float('inf'), waited
+        score = (
+            self.plan_weights.get(job.plan, 1)
+            + job.priority
+            + waited / self.aging_seconds
+            - running_for_user * self.fairness_penalty
+        )
+        return score, waited
+
+    def ordered_candidates(self, exempt_user_id=None):
+        """
+        Retorna los trabajos en cola ordenados por puntuación, respetando el límite por usuario
+        (salvo para exempt_user_id, usado al completar un lote con trabajos del mismo usuario).
+        """
+        from apps.documents.models import ExtractionJob
+
+        now = timezone.now()
+        running = dict(
+            ExtractionJob.objects.filter(status='running')
+            .values('user_id')
+            .annotate(total=Count('id'))
+            .values_list('user_id', 'total')
+        )
+
+        queued = ExtractionJob.objects.filter(status='queued').filter(
+            Q(available_at__isnull=True) | Q(available_at__lte=now)
+        )
+        ranked = queued.annotate(
+            user_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('user_id')],
+                order_by=[F('priority').desc(), F('created_at').asc()],
+            )
+        ).filter(user_rank__lte=self.candidates_per_user)
+        # Los que superan la espera máxima son candidatos siempre, sin importar su posición
+        overdue = queued.filter(created_at__lte=now - timedelta(seconds=self.max_wait_seconds))
+        candidates = {job.id: job for job in ranked}
+        candidates.update((job.id, job) for job in overdue.exclude(id__in=list(candidates)))
+        candidates = candidates.values()
+
+        scored = []
+        for job in candidates:
+            running_for_user = running.get(job.user_id, 0)
+            if job.user_id and job.user_id != exempt_user_id and running_for_user >= self.max_running_per_user:
+                continue
+            score, waited = self.score(job, now, running_for_user)
+            scored.append((score, waited, job))
+
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return [job for _, _, job in scored]
+
+    def claim_next(self, worker_name, exempt_user_id=None):
+        """Reserva el trabajo con mayor puntuación mediante una actualización condicional"""
+        from apps.documents.models import ExtractionJob
+
+        for job in self.ordered_candidates(exempt_user_id=exempt_user_id):
+            now = timezone.now()
+            claimed = ExtractionJob.objects.filter(id=job.id, status='queued').update(
+                status='running',
+                worker=worker_name,
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                logger.debug(f"Trabajo {job.id} reservado por {worker_name} (plan={job.plan})")
+                return ExtractionJob.objects.select_related('document').get(id=job.id)
+        return None
+
+    def claim_batch(self, worker_name, size, max_wait=0.0, poll_interval=0.2):
+        """
+        Reserva hasta size trabajos para procesarlos en una sola petición al modelo.
+        Tras reservar el primero espera como máximo max_wait segundos a que lleguen más;
+        los trabajos del mismo usuario que el primero no cuentan para su límite de concurrencia.
+        """
+        first = self.claim_next(worker_name)
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < size:
+            job = self.claim_next(worker_name, exempt_user_id=first.user_id)
+            if job is not None:
+                batch.append(job)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(poll_interval, remaining))
+        return batch
+
+    def queue_stats(self, window_seconds=3600):
+        """
+        Estadísticas por plan: profundidad de la cola, trabajos en ejecución, aplazados,
+        espera actual (media y máxima) y espera media de los trabajos iniciados en la ventana.
+        """
+        from apps.documents.models import ExtractionJob
+
+        now = timezone.now()
+        stats = defaultdict(lambda: {
+            'queued': 0,
+            'running': 0,
+            'oldest_wait_seconds': 0.0,
+            'avg_queued_wait_seconds': 0.0,
+            'avg_start_wait_seconds': None,
+            'started_in_window': 0,
+            'parked': 0,
+        })
+
+        status_counts = (
+            ExtractionJob.objects.filter(status__in=['queued', 'running'])
+            .values('plan', 'status')
+            .annotate(total=Count('id'), oldest=Min('created_at'))
+        )
+        for row in status_counts:
+            entry = stats[row['plan']]
+            entry[row['status']] = row['total']
+            if row['status'] == 'queued' and row['oldest']:
+                entry['oldest_wait_seconds'] = (now - row['oldest']).total_seconds()
+
+        queued_waits = defaultdict(list)
+        for plan, created_at in ExtractionJob.objects.filter(status='queued').values_list('plan', 'created_at'):
+            queued_waits[plan].append((now - created_at).total_seconds())
+        for plan, waits in queued_waits.items():
+            stats[plan]['avg_queued_wait_seconds'] = sum(waits) / len(waits)
+
+        parked = (
+            ExtractionJob.objects.filter(status='queued', available_at__gt=now)
+            .values('plan')
+            .annotate(total=Count('id'))
+        )
+        for row in parked:
+            stats[row['plan']]['parked'] = row['total']
+
+        window_start = now - timedelta(seconds=window_seconds)
+        start_waits = defaultdict(list)
+        started = ExtractionJob.objects.filter(started_at__gte=window_start).values_list('plan', 'created_at', 'started_at')
+        for plan, created_at, started_at in started:
+            start_waits[plan].append((started_at - created_at).total_seconds())
+        for plan, waits in start_waits.items():
+            stats[plan]['avg_start_wait_seconds'] = sum(waits) / len(waits)
+            stats[plan]['started_in_window'] = len(waits)
+
+        # Incluir todos los planes aunque no tengan trabajos
+        return {plan: stats[plan] for plan in set(self.plan_weights) | set(stats)}
@@ -0,0 +1,221 @@
+import re
+import time
+import hashlib
+import logging
+import zipfile
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(name: str, size: int, modified) -> str:
+    """ETag fuerte a partir del nombre, tamaño y fecha de modificación del archivo"""
+    stamp = modified.timestamp() if modified else 0
+    digest = hashlib.sha1(f'{name}:{size}:{stamp}'.encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def parse_range(header: str, size: int):
+    """
+    Interpreta una cabecera Range de un solo intervalo. Retorna (inicio, fin) inclusivos,
+    None si la cabecera no aplica (se envía el archivo completo) o 'invalid' si el
+    intervalo no se puede satisfacer.
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match:
+        # Varios intervalos u otras unidades: se responde con el archivo completo
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Sufijo: los últimos N bytes
+        length = int(last)
+        if length == 0:
+            return 'invalid'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'invalid'
+    return start, end
+
+
+def _range_applies(request, etag: str, last_modified) -> bool:
+    """If-Range: solo se respeta Range si el archivo no cambió desde la copia parcial del cliente"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and last_modified is not None and int(last_modified) <= since
+
+
+def _read_range(file, start: int, length: int):
+    """Lee el intervalo por bloques; el archivo se cierra aunque el cliente corte la descarga"""
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _offload_response(storage, name: str):
+    """
+    Respuesta vacía para que el servidor web envíe el archivo (FILE_DOWNLOAD_OFFLOAD):
+    'x-accel' (nginx, con FILE_DOWNLOAD_ACCEL_PREFIX como location interna) o
+    'x-sendfile' (Apache/lighttpd, requiere ruta local). None si no aplica.
+    """
+    mode = getattr(settings, 'FILE_DOWNLOAD_OFFLOAD', '')
+    if mode == 'x-accel':
+        prefix = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name.lstrip('/')
+        return response
+    if mode == 'x-sendfile':
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            return None
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def stream_file(request, field_file, filename: str, content_type: str = 'application/pdf', as_attachment: bool = True):
+    """
+    Sirve un archivo del almacenamiento sin cargarlo completo en memoria:
+    - ETag / Last-Modified con respuestas 304 (y 412 para If-Match),
+    - un intervalo Range con respuesta 206 (416 si no es satisfacible),
+    - delegación opcional al servidor web (X-Accel-Redirect / X-Sendfile).
+
+    Lanza FileNotFoundError si el archivo no existe en el almacenamiento.
+    """
+    storage, name = field_file.storage, field_file.name
+    if not name or not storage.exists(name):
+        raise FileNotFoundError(name)
+
+    size = storage.size(name)
+    try:
+        modified = storage.get_modified_time(name)
+    except (NotImplementedError, OSError):
+        modified = None
+    last_modified = int(modified.timestamp()) if modified else None
+    etag = file_etag(name, size, modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    response = _offload_response(storage, name)
+    if response is None:
+        byte_range = None
+        if request.method in ('GET', 'HEAD') and 'HTTP_RANGE' in request.META and _range_applies(request, etag, last_modified):
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+        if byte_range == 'invalid':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        file = storage.open(name, 'rb')
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+            response.block_size = CHUNK_SIZE
+            response['Content-Length'] = str(size)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_read_range(file, start, length), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+    else:
+        response['Content-Type'] = content_type
+
+    response['Accept-Ranges'] = 'bytes'
+    # Archivos por usuario: el navegador los guarda pero los revalida con ETag
+    response['Cache-Control'] = 'private, no-cache'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+class _ChunkBuffer:
+    """
+    Destino de escritura sin tell()/seek(): zipfile lo trata como flujo no posicionable y
+    escribe cada entrada con descriptor de datos, sin volver atrás a corregir cabeceras.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries):
+    """
+    Genera un ZIP por bloques a partir de (nombre_en_zip, FieldFile), leyendo cada archivo
+    del almacenamiento de a CHUNK_SIZE. Las entradas van sin comprimir (ZIP_STORED): los PDF
+    ya están comprimidos y así el costo es solo de copia. Los nombres repetidos reciben un
+    sufijo numérico; los archivos que ya no existen se omiten.
+    """
+    buffer = _ChunkBuffer()
+    used_names = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, field_file in entries:
+            storage, name = field_file.storage, field_file.name
+            if not name or not storage.exists(name):
+                logger.warning(f"Archivo omitido del ZIP, no existe: {name}")
+                continue
+
+            stem, dot, extension = arcname.rpartition('.')
+            if not dot:
+                stem, extension = arcname, ''
+            candidate, counter = arcname, 1
+            while candidate in used_names:
+                counter += 1
+                candidate = f'{stem}_{counter}{dot}{extension}'
+            used_names.add(candidate)
+
+            info = zipfile.ZipInfo(candidate, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            # Con el tamaño conocido zipfile decide si la entrada necesita ZIP64
+            info.file_size = storage.size(name)
+            with storage.open(name, 'rb') as source, archive.open(info, 'w') as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    yield buffer.take()
+            yield buffer.take()
+    yield buffer.take()
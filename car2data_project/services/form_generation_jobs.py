@@ -0,0 +1,242 @@
+import os
+import socket
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from services.extraction_queue import is_dead_local_worker
+from services.form_rendering import generated_file_name, render_form_to_path
+from services.generation_cache import GenerationCache
+from services.status_events import publish_form_job_status
+
+logger = logging.getLogger(__name__)
+
+
+def executor_name():
+    """Identificador (host:pid) del proceso cuyo executor ejecuta los trabajos que envía"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def generate_form(document, form_type, form_data):
+    """
+    Genera el PDF del formulario con form_data y crea su GeneratedForm. Si ya se generó
+    un PDF con los mismos datos y plantilla, reutiliza su archivo sin renderizar (ver
+    services.generation_cache). Retorna el GeneratedForm, o None si falló el renderizado.
+    """
+    from apps.forms_generation.models import GeneratedForm
+
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'generated_forms'), exist_ok=True)
+
+    cache = GenerationCache()
+    cache_key = cache.make_key(form_type, form_data)
+    with cache.releasing_on_error([]) as held:
+        artifact = cache.acquire(cache_key)
+
+        if artifact is not None:
+            held.append(artifact)
+            file_name = artifact.file.name
+        else:
+            file_name = generated_file_name(form_type, document.id)
+            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+
+            if not render_form_to_path(form_type, form_data, file_path):
+                logger.error(f"Fallo en la generación del PDF: {form_type}")
+                return None
+
+            artifact = cache.store(cache_key, form_type, file_name)
+            if artifact is not None:
+                held.append(artifact)
+            logger.info(f"Documento PDF generado exitosamente: {file_path}")
+
+        return GeneratedForm.objects.create(
+            user=document.user,
+            document=document,
+            form_type=form_type,
+            generated_file=file_name,
+            artifact=artifact,
+        )
+
+
+def enqueue_form_generation(document, form_type, form_data):
+    """
+    Registra un trabajo de generación con los datos del formulario y lo envía al executor
+    del proceso cuando se confirma la transacción. Con FORM_GENERATION_ASYNC=False se
+    ejecuta en la misma petición. Retorna el FormGenerationJob.
+    """
+    from apps.forms_generation.models import FormGenerationJob
+
+    job = FormGenerationJob.objects.create(
+        user=document.user,
+        document=document,
+        form_type=form_type,
+        payload=form_data,
+        worker=executor_name(),
+    )
+    publish_form_job_status(job)
+    logger.info(f"Trabajo de generación {job.id} encolado: {form_type} para documento {document.id}")
+
+    if getattr(settings, 'FORM_GENERATION_ASYNC', True):
+        transaction.on_commit(lambda: get_generation_executor().submit(job.id))
+    else:
+        run_generation_job(job.id)
+        job.refresh_from_db()
+    return job
+
+
+def run_generation_job(job_id):
+    """
+    Ejecuta un trabajo pendiente y registra su resultado. La reserva es una actualización
+    condicional: si otro thread o proceso ya lo tomó, no hace nada y retorna None.
+    """
+    from apps.forms_generation.models import FormGenerationJob
+
+    claimed = FormGenerationJob.objects.filter(id=job_id, status='pending').update(
+        status='processing', started_at=timezone.now(), worker=executor_name()
+    )
+    if not claimed:
+        return None
+
+    job = FormGenerationJob.objects.select_related('document__user').get(id=job_id)
+    publish_form_job_status(job)
+    try:
+        # payload viene de JSON: fechas y valores como texto, igual que en la clave de caché
+        generated_form = generate_form(job.document, job.form_type, job.payload)
+        job.error = '' if generated_form else 'Error al generar el PDF'
+    except Exception as e:
+        logger.exception(f"Error no controlado en trabajo de generación {job.id}")
+        generated_form = None
+        job.error = str(e)
+
+    job.status = 'completed' if generated_form else 'error'
+    job.generated_form = generated_form
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'generated_form', 'error', 'finished_at'])
+    publish_form_job_status(job)
+    logger.info(f"Trabajo de generación {job.id}: {job.status}")
+    return job
+
+
+def recover_stale_jobs(stale_after=None):
+    """
+    Toma para este proceso los trabajos sin terminar que ningún executor vivo tiene: los
+    de procesos de este host que ya no existen, de inmediato, y los de cualquier host que
+    llevan más de stale_after segundos sin avanzar. Los que estaban generándose vuelven a
+    pendiente. Retorna sus ids para enviarlos al executor.
+    """
+    from apps.forms_generation.models import FormGenerationJob
+
+    if stale_after is None:
+        stale_after = getattr(settings, 'FORM_GENERATION_STALE_SECONDS', 600)
+    threshold = timezone.now() - timedelta(seconds=stale_after)
+
+    unfinished = FormGenerationJob.objects.filter(status__in=['pending', 'processing'])
+    dead_workers = [
+        worker for worker in unfinished.values_list('worker', flat=True).distinct()
+        if is_dead_local_worker(worker)
+    ]
+    orphaned = unfinished.filter(
+        Q(worker__in=dead_workers)
+        | Q(status='processing', started_at__lt=threshold)
+        | Q(status='pending', created_at__lt=threshold)
+    )
+    requeued = list(orphaned.filter(status='processing').values_list('id', flat=True))
+    waiting = list(orphaned.filter(status='pending').values_list('id', flat=True))
+    FormGenerationJob.objects.filter(id__in=requeued, status='processing').update(status='pending', started_at=None)
+    FormGenerationJob.objects.filter(id__in=requeued + waiting, status='pending').update(worker=executor_name())
+    if requeued or waiting:
+        logger.warning(f"Recuperación de generación: {len(requeued)} reencolados, {len(waiting)} pendientes")
+    return requeued + waiting
+
+
+def resubmit_if_orphaned(job):
+    """
+    Si el trabajo sigue sin terminar pero su proceso ya no existe, o lleva más de
+    FORM_GENERATION_STALE_SECONDS sin avanzar, lo reencola en el executor de este proceso.
+    Lo usan la página de progreso y la consulta de estado para que la espera no sea
+    infinita tras la caída de un proceso. La toma es condicional: si otro proceso lo
+    retomó antes, no hace nada. Retorna True si se reencoló.
+    """
+    from apps.forms_generation.models import FormGenerationJob
+
+    if job.is_finished or not getattr(settings, 'FORM_GENERATION_ASYNC', True):
+        return False
+    stale_after = getattr(settings, 'FORM_GENERATION_STALE_SECONDS', 600)
+    waited = (timezone.now() - (job.started_at or job.created_at)).total_seconds()
+    if not is_dead_local_worker(job.worker) and waited < stale_after:
+        return False
+
+    taken = FormGenerationJob.objects.filter(id=job.id, status=job.status, worker=job.worker).update(
+        status='pending', started_at=None, worker=executor_name()
+    )
+    if not taken:
+        return False
+    logger.warning(f"Trabajo de generación {job.id} abandonado por {job.worker or 'un proceso desconocido'}, reencolado")
+    get_generation_executor().submit(job.id)
+    job.refresh_from_db()
+    return True
+
+
+class GenerationExecutor:
+    """
+    Executor de generación del proceso: un ThreadPoolExecutor con a lo sumo
+    FORM_GENERATION_MAX_CONCURRENT renderizados a la vez; el resto espera en su cola.
+    La petición solo registra el trabajo y responde; el worker web queda libre.
+    """
+
+    def __init__(self, max_concurrent=None):
+        self.max_concurrent = max_concurrent or getattr(settings, 'FORM_GENERATION_MAX_CONCURRENT', 2)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent, thread_name_prefix='form-generation'
+        )
+        logger.info(f"Executor de generación iniciado con {self.max_concurrent} threads")
+
+    def submit(self, job_id):
+        return self._executor.submit(self._run, job_id)
+
+    @staticmethod
+    def _run(job_id):
+        close_old_connections()
+        try:
+            return run_generation_job(job_id)
+        except Exception:
+            logger.exception(f"Error ejecutando el trabajo de generación {job_id}")
+        finally:
+            close_old_connections()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_generation_executor():
+    """Executor de generación compartido por el proceso; al crearlo retoma los trabajos abandonados"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                executor = GenerationExecutor()
+                try:
+                    for job_id in recover_stale_jobs():
+                        executor.submit(job_id)
+                except Exception as e:
+                    logger.error(f"No se pudieron recuperar los trabajos de generación: {e}")
+                _executor = executor
+    return _executor
+
+
+def reset_generation_executor():
+    """Descarta el executor (p. ej. en el hijo tras un fork, donde sus threads no existen)"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_generation_executor)
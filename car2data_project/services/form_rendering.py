@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FORM_TYPES = ('contrato_compraventa', 'contrato_mandato', 'formulario_tramite')
+
+# Valores que la extracción usa para indicar que no hay dato
+EMPTY_VALUES = ('no disponible', 'n/a', 'na', 'none', 'null', 'sin dato')
+
+
+def normalize_value(value):
+    """Texto sin espacios sobrantes; los marcadores de dato faltante se convierten en ''"""
+    try:
+        if value is None:
+            return ''
+        text = str(value).strip()
+        if text.lower() in EMPTY_VALUES:
+            return ''
+        return text
+    except Exception:
+        return ''
+
+
+def split_apellidos_nombres(fullname):
+    """Separa un nombre completo en (primer apellido, segundo apellido, nombres)"""
+    try:
+        if not fullname:
+            return '', '', ''
+        parts = str(fullname).strip().split()
+        if len(parts) >= 3:
+            return parts[0], parts[1], ' '.join(parts[2:])
+        if len(parts) == 2:
+            return parts[0], '', parts[1]
+        return parts[0], '', ''
+    except Exception:
+        return '', '', ''
+
+
+def tramite_base_data(extracted_data):
+    """Datos del formulario de trámite tomados de la extracción, antes de combinar con el formulario"""
+    # Preferir 'informacion_vehiculo' (como en data_preview), con fallback a 'vehiculo'
+    vehiculo = extracted_data.get('informacion_vehiculo') or extracted_data.get('vehiculo', {})
+    propietario = extracted_data.get('propietario', {})
+    registro = extracted_data.get('registro', {})
+    ap1, ap2, nombres = split_apellidos_nombres(propietario.get('nombre'))
+
+    return {
+        'placa': vehiculo.get('placa'),
+        'marca': normalize_value(vehiculo.get('marca')),
+        'linea': normalize_value(vehiculo.get('linea')),
+        'color': normalize_value(vehiculo.get('color')),
+        'modelo': normalize_value(vehiculo.get('modelo')),
+        'cilindrada': normalize_value(vehiculo.get('cilindrada_cc')),
+        'capacidad': normalize_value(vehiculo.get('capacidad_kg_psj')),
+        'potencia': normalize_value(vehiculo.get('potencia_hp')),
+        'carroceria': normalize_value(vehiculo.get('tipo_carroceria')),
+        'numero_motor': normalize_value(vehiculo.get('numero_motor')),
+        'reg_numero_motor': normalize_value(vehiculo.get('reg_numero_motor')),
+        'numero_chasis': normalize_value(vehiculo.get('numero_chasis')),
+        'reg_numero_chasis': normalize_value(vehiculo.get('reg_numero_chasis')),
+        'numero_serie': normalize_value(vehiculo.get('numero_serie')),
+        'reg_numero_serie': normalize_value(vehiculo.get('reg_numero_serie')),
+        'numero_vin': normalize_value(vehiculo.get('vin')),
+        'tipo_servicio': normalize_value(vehiculo.get('servicio')),
+        'clase_vehiculo': normalize_value(vehiculo.get('clase_vehiculo')),
+        'combustible': normalize_value(vehiculo.get('combustible')),
+        # Propietario (separado automáticamente)
+        'propietario_primer_apellido': ap1,
+        'propietario_segundo_apellido': ap2,
+        'propietario_nombres': nombres,
+        'propietario_documento': normalize_value(propietario.get('identificacion')),
+        # Datos de importación
+        'declaracion_importacion': normalize_value(registro.get('declaracion_importacion')),
+        'fecha_importacion': normalize_value(registro.get('fecha_importacion')),
+    }
+
+
+def build_form_data(form_type, extracted_data, additional_data):
+    """
+    Datos con los que se rellena el formulario a partir de los datos estructurados del
+    documento y los del formulario web (additional_data). También forman la clave de la
+    caché de generación. Retorna None si el tipo no está soportado.
+    """
+    additional_data = additional_data or {}
+    if form_type == 'contrato_mandato':
+        # Los datos adicionales tienen prioridad sobre los extraídos
+        form_data = extracted_data.copy()
+        form_data.update(additional_data)
+        return form_data
+    if form_type == 'contrato_compraventa':
+        return {
+            'vehiculo': extracted_data.get('vehiculo', {}),
+            'vendedor': additional_data.get('vendedor', {}),
+            'comprador': additional_data.get('comprador', {}),
+            'valor_venta': additional_data.get('valor_venta'),
+            'forma_pago': additional_data.get('forma_pago'),
+            'ciudad_contrato': additional_data.get('ciudad_contrato'),
+            'fecha_contrato': additional_data.get('fecha_contrato'),
+            'organismo_transito': additional_data.get('organismo_transito') or extracted_data.get('registro', {}).get('organismo_transito'),
+        }
+    if form_type == 'formulario_tramite':
+        # Los datos completos vienen del formulario en additional_data
+        return additional_data
+    return None
+
+
+def shared_form_data(form_type, extracted_data, shared_fields):
+    """
+    Datos de un formulario generado en lote: los del documento más unos campos comunes a
+    todos los documentos (partes del contrato, ciudad, fecha...). A diferencia de la vista,
+    no se guardan Vehiculo, Persona ni contratos en la base de datos.
+    """
+    shared_fields = dict(shared_fields or {})
+    vehiculo = extracted_data.get('vehiculo', {}) or {}
+    if form_type == 'contrato_mandato':
+        shared_fields.setdefault('vehiculo', vehiculo)
+        shared_fields.setdefault('placa', vehiculo.get('placa', ''))
+    elif form_type == 'formulario_tramite':
+        base_data = tramite_base_data(extracted_data)
+        # Los campos comunes vacíos no sobrescriben los extraídos, igual que en la vista
+        base_data.update({key: value for key, value in shared_fields.items() if value is not None and value != ''})
+        shared_fields = base_data
+    return build_form_data(form_type, extracted_data, shared_fields)
+
+
+def generated_file_name(form_type, document_id):
+    """
+    Nombre único (relativo a MEDIA_ROOT) para un PDF generado. Lleva microsegundos: un
+    archivo de la caché puede estar compartido y no debe sobrescribirse con otra
+    generación del mismo segundo.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    return f'generated_forms/{form_type}_{document_id}_{timestamp}.pdf'
+
+
+def render_form_to_path(form_type, form_data, file_path, generator=None):
+    """
+    Genera el PDF del formulario en file_path con la plantilla oficial (o el respaldo de
+    ReportLab de DocumentGenerator). Retorna True si el archivo se generó.
+    """
+    from services.DocumentGenerator import DocumentGenerator
+
+    if form_type == 'contrato_compraventa':
+        # Directo al PDFFormFiller, sin respaldo de ReportLab
+        filler = generator.pdf_form_filler if generator is not None else None
+        if filler is None:
+            from services.PdfFormFiller import PDFFormFiller
+            filler = PDFFormFiller()
+        return filler.fill_pdf_form('contrato_compraventa', form_data, file_path)
+
+    generator = generator or DocumentGenerator()
+    if form_type == 'contrato_mandato':
+        return generator.generate_contrato_mandato(
+            form_data,  # Pasar todos los datos combinados
+            form_data.get('mandante', {}),
+            form_data.get('mandatario', {}),
+            file_path
+        )
+    if form_type == 'formulario_tramite':
+        return generator.generate_formulario_tramite(form_data, file_path)
+    logger.error(f"Tipo de formulario no soportado: {form_type}")
+    return False
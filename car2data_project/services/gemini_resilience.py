@@ -0,0 +1,190 @@
+import time
+import random
+import logging
+import threading
+from django.conf import settings
+from services.model_health import get_model_health
+
+logger = logging.getLogger(__name__)
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.GatewayTimeout,
+        ConnectionError,
+        TimeoutError,
+    )
+except ImportError:
+    RETRYABLE_ERRORS = (ConnectionError, TimeoutError)
+
+
+class ModelUnavailableError(Exception):
+    """
+    El modelo no puede atender la llamada ahora (circuito abierto, límite de tasa o
+    reintentos agotados). Los trabajos que la reciben se aplazan en lugar de fallar.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error) -> bool:
+    """Indica si el error es transitorio (cuota, sobrecarga, timeout o red)"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, 'retryable', False) is True
+
+
+def estimate_tokens(content) -> int:
+    """
+    Estimación aproximada de tokens de una petición para el límite por minuto:
+    ~4 caracteres por token en el texto y un costo fijo por adjunto.
+    """
+    parts = content if isinstance(content, (list, tuple)) else [content]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) // 4 + 1
+        else:
+            tokens += getattr(settings, 'GEMINI_TOKENS_PER_ATTACHMENT', 1500)
+    return tokens + getattr(settings, 'GEMINI_EXPECTED_OUTPUT_TOKENS', 800)
+
+
+class TokenBucket:
+    """Cubeta de tokens con recarga continua (capacity tokens por minuto)"""
+
+    def __init__(self, capacity, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.refill_per_second = self.capacity / 60.0
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+
+    def reserve(self, amount) -> float:
+        """
+        Reserva amount tokens y retorna los segundos a esperar antes de usarlos
+        (0 si hay disponibles). Las peticiones mayores que la capacidad se limitan a ella.
+        """
+        amount = min(float(amount), self.capacity)
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+        self._tokens -= amount
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.refill_per_second
+
+    def refund(self, amount):
+        self._tokens = min(self.capacity, self._tokens + min(float(amount), self.capacity))
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones y tokens por minuto compartido por los workers del proceso.
+    Si la espera necesaria supera max_wait, no se consume la cuota y se lanza
+    ModelUnavailableError para que el trabajo se aplace.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_wait=30, clock=time.monotonic, sleep=time.sleep):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self._lock:
+            wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+            if wait > self.max_wait:
+                self.requests.refund(1)
+                self.tokens.refund(tokens)
+                raise ModelUnavailableError(
+                    f"Límite de tasa del modelo alcanzado, reintentar en {wait:.0f}s", retry_after=wait
+                )
+        if wait > 0:
+            logger.info(f"Límite de tasa: esperando {wait:.1f}s antes de llamar al modelo")
+            self.sleep(wait)
+        return wait
+
+
+class NoRateLimit:
+    """Limitador nulo para backends sin cuota (p. ej. el backend local de pruebas)"""
+
+    def acquire(self, tokens=1):
+        return 0.0
+
+
+class ResilientModelClient:
+    """
+    Envuelve cualquier cliente con generate_content (p. ej. genai.GenerativeModel)
+    añadiendo límite de tasa, reintentos con backoff exponencial y jitter para
+    errores transitorios, y el circuito del estado de salud del modelo.
+    """
+
+    def __init__(self, client, health=None, limiter=None, max_retries=None,
+                 base_delay=None, max_delay=None, sleep=time.sleep):
+        self.client = client
+        self.health = health or get_model_health()
+        self.limiter = limiter if limiter is not None else get_rate_limiter()
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'GEMINI_MAX_RETRIES', 3)
+        self.base_delay = base_delay if base_delay is not None else getattr(settings, 'GEMINI_RETRY_BASE_DELAY', 1.0)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, 'GEMINI_RETRY_MAX_DELAY', 30.0)
+        self.sleep = sleep
+
+    def backoff_delay(self, attempt) -> float:
+        """Backoff exponencial con jitter completo: uniforme en [0, min(max, base * 2^attempt)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def generate_content(self, content, **kwargs):
+        attempt = 0
+        while True:
+            if not self.health.is_available():
+                raise ModelUnavailableError(
+                    "El servicio de inteligencia artificial no está disponible temporalmente",
+                    retry_after=self.health.probe_interval,
+                )
+
+            self.limiter.acquire(estimate_tokens(content))
+            try:
+                response = self.client.generate_content(content, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Errores propios de la petición (p. ej. PDF inválido): no afectan al circuito
+                    raise
+                self.health.record_failure(e)
+                if attempt >= self.max_retries:
+                    raise ModelUnavailableError(
+                        f"El modelo no respondió tras {attempt + 1} intentos: {e}",
+                        retry_after=self.max_delay,
+                    ) from e
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Error transitorio del modelo ({e}); reintento {attempt + 1} en {delay:.1f}s")
+                self.sleep(delay)
+                attempt += 1
+                continue
+
+            self.health.record_success()
+            return response
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Retorna el limitador compartido del proceso (los límites son por proceso)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=getattr(settings, 'GEMINI_REQUESTS_PER_MINUTE', 10),
+                tokens_per_minute=getattr(settings, 'GEMINI_TOKENS_PER_MINUTE', 1000000),
+                max_wait=getattr(settings, 'GEMINI_RATE_LIMIT_MAX_WAIT', 30),
+            )
+        return _limiter
@@ -0,0 +1,248 @@
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Versión del renderizado: incrementarla al cambiar coordenadas o formato del overlay
+# para que los artefactos anteriores dejen de coincidir
+RENDERER_VERSION = 1
+
+# Claves que cambian en cada petición sin afectar el PDF (p. ej. el id del contrato guardado)
+VOLATILE_KEYS = frozenset({'contrato_id'})
+
+
+def normalize_payload(value):
+    """Datos del formulario sin claves volátiles y con los textos sin espacios sobrantes"""
+    if isinstance(value, dict):
+        return {str(key): normalize_payload(item) for key, item in value.items() if key not in VOLATILE_KEYS}
+    if isinstance(value, (list, tuple)):
+        return [normalize_payload(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def today():
+    """Fecha local que imprime el renderizado (datetime.now() en PdfFormFiller)"""
+    return date.today()
+
+
+def render_date(form_type: str, payload: dict):
+    """
+    Fecha del día que el renderizado estampa en el PDF, o None si el PDF no depende del
+    día: el formulario de trámite imprime siempre la fecha actual y los contratos la
+    usan cuando fecha_contrato falta o no se puede interpretar.
+    """
+    if form_type == 'formulario_tramite':
+        return today().isoformat()
+    fecha_contrato = payload.get('fecha_contrato')
+    if isinstance(fecha_contrato, date):
+        return None
+    if fecha_contrato:
+        try:
+            # Formato que aceptan tanto la compraventa como el mandato
+            datetime.strptime(str(fecha_contrato), '%Y-%m-%d')
+            return None
+        except ValueError:
+            pass
+    return today().isoformat()
+
+
+class GenerationCache:
+    """
+    Caché persistente de PDFs generados (modelo GeneratedArtifact).
+
+    La clave es el SHA-256 del tipo de formulario, los datos normalizados, la versión
+    (hash) de la plantilla, el motor de rellenado, RENDERER_VERSION y, si el PDF imprime
+    la fecha actual, el día de la generación (render_date). Un acierto reutiliza
+    el archivo existente sin renderizar. Cada GeneratedForm que apunta a un artefacto
+    suma una referencia; el archivo solo se borra al expulsar artefactos sin referencias,
+    por antigüedad (GENERATION_CACHE_TTL_SECONDS) o cuando el total almacenado supera
+    GENERATION_CACHE_MAX_BYTES, empezando por los usados hace más tiempo.
+    """
+
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'GENERATION_CACHE_ENABLED', True)
+        self.ttl_seconds = getattr(settings, 'GENERATION_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+        self.max_bytes = getattr(settings, 'GENERATION_CACHE_MAX_BYTES', 500 * 1024 * 1024)
+
+    @staticmethod
+    def template_version(form_type: str):
+        """Hash de la plantilla oficial del formulario, o None si no existe (se usa el respaldo)"""
+        from services.PdfFormFiller import PDFFormFiller
+        from services.pdf_templates import get_template_registry
+
+        try:
+            template_path = PDFFormFiller().get_template_path(form_type)
+        except ValueError:
+            return None
+        template = get_template_registry().load(template_path) if template_path else None
+        return template.version if template is not None else None
+
+    def make_key(self, form_type: str, payload: dict):
+        """
+        Calcula la clave para un formulario y sus datos. Retorna None si la caché está
+        desactivada o no hay plantilla oficial (el respaldo con ReportLab no se cachea).
+        Los PDF que imprimen la fecha actual solo coinciden con los generados el mismo día.
+        """
+        if not self.enabled or payload is None:
+            return None
+        version = self.template_version(form_type)
+        if version is None:
+            return None
+        material = json.dumps(
+            {
+                'form_type': form_type,
+                'template': version,
+                'engine': getattr(settings, 'PDF_FILL_ENGINE', 'merge'),
+                'renderer': RENDERER_VERSION,
+                'render_date': render_date(form_type, payload),
+                'data': normalize_payload(payload),
+            },
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def acquire(self, key: str):
+        """
+        Retorna el artefacto de la clave con una referencia más, o None si no hay uno
+        utilizable. El incremento es un UPDATE condicional: una expulsión concurrente
+        solo borra artefactos con ref_count en cero.
+        """
+        from apps.forms_generation.models import GeneratedArtifact
+
+        if not key:
+            return None
+
+        updated = GeneratedArtifact.objects.filter(key=key).update(
+            ref_count=F('ref_count') + 1,
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now(),
+        )
+        artifact = GeneratedArtifact.objects.filter(key=key).first() if updated else None
+        if artifact is not None and not artifact.file.storage.exists(artifact.file.name):
+            logger.warning(f"Artefacto sin archivo en el almacenamiento, se descarta: {artifact.file.name}")
+            artifact.delete()
+            artifact = None
+
+        self._record(hit=artifact is not None)
+        if artifact is not None:
+            logger.info(f"Acierto en caché de generación: {key[:12]}... ({artifact.ref_count} refs)")
+        return artifact
+
+    def store(self, key: str, form_type: str, file_name: str):
+        """
+        Registra el archivo recién generado como artefacto con una referencia y aplica la
+        expulsión. Retorna None si otra petición registró la misma clave primero: el
+        archivo queda entonces como propio del formulario.
+        """
+        from apps.forms_generation.models import GeneratedArtifact
+
+        if not key:
+            return None
+
+        artifact = GeneratedArtifact(key=key, form_type=form_type, file=file_name, ref_count=1)
+        artifact.size = artifact.file.storage.size(file_name)
+        try:
+            with transaction.atomic():
+                artifact.save()
+        except IntegrityError:
+            return None
+        self.evict()
+        return artifact
+
+    def release(self, artifact_id: int):
+        """Quita una referencia; el archivo se conserva hasta que la expulsión lo elimine"""
+        from apps.forms_generation.models import GeneratedArtifact
+
+        GeneratedArtifact.objects.filter(pk=artifact_id, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1,
+            last_used_at=timezone.now(),
+        )
+
+    @contextmanager
+    def releasing_on_error(self, held: list):
+        """
+        Si el bloque lanza una excepción, quita las referencias de los artefactos que se
+        agregaron a held (tomados con acquire o store): sin el GeneratedForm que las iba a
+        usar, el artefacto quedaría fijado para siempre y nunca se expulsaría.
+        """
+        try:
+            yield held
+        except BaseException:
+            for artifact in held:
+                self.release(artifact.id)
+            raise
+
+    def evict(self) -> int:
+        """
+        Elimina artefactos sin referencias expirados y, si el total almacenado supera
+        GENERATION_CACHE_MAX_BYTES, los sin referencias usados hace más tiempo. Retorna
+        el número de artefactos eliminados.
+        """
+        from apps.forms_generation.models import GeneratedArtifact
+
+        unreferenced = GeneratedArtifact.objects.filter(ref_count=0, forms__isnull=True)
+        threshold = timezone.now() - timedelta(seconds=self.ttl_seconds)
+        removed = sum(self._remove(artifact) for artifact in unreferenced.filter(last_used_at__lt=threshold))
+
+        overflow = (GeneratedArtifact.objects.aggregate(total=Sum('size'))['total'] or 0) - self.max_bytes
+        if overflow > 0:
+            for artifact in unreferenced.order_by('last_used_at').iterator():
+                if overflow <= 0:
+                    break
+                if self._remove(artifact):
+                    removed += 1
+                    overflow -= artifact.size
+
+        if removed:
+            logger.info(f"Caché de generación: {removed} artefactos expulsados")
+        return removed
+
+    @staticmethod
+    def _remove(artifact) -> int:
+        """Borra la fila solo si sigue sin referencias y, después, su archivo"""
+        from apps.forms_generation.models import GeneratedArtifact
+
+        deleted, _ = GeneratedArtifact.objects.filter(pk=artifact.pk, ref_count=0, forms__isnull=True).delete()
+        if not deleted:
+            return 0
+        try:
+            artifact.file.storage.delete(artifact.file.name)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el archivo del artefacto {artifact.file.name}: {e}")
+        return 1
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Retorna los contadores de aciertos y fallos del proceso actual"""
+        with cls._lock:
+            total = cls._hits + cls._misses
+            return {
+                'hits': cls._hits,
+                'misses': cls._misses,
+                'hit_ratio': (cls._hits / total) if total else 0.0,
+            }
+
+    @classmethod
+    def _record(cls, hit: bool):
+        with cls._lock:
+            if hit:
+                cls._hits += 1
+            else:
+                cls._misses += 1
@@ -0,0 +1,175 @@
+import re
+import logging
+import unicodedata
+from django.conf import settings
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pytesseract
+    from pdf2image import convert_from_path
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+
+# Fuentes registradas en "fuentes_campos"
+SOURCE_TEXT = 'texto_pdf'
+SOURCE_OCR = 'ocr'
+SOURCE_MODEL = 'gemini'
+
+# Campo -> (etiquetas en la tarjeta de propiedad, patrón que debe cumplir el valor completo).
+# Solo se acepta un valor si cumple su patrón; lo demás se deja al modelo.
+FIELD_RULES = {
+    'informacion_vehiculo.placa': (
+        ['PLACA', 'PLACA NO'], r'[A-Z]{3}\d{3}|[A-Z]{3}\d{2}[A-Z]'),
+    'informacion_vehiculo.marca': (
+        ['MARCA'], r'[A-Z][A-Z0-9 .\-]{1,29}'),
+    'informacion_vehiculo.linea': (
+        ['LINEA'], r'[A-Z0-9][A-Z0-9 .\-/]{0,29}'),
+    'informacion_vehiculo.modelo': (
+        ['MODELO'], r'19[5-9]\d|20\d\d'),
+    'informacion_vehiculo.cilindrada_cc': (
+        ['CILINDRADA CC', 'CILINDRADA', 'CILINDRAJE'], r'\d{2,5}'),
+    'informacion_vehiculo.color': (
+        ['COLOR'], r'[A-Z][A-Z ]{2,39}'),
+    'informacion_vehiculo.servicio': (
+        ['SERVICIO'], r'PARTICULAR|PUBLICO|OFICIAL|DIPLOMATICO|ESPECIAL'),
+    'informacion_vehiculo.clase_vehiculo': (
+        ['CLASE DE VEHICULO', 'CLASE VEHICULO', 'CLASE'], r'[A-Z][A-Z ]{3,29}'),
+    'informacion_vehiculo.tipo_carroceria': (
+        ['TIPO CARROCERIA', 'TIPO DE CARROCERIA', 'CARROCERIA'], r'[A-Z][A-Z ]{2,29}'),
+    'informacion_vehiculo.combustible': (
+        ['COMBUSTIBLE'], r'(GASOLINA|DIESEL|ACPM|ELECTRICO|HIBRIDO|GNV|GAS)[A-Z /]{0,20}'),
+    'informacion_vehiculo.capacidad_kg_psj': (
+        ['CAPACIDAD KG/PSJ', 'CAPACIDAD KG PSJ', 'CAPACIDAD'], r'\d{1,6}'),
+    'informacion_vehiculo.numero_motor': (
+        ['NUMERO DE MOTOR', 'NO. MOTOR', 'NO MOTOR', 'MOTOR'], r'(?=.*\d)[A-Z0-9\-]{5,25}'),
+    'informacion_vehiculo.vin': (
+        ['VIN'], r'[A-HJ-NPR-Z0-9]{17}'),
+    'informacion_vehiculo.numero_serie': (
+        ['NUMERO DE SERIE', 'NO. SERIE', 'SERIE'], r'(?=.*\d)[A-Z0-9\-]{5,25}'),
+    'informacion_vehiculo.numero_chasis': (
+        ['NUMERO DE CHASIS', 'NO. CHASIS', 'CHASIS'], r'(?=.*\d)[A-Z0-9\-]{5,25}'),
+    'informacion_vehiculo.potencia_hp': (
+        ['POTENCIA HP', 'POTENCIA'], r'\d{1,4}(\.\d{1,2})?'),
+    'informacion_vehiculo.puertas': (
+        ['PUERTAS'], r'[1-9]'),
+    'informacion_propietario.nombre': (
+        ['APELLIDO(S) Y NOMBRE(S)', 'APELLIDOS Y NOMBRES', 'PROPIETARIO'], r'[A-Z][A-Z .]{4,79}'),
+    'informacion_propietario.identificacion': (
+        ['IDENTIFICACION', 'DOCUMENTO'], r'((C\.? ?C\.?|NIT|C\.? ?E\.?) ?)?\d[\d.\-]{4,14}'),
+}
+
+# Los valores sin separadores se comparan contra el patrón (p. ej. "ABC 123" -> "ABC123")
+COMPACT_FIELDS = {'informacion_vehiculo.placa', 'informacion_vehiculo.vin'}
+
+_LABELS = sorted({label for labels, _ in FIELD_RULES.values() for label in labels}, key=len, reverse=True)
+_LABEL_RE = re.compile(r'(?<![A-Z0-9])(' + '|'.join(re.escape(label) for label in _LABELS) + r')(?![A-Z0-9])')
+_LABEL_TO_FIELDS = {}
+for _field, (_labels, _) in FIELD_RULES.items():
+    for _label in _labels:
+        _LABEL_TO_FIELDS.setdefault(_label, []).append(_field)
+_VIN_RE = re.compile(r'(?<![A-Z0-9])(?=[A-Z0-9]*\d)(?=[A-Z0-9]*[A-Z])[A-HJ-NPR-Z0-9]{17}(?![A-Z0-9])')
+
+
+def normalize_text(text: str) -> str:
+    """Mayúsculas, sin tildes y con espacios simples por línea"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).upper()
+    return '\n'.join(' '.join(line.split()) for line in text.splitlines())
+
+
+def parse_fields(text: str) -> dict:
+    """
+    Extrae los campos cuyo valor aparece junto a su etiqueta en la misma línea
+    y cumple el patrón del campo. Retorna {ruta_campo: valor}.
+    """
+    fields = {}
+    for line in normalize_text(text).splitlines():
+        matches = list(_LABEL_RE.finditer(line))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(line)
+            value = line[match.end():end].strip(' :.-#')
+            if not value:
+                continue
+            for field in _LABEL_TO_FIELDS[match.group(1)]:
+                if field in fields:
+                    continue
+                candidate = re.sub(r'[\s\-]', '', value) if field in COMPACT_FIELDS else value
+                if re.fullmatch(FIELD_RULES[field][1], candidate):
+                    fields[field] = candidate
+                    break
+
+    # El VIN tiene un formato inconfundible: se acepta aunque no esté junto a su etiqueta
+    if 'informacion_vehiculo.vin' not in fields:
+        vins = set(_VIN_RE.findall(normalize_text(text)))
+        if len(vins) == 1:
+            fields['informacion_vehiculo.vin'] = vins.pop()
+    return fields
+
+
+def extract_text_layer(pdf_path: str, max_pages: int) -> str:
+    """Texto embebido del PDF (vacío en escaneos sin capa de texto)"""
+    try:
+        reader = PdfReader(pdf_path)
+        return '\n'.join((page.extract_text() or '') for page in reader.pages[:max_pages])
+    except Exception as e:
+        logger.warning(f"No se pudo leer la capa de texto de {pdf_path}: {e}")
+        return ''
+
+
+def extract_ocr_text(pdf_path: str, max_pages: int) -> str:
+    """Texto obtenido con Tesseract sobre las páginas rasterizadas (vacío si no está disponible)"""
+    if not OCR_AVAILABLE:
+        return ''
+    try:
+        images = convert_from_path(
+            pdf_path,
+            dpi=getattr(settings, 'EXTRACTION_OCR_DPI', 300),
+            first_page=1,
+            last_page=max_pages,
+        )
+        lang = getattr(settings, 'EXTRACTION_OCR_LANG', 'spa')
+        return '\n'.join(pytesseract.image_to_string(image, lang=lang) for image in images)
+    except Exception as e:
+        logger.warning(f"OCR local no disponible para {pdf_path}: {e}")
+        return ''
+
+
+def extract_local_fields(pdf_path: str, required_fields=()) -> tuple:
+    """
+    Niveles locales de extracción: capa de texto del PDF y, si faltan campos
+    requeridos, OCR. Retorna ({ruta_campo: valor}, {ruta_campo: fuente}).
+    """
+    max_pages = getattr(settings, 'EXTRACTION_LOCAL_MAX_PAGES', 2)
+    fields, sources = {}, {}
+
+    for source, reader in ((SOURCE_TEXT, extract_text_layer), (SOURCE_OCR, extract_ocr_text)):
+        if fields and all(field in fields for field in required_fields):
+            break
+        if source == SOURCE_OCR and not getattr(settings, 'EXTRACTION_OCR_ENABLED', True):
+            break
+        text = reader(pdf_path, max_pages)
+        for field, value in parse_fields(text).items():
+            if field not in fields:
+                fields[field] = value
+                sources[field] = source
+
+    logger.info(f"Extracción local: {len(fields)} campos ({', '.join(sorted(set(sources.values()))) or 'ninguna fuente'})")
+    return fields, sources
+
+
+def get_required_fields():
+    """Campos que deben obtenerse de la capa de texto para omitir el OCR"""
+    return getattr(settings, 'EXTRACTION_LOCAL_REQUIRED_FIELDS', list(FIELD_RULES))
+
+
+def set_field(data: dict, path: str, value):
+    section, field = path.split('.', 1)
+    data.setdefault(section, {})[field] = value
+
+
+def get_field(data: dict, path: str):
+    section, field = path.split('.', 1)
+    return (data.get(section) or {}).get(field)
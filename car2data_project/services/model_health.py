@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHealth:
+    """
+    Estado de salud compartido del servicio de IA dentro del proceso.
+
+    Se alimenta de los resultados de las llamadas reales de extracción (no hace
+    llamadas de prueba previas). Si se acumulan fallos el circuito se abre: las
+    extracciones dejan de intentarse y un hilo en segundo plano lanza una prueba
+    ligera cada cierto tiempo hasta que el servicio vuelve a responder.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, name='gemini', probe=None):
+        self.name = name
+        self.probe = probe
+        self.window_size = getattr(settings, 'MODEL_HEALTH_WINDOW', 20)
+        self.failure_threshold = getattr(settings, 'MODEL_HEALTH_FAILURE_THRESHOLD', 3)
+        self.failure_ratio = getattr(settings, 'MODEL_HEALTH_FAILURE_RATIO', 0.5)
+        self.probe_interval = getattr(settings, 'MODEL_HEALTH_PROBE_INTERVAL', 60)
+        self._results = deque(maxlen=self.window_size)
+        self._consecutive_failures = 0
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._last_error = ''
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def set_probe(self, probe):
+        """Registra la función de prueba usada mientras el circuito está abierto"""
+        self.probe = probe
+
+    def is_available(self) -> bool:
+        """Indica si se deben intentar llamadas reales al modelo"""
+        return self._state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self._results.append(True)
+            self._consecutive_failures = 0
+            if self._state == self.OPEN:
+                self._close()
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._results.append(False)
+            self._consecutive_failures += 1
+            self._last_error = str(error or '')
+            if self._state == self.CLOSED and self._should_open():
+                self._open()
+
+    def snapshot(self) -> dict:
+        """Estado actual para diagnóstico"""
+        with self._lock:
+            failures = self._results.count(False)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'recent_calls': len(self._results),
+                'recent_failures': failures,
+                'consecutive_failures': self._consecutive_failures,
+                'opened_at': self._opened_at,
+                'last_error': self._last_error,
+            }
+
+    def _should_open(self) -> bool:
+        if self._consecutive_failures >= self.failure_threshold:
+            return True
+        if len(self._results) >= self.window_size:
+            return self._results.count(False) / len(self._results) >= self.failure_ratio
+        return False
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.time()
+        logger.warning(f"Circuito de {self.name} abierto tras {self._consecutive_failures} fallos: {self._last_error}")
+        if self.probe and (self._probe_thread is None or not self._probe_thread.is_alive()):
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name=f"{self.name}-health-probe", daemon=True
+            )
+            self._probe_thread.start()
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._consecutive_failures = 0
+        self._results.clear()
+        logger.info(f"Circuito de {self.name} cerrado: el servicio responde de nuevo")
+
+    def _probe_loop(self):
+        while self._state == self.OPEN:
+            time.sleep(self.probe_interval)
+            if self._state != self.OPEN:
+                break
+            try:
+                healthy = bool(self.probe())
+            except Exception as e:
+                healthy = False
+                logger.info(f"Prueba de salud de {self.name} fallida: {e}")
+            if healthy:
+                with self._lock:
+                    self._close()
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_model_health(name='gemini') -> ModelHealth:
+    """Retorna el estado de salud compartido para el servicio indicado"""
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ModelHealth(name=name)
+        return _health[name]
+
+
+def reset_model_health():
+    """
+    Descarta los estados de salud (p. ej. en el hijo tras un fork: el lock puede quedar
+    tomado y el estado del circuito es del padre)
+    """
+    global _health, _health_lock
+    _health = {}
+    _health_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_model_health)
@@ -3,37 +3,24 @@ import base64
 import json
 import logging
 import re
-import google.generativeai as genai
+import threading
 from django.conf import settings
+from services.model_health import get_model_health
+from services.gemini_resilience import ModelUnavailableError, NoRateLimit, ResilientModelClient, get_rate_limiter
+from services.extraction_backends import get_extraction_backend
+from services.pdf_preprocessor import PDFPreprocessor
+from services.local_ocr import SOURCE_MODEL, extract_local_fields, get_required_fields, set_field
 
 logger = logging.getLogger(__name__)
 
 class PDFExtractor:
     """
-    Servicio para extraer información de PDFs de tarjeta de propiedad usando únicamente Gemini Vision
+    Servicio para extraer información de PDFs de tarjeta de propiedad.
+    Las llamadas al modelo las resuelve el backend configurado (Gemini Vision por defecto).
     """
-    
-    def __init__(self):
-        # Usar la configuración de Django
-        self.api_key = getattr(settings, 'GEMINI_API_KEY', '')
-        if not self.api_key:
-            logger.error("La clave de API de Gemini no está configurada en los ajustes")
-            raise ValueError("La clave de API de Gemini no está configurada en los ajustes")
-        # Configurar Gemini
-        try:
-            # Configurar con la API key
-            genai.configure(api_key=self.api_key)
-            
-            # Usar gemini-2.0-flash-exp (versión experimental más reciente)
-            self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            logger.info("Gemini configurado correctamente con gemini-2.0-flash-exp")
-                
-        except Exception as e:
-            logger.error(f"Error en la respuesta de Gemini: {str(e)}")
-            raise Exception(f"Error al procesar el documento con la inteligencia artificial: {str(e)}")
-        
-        # Prompt especializado para tarjeta de propiedad
-        self.base_prompt = """
+
+    # Prompt especializado para tarjeta de propiedad
+    base_prompt = """
         
         Eres un experto en análisis de documentos vehiculares colombianos. Analiza el siguiente documento PDF
         y extrae ÚNICAMENTE la información que esté explícitamente mencionada en la tarjeta de propiedad.
@@ -94,33 +81,70 @@ class PDFExtractor:
         Documento a analizar:
         """
 
+    def __init__(self, backend=None):
+        # Backend configurado en EXTRACTION_BACKEND (Gemini por defecto)
+        self.backend = backend or get_extraction_backend()
+        self.model_name = self.backend.model_name
+
+        health = get_model_health(self.backend.name)
+        if health.probe is None:
+            health.set_probe(_probe_connection)
+        # Límite de tasa, reintentos y circuito alrededor de las llamadas de extracción
+        limiter = get_rate_limiter() if self.backend.rate_limited else NoRateLimit()
+        self.client = ResilientModelClient(self.backend, health=health, limiter=limiter)
+
     def _analyze_with_vision(self, pdf_path: str) -> dict:
-        """Analiza el PDF directamente con Gemini Vision"""
+        """
+        Analiza el PDF con Gemini Vision enviando la versión reducida (páginas relevantes,
+        imágenes a menor resolución). Si con ella no se obtienen datos, se reintenta con el original.
+        """
         try:
             with open(pdf_path, 'rb') as file:
                 pdf_data = file.read()
-                pdf_base64 = base64.b64encode(pdf_data).decode('utf-8')
-            
-            content = [
-                self.base_prompt,
-                {
-                    "mime_type": "application/pdf",
-                    "data": pdf_base64
-                }
-            ]
-            
-            response = self.model.generate_content(content)
-            
-            if response and response.text:
-                logger.info("Análisis con Vision completado")
-                return self.clean_and_parse_json(response.text)
-            else:
-                return self.create_default_structure("Sin respuesta de Vision")
-                
+
+            prepared = None
+            if getattr(settings, 'EXTRACTION_PREPROCESS_ENABLED', True):
+                prepared = PDFPreprocessor().prepare(pdf_data)
+            if prepared is None or prepared.used_original:
+                return self._request_vision(pdf_data)
+
+            try:
+                result = self._request_vision(prepared.data)
+            except ModelUnavailableError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error con el PDF reducido: {str(e)}")
+                result = None
+            if result is None or self.is_default_structure(result):
+                logger.warning("Sin datos con el PDF reducido, reintentando con el original")
+                result = self._request_vision(pdf_data)
+            return result
+
+        except ModelUnavailableError:
+            # No degradar a la estructura por defecto: el trabajo se aplaza y se reintenta
+            raise
         except Exception as e:
             logger.error(f"Error en análisis con Vision: {str(e)}")
             return self.create_default_structure(f"Error en Vision: {str(e)}")
-    
+
+    def _request_vision(self, pdf_data: bytes) -> dict:
+        """Envía el PDF al modelo y retorna la respuesta interpretada"""
+        pdf_base64 = base64.b64encode(pdf_data).decode('utf-8')
+        content = [
+            self.base_prompt,
+            {
+                "mime_type": "application/pdf",
+                "data": pdf_base64
+            }
+        ]
+
+        response = self.client.generate_content(content)
+
+        if response and response.text:
+            logger.info("Análisis con Vision completado")
+            return self.clean_and_parse_json(response.text)
+        return self.create_default_structure("Sin respuesta de Vision")
+
     def clean_and_parse_json(self, response_text: str) -> dict:
         """Limpia y parsea la respuesta JSON de Gemini"""
         try:
@@ -137,6 +161,14 @@ class PDFExtractor:
             logger.error(f"Error al leer el archivo PDF: {str(e)}")
             raise Exception(f"No se pudo leer el archivo PDF: {str(e)}")
     
+    @staticmethod
+    def is_default_structure(data: dict) -> bool:
+        """Indica si el resultado es la estructura por defecto (no hubo extracción real)"""
+        return (
+            data.get('tipo_documento') == 'No identificado'
+            and str(data.get('observaciones', '')).startswith('Respuesta original')
+        )
+
     def create_default_structure(self, raw_response: str = "") -> dict:
         """Crea una estructura JSON por defecto"""
         return {
@@ -186,17 +218,195 @@ class PDFExtractor:
             "observaciones": f"Respuesta original: {raw_response[:300]}..."
         }
     
+    def schema_fields(self) -> list:
+        """Rutas (seccion.campo) de todos los campos de la estructura de extracción"""
+        return [
+            f"{section}.{field}"
+            for section, values in self.create_default_structure().items()
+            if isinstance(values, dict)
+            for field in values
+        ]
+
     def extract_vehicle_info(self, pdf_path: str) -> dict:
-        """Extrae información vehicular de un PDF usando Gemini Vision"""
-        logger.info(f"Iniciando análisis de PDF con Gemini Vision: {pdf_path}")
-        return self._analyze_with_vision(pdf_path)
-    
+        """
+        Extrae información vehicular de un PDF por niveles: primero la capa de texto
+        y el OCR locales, y Gemini Vision para los campos que no se llenaron localmente.
+        Gemini solo se omite si los niveles locales llenan todos los campos de la estructura.
+        El resultado incluye "fuentes_campos" con el nivel que llenó cada campo.
+        """
+        local_fields, sources, missing = self._extract_locally(pdf_path)
+        if not missing:
+            logger.info(f"Todos los campos extraídos localmente, se omite Gemini: {pdf_path}")
+            return self._merge_tiers(None, local_fields, sources)
+
+        logger.info(f"Iniciando análisis de PDF con Gemini Vision ({len(missing)} campos sin extraer localmente): {pdf_path}")
+        return self._merge_tiers(self._analyze_with_vision(pdf_path), local_fields, sources)
+
+    def extract_batch(self, pdf_paths: list) -> list:
+        """
+        Extrae varios PDFs consultando al modelo una sola vez para todos los que no
+        se resuelven localmente. Si la respuesta del lote no es un arreglo válido con
+        un objeto por documento, cada documento se consulta por separado.
+        Retorna los resultados en el mismo orden que pdf_paths.
+
+        Si el modelo no está disponible, la ModelUnavailableError lleva en partial_results
+        los resultados ya obtenidos (los resueltos localmente y los que el modelo respondió
+        antes de fallar) y None para los que aún lo necesitan.
+        """
+        local = [self._extract_locally(path) for path in pdf_paths]
+        pending = [index for index, (_, _, missing) in enumerate(local) if missing]
+
+        model_results = {}
+        try:
+            if len(pending) == 1:
+                model_results[pending[0]] = self._analyze_with_vision(pdf_paths[pending[0]])
+            elif pending:
+                logger.info(f"Analizando lote de {len(pending)} PDFs con Gemini Vision")
+                results = self._analyze_batch_with_vision([pdf_paths[index] for index in pending])
+                if results is not None:
+                    model_results = dict(zip(pending, results))
+                else:
+                    logger.warning(f"Respuesta de lote inválida, consultando {len(pending)} documentos por separado")
+                    for index in pending:
+                        model_results[index] = self._analyze_with_vision(pdf_paths[index])
+        except ModelUnavailableError as e:
+            e.partial_results = [
+                None if missing and index not in model_results
+                else self._merge_tiers(model_results.get(index), local_fields, sources)
+                for index, (local_fields, sources, missing) in enumerate(local)
+            ]
+            raise
+
+        return [
+            self._merge_tiers(model_results.get(index), local_fields, sources)
+            for index, (local_fields, sources, _) in enumerate(local)
+        ]
+
+    def _extract_locally(self, pdf_path: str) -> tuple:
+        """
+        Niveles locales: retorna (campos, fuentes, campos faltantes). Los faltantes se
+        cuentan sobre toda la estructura: un campo sin regla local (p. ej. el organismo de
+        tránsito) siempre lo llena el modelo, nunca se deja en "No disponible".
+        """
+        local_fields, sources = {}, {}
+        if getattr(settings, 'EXTRACTION_LOCAL_ENABLED', True):
+            local_fields, sources = extract_local_fields(pdf_path, get_required_fields())
+        missing = [field for field in self.schema_fields() if field not in local_fields]
+        return local_fields, sources, missing
+
+    def _merge_tiers(self, model_data, local_fields: dict, sources: dict) -> dict:
+        """Combina la respuesta del modelo (o None si no se consultó) con los campos locales"""
+        if model_data is None:
+            data = self.create_default_structure()
+            data['tipo_documento'] = 'Tarjeta de Propiedad'
+            data['observaciones'] = 'Extracción local sin consulta al modelo'
+        else:
+            data = model_data
+            for section, values in data.items():
+                if not isinstance(values, dict):
+                    continue
+                for field, value in values.items():
+                    if value and value != 'No disponible':
+                        sources.setdefault(f"{section}.{field}", SOURCE_MODEL)
+
+        # Los valores locales cumplen el formato esperado del campo y tienen prioridad
+        for field, value in local_fields.items():
+            set_field(data, field, value)
+        data['fuentes_campos'] = sources
+        return data
+
+    def _analyze_batch_with_vision(self, pdf_paths: list):
+        """
+        Envía varios PDFs en una sola petición y retorna la lista de resultados,
+        o None si la respuesta no se puede asociar a cada documento.
+        """
+        content = [self.batch_prompt(len(pdf_paths))]
+        for index, pdf_path in enumerate(pdf_paths, start=1):
+            with open(pdf_path, 'rb') as file:
+                pdf_data = file.read()
+            if getattr(settings, 'EXTRACTION_PREPROCESS_ENABLED', True):
+                pdf_data = PDFPreprocessor().prepare(pdf_data).data
+            content.append(f"Documento {index}:")
+            content.append({
+                "mime_type": "application/pdf",
+                "data": base64.b64encode(pdf_data).decode('utf-8')
+            })
+
+        try:
+            response = self.client.generate_content(content)
+        except ModelUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error en análisis por lotes con Vision: {str(e)}")
+            return None
+        return self.parse_batch_response(response.text if response else '', len(pdf_paths))
+
+    def batch_prompt(self, count: int) -> str:
+        """Prompt base con las instrucciones para responder un lote de documentos"""
+        prompt = self.base_prompt.rsplit("Documento a analizar:", 1)[0]
+        return prompt + f"""
+        Recibirás {count} documentos PDF, cada uno precedido por "Documento N:".
+        Analiza cada documento por separado con las reglas y el formato anteriores y devuelve
+        SOLO un arreglo JSON con exactamente {count} objetos, en el mismo orden de los documentos.
+        """
+
+    @staticmethod
+    def parse_batch_response(response_text: str, count: int):
+        """Retorna la lista de objetos del lote o None si la respuesta no es válida"""
+        match = re.search(r'\[.*\]', response_text or '', re.DOTALL)
+        if not match:
+            return None
+        try:
+            items = json.loads(match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(items, list) or len(items) != count or not all(isinstance(item, dict) for item in items):
+            return None
+        return items
+
     def test_connection(self) -> bool:
         """Prueba la conexión con Gemini"""
         try:
-            test_prompt = "Responde con un JSON simple: {\"test\": \"ok\"}"
-            response = self.model.generate_content(test_prompt)
-            return bool(response and response.text)
+            return self.backend.test_connection()
         except Exception as e:
             logger.error(f"Error inesperado al extraer información: {str(e)}")
             raise Exception(f"Ocurrió un error inesperado al procesar el documento. Por favor, inténtalo de nuevo más tarde.")
+
+
+_shared_extractor = None
+_shared_extractor_lock = threading.Lock()
+
+
+def get_pdf_extractor() -> PDFExtractor:
+    """
+    Retorna el extractor compartido del proceso, creándolo al primer uso.
+    Evita repetir genai.configure y la construcción del modelo en cada trabajo;
+    el cliente (y su canal gRPC) se reutiliza entre llamadas y threads.
+    """
+    global _shared_extractor
+    extractor = _shared_extractor
+    if extractor is None:
+        with _shared_extractor_lock:
+            if _shared_extractor is None:
+                _shared_extractor = PDFExtractor()
+            extractor = _shared_extractor
+    return extractor
+
+
+def reset_pdf_extractor():
+    """
+    Descarta el extractor compartido. Se llama al detener un proceso de workers y,
+    automáticamente, en el proceso hijo tras un fork (los canales gRPC no sobreviven al fork).
+    """
+    global _shared_extractor, _shared_extractor_lock
+    _shared_extractor = None
+    _shared_extractor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_pdf_extractor)
+
+
+def _probe_connection() -> bool:
+    """Prueba ligera usada por el estado de salud mientras el circuito está abierto"""
+    return get_pdf_extractor().test_connection()
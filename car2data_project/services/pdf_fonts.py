@@ -0,0 +1,114 @@
+import os
+import logging
+import threading
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+logger = logging.getLogger(__name__)
+
+# Fuentes TrueType preferidas, en orden; Helvetica (nativa de ReportLab) es el respaldo
+FONT_CANDIDATES = [
+    ('Arial', [
+        '/System/Library/Fonts/Arial.ttf',  # macOS
+        'C:\\Windows\\Fonts\\arial.ttf',    # Windows
+        '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',  # Linux
+    ]),
+]
+FALLBACK_FONT = 'Helvetica'
+
+# Tamaños probados al ajustar un texto a su ancho máximo, de mayor a menor
+FIT_FONT_SIZES = (9, 8, 7, 6)
+
+
+class FontRegistry:
+    """
+    Registro de fuentes por proceso: busca y registra la fuente TrueType una sola vez
+    (registerFont lee y analiza el .ttf completo). Los anchos se memorizan por carácter y
+    fuente (glyph_width).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._default_font = None
+
+    @property
+    def default_font(self):
+        if self._default_font is None:
+            with self._lock:
+                if self._default_font is None:
+                    self._default_font = self._register_default_font()
+        return self._default_font
+
+    @staticmethod
+    def _register_default_font():
+        try:
+            for font_name, paths in FONT_CANDIDATES:
+                if font_name in pdfmetrics.getRegisteredFontNames():
+                    return font_name
+                for font_path in paths:
+                    if os.path.exists(font_path):
+                        pdfmetrics.registerFont(TTFont(font_name, font_path))
+                        logger.info(f"Fuente {font_name} configurada desde: {font_path}")
+                        return font_name
+        except Exception as e:
+            logger.warning(f"Error configurando fuentes: {e}")
+            return FALLBACK_FONT
+        logger.info(f"Usando fuente {FALLBACK_FONT} por defecto")
+        return FALLBACK_FONT
+
+
+# Anchos a tamaño 1 por fuente y carácter; crecen con el alfabeto usado, no con los valores
+_glyph_widths = {}
+
+
+def glyph_width(char: str, font_name: str) -> float:
+    """Ancho de un carácter a tamaño 1 en la fuente"""
+    widths = _glyph_widths.setdefault(font_name, {})
+    if char not in widths:
+        widths[char] = pdfmetrics.stringWidth(char, font_name, 1)
+    return widths[char]
+
+
+def unit_width(text: str, font_name: str) -> float:
+    """
+    Ancho del texto a tamaño 1: suma de los anchos memorizados de sus caracteres, que se
+    reutilizan entre valores distintos. ReportLab no aplica kerning, así que el ancho a
+    otro tamaño es proporcional.
+    """
+    widths = _glyph_widths.setdefault(font_name, {})
+    try:
+        return sum(map(widths.__getitem__, text))
+    except KeyError:
+        return sum(glyph_width(char, font_name) for char in text)
+
+
+def string_width(text: str, font_name: str, size: float) -> float:
+    """Equivalente a pdfmetrics.stringWidth con los anchos de carácter memorizados por fuente"""
+    return unit_width(text, font_name) * size
+
+
+def fit_font_size(text: str, font_name: str, max_width: float, sizes=FIT_FONT_SIZES):
+    """
+    Mayor tamaño de sizes con el que el texto cabe en max_width, o None si no cabe con
+    ninguno. Mide el texto una sola vez y compara contra cada tamaño.
+    """
+    width = unit_width(text, font_name)
+    for size in sizes:
+        # Tolerancia por redondeo frente a medir directamente a cada tamaño
+        if width * size <= max_width + 1e-9:
+            return size
+    return None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_font_registry():
+    """Registro de fuentes compartido por el proceso"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = FontRegistry()
+    return _registry
@@ -0,0 +1,185 @@
+import io
+import time
+import logging
+import threading
+from django.conf import settings
+from pypdf import PdfReader, PdfWriter
+from services.local_ocr import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Palabras que identifican las páginas de la tarjeta de propiedad / licencia de tránsito
+RELEVANT_KEYWORDS = (
+    'LICENCIA DE TRANSITO', 'TARJETA DE PROPIEDAD', 'PLACA', 'MARCA', 'LINEA', 'MODELO',
+    'VIN', 'MOTOR', 'CHASIS', 'SERIE', 'PROPIETARIO', 'CARROCERIA', 'CILINDRADA',
+)
+
+
+class PreprocessResult:
+    """PDF reducido a enviar al modelo y métricas del preprocesamiento"""
+
+    def __init__(self, data, bytes_in, pages_in, pages_out=None, images_recompressed=0,
+                 elapsed=0.0, used_original=True):
+        self.data = data
+        self.bytes_in = bytes_in
+        self.bytes_out = len(data)
+        self.pages_in = pages_in
+        self.pages_out = pages_in if pages_out is None else pages_out
+        self.images_recompressed = images_recompressed
+        self.elapsed = elapsed
+        self.used_original = used_original
+
+    @property
+    def estimated_seconds_saved(self) -> float:
+        """
+        Estimación del tiempo ahorrado por documento: subida del base64 (4/3 de los bytes)
+        y procesamiento de páginas en el modelo, menos el tiempo de preprocesamiento.
+        """
+        bandwidth = getattr(settings, 'EXTRACTION_UPLOAD_BYTES_PER_SECOND', 1000000)
+        seconds_per_page = getattr(settings, 'EXTRACTION_MODEL_SECONDS_PER_PAGE', 0.5)
+        upload = (self.bytes_in - self.bytes_out) * 4 / 3 / bandwidth
+        pages = (self.pages_in - self.pages_out) * seconds_per_page
+        return upload + pages - self.elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'pages_in': self.pages_in,
+            'pages_out': self.pages_out,
+            'images_recompressed': self.images_recompressed,
+            'elapsed_seconds': round(self.elapsed, 4),
+            'estimated_seconds_saved': round(self.estimated_seconds_saved, 3),
+            'used_original': self.used_original,
+        }
+
+
+class PDFPreprocessor:
+    """
+    Reduce el PDF antes de enviarlo al modelo de visión:
+    - conserva solo las páginas relevantes (por palabras clave en la capa de texto;
+      en escaneos sin texto, las primeras EXTRACTION_PREPROCESS_MAX_PAGES),
+    - reduce las imágenes embebidas a EXTRACTION_PREPROCESS_TARGET_DPI y las recomprime en JPEG,
+    - descarta anotaciones, metadatos y objetos no referenciados por las páginas conservadas.
+
+    Ante cualquier error, o si el resultado no es más pequeño, se usa el PDF original.
+    """
+
+    _lock = threading.Lock()
+    _totals = {'documents': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds_saved': 0.0}
+
+    def __init__(self):
+        self.max_pages = getattr(settings, 'EXTRACTION_PREPROCESS_MAX_PAGES', 2)
+        self.target_dpi = getattr(settings, 'EXTRACTION_PREPROCESS_TARGET_DPI', 150)
+        self.jpeg_quality = getattr(settings, 'EXTRACTION_PREPROCESS_JPEG_QUALITY', 75)
+
+    def prepare(self, pdf_bytes: bytes) -> PreprocessResult:
+        started = time.perf_counter()
+        try:
+            reader = PdfReader(io.BytesIO(pdf_bytes))
+            pages_in = len(reader.pages)
+        except Exception as e:
+            logger.warning(f"No se pudo preprocesar el PDF, se envía el original: {e}")
+            return PreprocessResult(pdf_bytes, len(pdf_bytes), 0)
+
+        try:
+            selected = self.select_pages(reader)
+            writer = PdfWriter()
+            for index in selected:
+                writer.add_page(reader.pages[index])
+            writer.remove_annotations(subtypes=None)
+
+            recompressed = 0
+            for page in writer.pages:
+                recompressed += self._downsample_images(page)
+                page.compress_content_streams()
+
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            reduced = buffer.getvalue()
+
+            # El resultado debe seguir siendo un PDF legible con las páginas elegidas
+            if len(PdfReader(io.BytesIO(reduced)).pages) != len(selected):
+                raise ValueError("el PDF reducido no conserva las páginas seleccionadas")
+        except Exception as e:
+            logger.warning(f"Preprocesamiento fallido, se envía el original: {e}")
+            return PreprocessResult(pdf_bytes, len(pdf_bytes), pages_in, elapsed=time.perf_counter() - started)
+
+        elapsed = time.perf_counter() - started
+        if len(reduced) >= len(pdf_bytes):
+            result = PreprocessResult(pdf_bytes, len(pdf_bytes), pages_in, elapsed=elapsed)
+        else:
+            result = PreprocessResult(
+                reduced, len(pdf_bytes), pages_in,
+                pages_out=len(selected),
+                images_recompressed=recompressed,
+                elapsed=elapsed,
+                used_original=False,
+            )
+        self._record(result)
+        logger.info(
+            f"Preprocesamiento PDF: {result.bytes_in} -> {result.bytes_out} bytes, "
+            f"{result.pages_in} -> {result.pages_out} páginas, {recompressed} imágenes recomprimidas, "
+            f"ahorro estimado {result.estimated_seconds_saved:.2f}s"
+        )
+        return result
+
+    def select_pages(self, reader) -> list:
+        """Índices de las páginas a enviar, en su orden original"""
+        scores = []
+        for index, page in enumerate(reader.pages):
+            try:
+                text = normalize_text(page.extract_text() or '')
+            except Exception:
+                text = ''
+            scores.append((sum(1 for keyword in RELEVANT_KEYWORDS if keyword in text), index))
+
+        relevant = [index for score, index in sorted(scores, key=lambda item: (-item[0], item[1])) if score > 0]
+        if not relevant:
+            # Escaneo sin capa de texto: la tarjeta ocupa las primeras páginas (anverso y reverso)
+            return list(range(min(self.max_pages, len(reader.pages))))
+        return sorted(relevant[:self.max_pages])
+
+    def _downsample_images(self, page) -> int:
+        """Reduce las imágenes de la página que superan la resolución objetivo"""
+        from PIL import Image
+
+        page_width_in = float(page.mediabox.width) / 72
+        page_height_in = float(page.mediabox.height) / 72
+        recompressed = 0
+        for image_file in page.images:
+            image = image_file.image
+            if image is None:
+                continue
+            # Cota inferior de la resolución: la imagen ocupa como mucho la página completa
+            dpi = max(image.width / page_width_in, image.height / page_height_in)
+            if dpi <= self.target_dpi * 1.1:
+                continue
+            scale = self.target_dpi / dpi
+            resized = image.resize(
+                (max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                Image.LANCZOS,
+            )
+            if resized.mode not in ('RGB', 'L'):
+                resized = resized.convert('RGB')
+            image_file.replace(resized, quality=self.jpeg_quality)
+            recompressed += 1
+        return recompressed
+
+    @classmethod
+    def _record(cls, result):
+        with cls._lock:
+            cls._totals['documents'] += 1
+            cls._totals['bytes_in'] += result.bytes_in
+            cls._totals['bytes_out'] += result.bytes_out
+            cls._totals['seconds_saved'] += result.estimated_seconds_saved
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Totales del proceso actual"""
+        with cls._lock:
+            totals = dict(cls._totals)
+        totals['reduction_ratio'] = (
+            1 - totals['bytes_out'] / totals['bytes_in'] if totals['bytes_in'] else 0.0
+        )
+        return totals
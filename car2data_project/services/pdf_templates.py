@@ -0,0 +1,389 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+from PyPDF2 import PageObject, PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre del recurso con el que cada página generada invoca el XObject de la plantilla
+TEMPLATE_XOBJECT_NAME = '/Car2DataPlantilla'
+# Cajas y atributos de página que se copian de la plantilla (el MediaBox lo crea create_blank_page)
+PAGE_BOX_KEYS = ('/CropBox', '/BleedBox', '/TrimBox', '/ArtBox', '/Rotate', '/UserUnit')
+# Nombre del recurso con el que la actualización incremental dibuja el overlay de cada página
+OVERLAY_XOBJECT_NAME = '/Car2DataOverlay'
+# Claves del trailer original que se repiten en el trailer de la actualización incremental
+TRAILER_KEYS = ('/Root', '/Info', '/ID')
+
+
+def _last_startxref(data):
+    """Posición de la última tabla xref declarada al final del archivo, o None"""
+    position = data.rfind(b'startxref')
+    if position < 0:
+        return None
+    try:
+        return int(data[position + len(b'startxref'):].split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+class _ObjectCopier:
+    """
+    Copia objetos de otro PDF (el overlay) con números de objeto nuevos a partir de
+    first_number, siguiendo sus referencias indirectas. Las referencias a la plantilla
+    no pasan por aquí: conservan su número porque el archivo base es la propia plantilla.
+    """
+
+    def __init__(self, first_number):
+        self.next_number = first_number
+        self.objects = []
+        self._numbers = {}
+
+    def add(self, obj):
+        """Registra un objeto nuevo y retorna su referencia"""
+        number = self.next_number
+        self.next_number += 1
+        self.objects.append((number, obj))
+        return IndirectObject(number, 0, None)
+
+    def copy(self, obj):
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self._numbers:
+                number = self.next_number
+                self.next_number += 1
+                self._numbers[key] = number
+                # Reserva el lugar antes de copiar para que los ciclos reutilicen el número
+                index = len(self.objects)
+                self.objects.append((number, None))
+                self.objects[index] = (number, self.copy(obj.get_object()))
+            return IndirectObject(self._numbers[key], 0, None)
+        if isinstance(obj, StreamObject):
+            stream = DecodedStreamObject()
+            stream.update({key: self.copy(value) for key, value in obj.items() if key != '/Length'})
+            # Datos tal como están en el archivo: /Filter se conserva en el diccionario
+            stream._data = obj._data
+            return stream
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self.copy(value) for key, value in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(value) for value in obj)
+        return obj
+
+
+class PdfTemplate:
+    """
+    Plantilla PDF leída una sola vez: bytes, páginas ya analizadas y tamaño de cada página.
+    Las páginas compartidas no se modifican: add_pages_to() las clona en el PdfWriter de
+    cada petición para combinar el overlay sobre las copias (motor 'merge'),
+    add_xobject_pages_to() dibuja cada página como un Form XObject precalculado (motor 'xobject')
+    y write_incremental() agrega el overlay como actualización incremental de los bytes
+    originales (motor 'incremental').
+    """
+
+    def __init__(self, path, data, mtime_ns):
+        self.path = path
+        self.data = data
+        self.mtime_ns = mtime_ns
+        # Identifica el contenido de la plantilla (p. ej. en las claves de la caché de generación)
+        self.version = hashlib.sha256(data).hexdigest()
+        self.reader = PdfReader(io.BytesIO(data))
+        self.page_sizes = [(float(page.mediabox.width), float(page.mediabox.height)) for page in self.reader.pages]
+        # El lector resuelve objetos bajo demanda sobre un único flujo: clonar con exclusión mutua
+        self._lock = threading.Lock()
+        self._form_xobjects = None
+        self._incremental_pages = None
+        self.startxref = _last_startxref(data)
+
+    @property
+    def page_count(self):
+        return len(self.page_sizes)
+
+    def page_size(self, index=0):
+        return self.page_sizes[index]
+
+    def add_pages_to(self, writer):
+        """Agrega copias de todas las páginas al writer y retorna las páginas agregadas"""
+        with self._lock:
+            return [writer.add_page(page) for page in self.reader.pages]
+
+    @property
+    def supports_xobject(self):
+        """Las anotaciones y campos de formulario no viajan dentro de un Form XObject"""
+        return not any('/Annots' in page for page in self.reader.pages)
+
+    def _get_form_xobjects(self):
+        """
+        Convierte cada página en un Form XObject comprimido (una sola vez): su contenido
+        decodificado, con los recursos y el MediaBox de la página como /Resources y /BBox.
+        """
+        if self._form_xobjects is None:
+            xobjects = []
+            for page in self.reader.pages:
+                contents = page.get('/Contents')
+                contents = contents.get_object() if contents is not None else None
+                if contents is None:
+                    streams = []
+                elif isinstance(contents, ArrayObject):
+                    streams = [stream.get_object() for stream in contents]
+                else:
+                    streams = [contents]
+                content = DecodedStreamObject()
+                content.set_data(b'\n'.join(stream.get_data() for stream in streams))
+                xobject = content.flate_encode()
+                xobject[NameObject('/Type')] = NameObject('/XObject')
+                xobject[NameObject('/Subtype')] = NameObject('/Form')
+                xobject[NameObject('/BBox')] = ArrayObject(FloatObject(value) for value in page.mediabox)
+                xobject[NameObject('/Resources')] = page.get('/Resources', DictionaryObject())
+                xobjects.append(xobject)
+            self._form_xobjects = xobjects
+        return self._form_xobjects
+
+    def add_xobject_pages_to(self, writer, overlay_pages=()):
+        """
+        Agrega una página por cada página de la plantilla con solo dos flujos de contenido:
+        "q /Plantilla Do Q", que dibuja el Form XObject precalculado, y el flujo del overlay
+        tal cual. No se analiza ni reescribe el contenido de la plantilla en cada petición.
+        Retorna las páginas agregadas.
+        """
+        pages = []
+        with self._lock:
+            xobjects = self._get_form_xobjects()
+            for index, (template_page, xobject) in enumerate(zip(self.reader.pages, xobjects)):
+                # add_page clona la página: se edita la copia que retorna
+                width, height = self.page_sizes[index]
+                page = writer.add_page(PageObject.create_blank_page(None, width, height))
+                for key in PAGE_BOX_KEYS:
+                    if key in template_page:
+                        page[NameObject(key)] = template_page[key].clone(writer)
+                template_ref = writer._add_object(xobject.clone(writer))
+                pages.append((page, template_ref))
+
+        for index, (page, template_ref) in enumerate(pages):
+            resources = DictionaryObject()
+            contents = ArrayObject()
+            overlay = overlay_pages[index] if index < len(overlay_pages) else None
+            if overlay is not None:
+                if '/Resources' in overlay:
+                    resources = overlay['/Resources'].get_object().clone(writer)
+                overlay_contents = overlay.raw_get('/Contents').clone(writer)
+                overlay_contents = overlay_contents if isinstance(overlay_contents, ArrayObject) else [overlay_contents]
+
+            xobject_names = resources.get('/XObject', DictionaryObject()).get_object()
+            xobject_names[NameObject(TEMPLATE_XOBJECT_NAME)] = template_ref
+            resources[NameObject('/XObject')] = xobject_names
+
+            prefix = DecodedStreamObject()
+            prefix.set_data(f'q {TEMPLATE_XOBJECT_NAME} Do Q\n'.encode('ascii'))
+            contents.append(writer._add_object(prefix))
+            if overlay is not None:
+                contents.extend(overlay_contents)
+            page[NameObject('/Resources')] = resources
+            page[NameObject('/Contents')] = contents
+        return [page for page, _ in pages]
+
+    @property
+    def supports_incremental(self):
+        """
+        La actualización se escribe con una tabla xref clásica: requiere que la última
+        sección de la plantilla también lo sea (o sea híbrida) y que no esté cifrada.
+        """
+        return (
+            not self.reader.is_encrypted
+            and self.startxref is not None
+            and self.data[self.startxref:self.startxref + 4] == b'xref'
+        )
+
+    def _get_incremental_pages(self):
+        """
+        Por página (una sola vez): su referencia, su diccionario sin /Contents ni
+        /Resources, las referencias a sus flujos de contenido y sus recursos con el
+        diccionario /XObject ya resuelto para poder agregarle el overlay.
+        """
+        if self._incremental_pages is None:
+            pages = []
+            for page in self.reader.pages:
+                entries = DictionaryObject(
+                    (key, value) for key, value in page.items() if key not in ('/Contents', '/Resources')
+                )
+                contents = page.raw_get('/Contents') if '/Contents' in page else ArrayObject()
+                if not isinstance(contents, ArrayObject):
+                    contents = ArrayObject([contents])
+                resources = DictionaryObject(page['/Resources'].get_object()) if '/Resources' in page else DictionaryObject()
+                resources[NameObject('/XObject')] = DictionaryObject(
+                    resources.get('/XObject', DictionaryObject()).get_object()
+                )
+                pages.append((page.indirect_reference, entries, contents, resources))
+            self._incremental_pages = pages
+        return self._incremental_pages
+
+    def write_incremental(self, stream, overlay_pages=()):
+        """
+        Escribe en stream los bytes originales de la plantilla seguidos de una
+        actualización incremental: los objetos del overlay (un Form XObject por página
+        con sus recursos), cada página reescrita con el mismo número de objeto, una
+        sección xref solo con esos objetos y un trailer con /Prev hacia la xref original.
+        El contenido original queda entre q/Q para que el overlay se dibuje con el
+        estado gráfico inicial. Retorna el número de bytes escritos.
+        """
+        with self._lock:
+            template_pages = self._get_incremental_pages()
+            trailer = self.reader.trailer
+            size = int(trailer['/Size'])
+            trailer_entries = {NameObject(key): trailer.raw_get(key) for key in TRAILER_KEYS if key in trailer}
+
+        copier = _ObjectCopier(size)
+        updated_pages = []
+        save_state = None
+        for index, (reference, entries, contents, resources) in enumerate(template_pages):
+            overlay = overlay_pages[index] if index < len(overlay_pages) else None
+            if overlay is None:
+                continue
+
+            overlay_contents = overlay.get_contents()
+            xobject = DecodedStreamObject()
+            xobject.set_data(overlay_contents.get_data() if overlay_contents is not None else b'')
+            xobject = xobject.flate_encode()
+            xobject[NameObject('/Type')] = NameObject('/XObject')
+            xobject[NameObject('/Subtype')] = NameObject('/Form')
+            xobject[NameObject('/BBox')] = ArrayObject(FloatObject(value) for value in overlay.mediabox)
+            if '/Resources' in overlay:
+                xobject[NameObject('/Resources')] = copier.copy(overlay.raw_get('/Resources'))
+
+            if save_state is None:
+                save_state = DecodedStreamObject()
+                save_state.set_data(b'q\n')
+                save_state = copier.add(save_state)
+            draw_overlay = DecodedStreamObject()
+            draw_overlay.set_data(f'\nQ\nq {OVERLAY_XOBJECT_NAME} Do Q\n'.encode('ascii'))
+
+            page = DictionaryObject(entries)
+            page_resources = DictionaryObject(resources)
+            xobject_names = DictionaryObject(resources['/XObject'])
+            xobject_names[NameObject(OVERLAY_XOBJECT_NAME)] = copier.add(xobject)
+            page_resources[NameObject('/XObject')] = xobject_names
+            page[NameObject('/Resources')] = page_resources
+            page[NameObject('/Contents')] = ArrayObject([save_state, *contents, copier.add(draw_overlay)])
+            updated_pages.append((reference.idnum, reference.generation, page))
+
+        written = 0
+
+        def write(chunk):
+            nonlocal written
+            stream.write(chunk)
+            written += len(chunk)
+
+        write(self.data)
+        if not self.data.endswith(b'\n'):
+            write(b'\n')
+
+        offsets = {}
+        objects = [(number, 0, obj) for number, obj in copier.objects]
+        objects.extend(updated_pages)
+        for number, generation, obj in objects:
+            offsets[number] = (written, generation)
+            buffer = io.BytesIO()
+            buffer.write(f'{number} {generation} obj\n'.encode('ascii'))
+            obj.write_to_stream(buffer, None)
+            buffer.write(b'\nendobj\n')
+            write(buffer.getvalue())
+
+        # Tabla xref clásica por tramos de números consecutivos (entradas de 20 bytes). Se
+        # repite la entrada libre del objeto 0: PyPDF2 asume que la primera sección empieza
+        # en 0 y, si no, "corrige" los números de objeto
+        xref_offset = written
+        lines = [b'xref\n0 1\n0000000000 65535 f\r\n']
+        numbers = sorted(offsets)
+        run_start = 0
+        for position in range(1, len(numbers) + 1):
+            if position == len(numbers) or numbers[position] != numbers[position - 1] + 1:
+                run = numbers[run_start:position]
+                lines.append(f'{run[0]} {len(run)}\n'.encode('ascii'))
+                for number in run:
+                    offset, generation = offsets[number]
+                    lines.append(f'{offset:010d} {generation:05d} n\r\n'.encode('ascii'))
+                run_start = position
+        write(b''.join(lines))
+
+        new_trailer = DictionaryObject(trailer_entries)
+        new_trailer[NameObject('/Size')] = NumberObject(max(size, copier.next_number))
+        new_trailer[NameObject('/Prev')] = NumberObject(self.startxref)
+        buffer = io.BytesIO()
+        buffer.write(b'trailer\n')
+        new_trailer.write_to_stream(buffer, None)
+        buffer.write(f'\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii'))
+        write(buffer.getvalue())
+        return written
+
+
+class PdfTemplateRegistry:
+    """
+    Caché por proceso de plantillas PDF, indexada por ruta. Cada acceso compara la fecha
+    de modificación y el tamaño del archivo y vuelve a leerlo si cambió en disco.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Retorna la PdfTemplate de la ruta, o None si el archivo no existe"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            logger.warning(f"Plantilla no encontrada: {path}")
+            return None
+
+        template = self._templates.get(path)
+        if template is not None and template.mtime_ns == stat.st_mtime_ns and len(template.data) == stat.st_size:
+            return template
+
+        with self._lock:
+            template = self._templates.get(path)
+            if template is None or template.mtime_ns != stat.st_mtime_ns or len(template.data) != stat.st_size:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                template = PdfTemplate(path, data, stat.st_mtime_ns)
+                self._templates[path] = template
+                logger.info(f"Plantilla cargada: {path} ({template.page_count} páginas, {len(data)} bytes)")
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    """Registro de plantillas compartido por el proceso"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PdfTemplateRegistry()
+    return _registry
+
+
+def reset_template_registry():
+    """Descarta el registro (p. ej. en el hijo tras un fork, donde los locks pueden quedar tomados)"""
+    global _registry, _registry_lock
+    _registry = None
+    _registry_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_template_registry)
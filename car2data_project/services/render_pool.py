@@ -0,0 +1,145 @@
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from services.form_rendering import FORM_TYPES, render_form_to_path
+
+logger = logging.getLogger(__name__)
+
+# Generador del proceso worker, creado por init_worker con fuentes y plantillas ya cargadas
+_worker_generator = None
+
+
+def init_worker(form_types=FORM_TYPES):
+    """
+    Inicializa un proceso de renderizado antes de su primer formulario: Django (si el
+    proceso se creó con spawn), la fuente registrada y las plantillas de form_types (un
+    tipo o una tupla de tipos) leídas. Los registros de fuentes y plantillas se descartan
+    al hacer fork, así que se calientan aquí y no en el padre. El worker solo renderiza:
+    no usa la base de datos.
+    """
+    global _worker_generator
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from services.DocumentGenerator import DocumentGenerator
+    from services.pdf_fonts import get_font_registry
+    from services.pdf_templates import get_template_registry
+
+    if isinstance(form_types, str):
+        form_types = (form_types,)
+    _worker_generator = DocumentGenerator()
+    get_font_registry().default_font
+    for form_type in form_types:
+        template_path = _worker_generator.pdf_form_filler.get_template_path(form_type)
+        if template_path:
+            get_template_registry().load(template_path)
+
+
+def render_in_worker(form_type, form_data, file_path):
+    """Renderiza un formulario con el generador del proceso; retorna True si se generó"""
+    if _worker_generator is None:
+        init_worker()
+    try:
+        return bool(render_form_to_path(form_type, form_data, file_path, generator=_worker_generator))
+    except Exception as e:
+        logger.error(f"Error generando {file_path}: {e}")
+        return False
+
+
+def render_pool_workers():
+    return getattr(settings, 'RENDER_POOL_WORKERS', 0) or min(4, os.cpu_count() or 1)
+
+
+class RenderPool:
+    """
+    Pool de procesos persistente para renderizar varios formularios a la vez dentro de una
+    petición (el paquete de traspaso, la generación en lote). Los procesos se crean con spawn la primera
+    vez que se usa, con todas las plantillas y la fuente ya cargadas, y se reutilizan en
+    las peticiones siguientes: la latencia de un paquete queda cerca de la del formulario
+    más lento. Spawn evita hacer fork de un servidor con hilos y heredar sus conexiones.
+    Con RENDER_POOL_WORKERS=1 (o una sola CPU) se renderiza en el mismo proceso.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or render_pool_workers()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=init_worker,
+                    )
+                    logger.info(f"Pool de renderizado iniciado con {self.workers} procesos")
+        return self._executor
+
+    def render(self, jobs):
+        """
+        Renderiza jobs, una lista de (tipo de formulario, datos, ruta), y retorna una lista
+        de éxitos en el mismo orden. Si el pool se rompe (un worker murió) se descarta y los
+        formularios se renderizan en el proceso actual.
+        """
+        if not jobs:
+            return []
+        if self.workers <= 1 or len(jobs) == 1:
+            return [render_in_worker(*job) for job in jobs]
+
+        try:
+            futures = [self._get_executor().submit(render_in_worker, *job) for job in jobs]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            logger.warning("Pool de renderizado roto; se reinicia y se renderiza en el proceso actual")
+            self.shutdown()
+            return [render_in_worker(*job) for job in jobs]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Pool de renderizado compartido por el proceso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool()
+    return _pool
+
+
+def reset_render_pool():
+    """
+    Descarta el pool (p. ej. en el hijo tras un fork: los procesos del pool pertenecen
+    al padre y los locks pueden quedar tomados)
+    """
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+@atexit.register
+def _shutdown_render_pool():
+    if _pool is not None:
+        _pool.shutdown()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_render_pool)
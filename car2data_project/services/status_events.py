@@ -0,0 +1,260 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Estados finales: el cliente deja de escuchar al recibirlos
+FINAL_STATUSES = ('completed', 'error')
+
+# Eventos en espera por suscriptor; si el cliente no los consume se descartan los nuevos
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def document_status_data(document):
+    """Estado de un documento, con el mismo formato que la vista documents:status"""
+    return {
+        'status': document.status,
+        'processed_at': document.processed_at.isoformat() if document.processed_at else None,
+        'error': document.extraction_error,
+    }
+
+
+def form_job_status_data(job):
+    """Estado de un trabajo de generación, con el mismo formato que la vista forms_generation:job_status"""
+    completed = job.status == 'completed' and job.generated_form_id
+    return {
+        'status': job.status,
+        'error': job.error or None,
+        'form_id': job.generated_form_id,
+        'redirect_url': reverse('forms_generation:download', args=[job.generated_form_id]) if completed else None,
+    }
+
+
+# Tipo de evento -> función (user, ids) con los eventos del estado actual de esos objetos.
+# Cada app registra la suya al iniciar, así el canal no depende de los modelos de las apps.
+_snapshot_sources = {}
+
+
+def register_status_source(event_type, snapshot):
+    _snapshot_sources[event_type] = snapshot
+
+
+def status_snapshot(user, ids_by_type):
+    """Estado actual de los objetos pedidos ({tipo: ids}), como eventos"""
+    events = []
+    for event_type, ids in ids_by_type.items():
+        if ids and event_type in _snapshot_sources:
+            events.extend(_snapshot_sources[event_type](user, ids))
+    return events
+
+
+def document_event(document):
+    return {'type': 'document', 'id': document.id, **document_status_data(document)}
+
+
+def form_job_event(job):
+    return {'type': 'form_job', 'id': job.id, **form_job_status_data(job)}
+
+
+def format_sse(event):
+    """Serializa un evento en el formato de text/event-stream; el nombre del evento es su tipo"""
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+class LocalSubscription:
+    """
+    Suscripción a un canal del broker en memoria. Los eventos llegan desde cualquier
+    thread (señales de los workers de extracción o del executor de generación) y se
+    entregan en la cola asyncio del event loop que se suscribió.
+    """
+
+    def __init__(self, broker, channel, loop):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"Suscriptor de {self.channel} saturado; se descarta un evento {event['type']}")
+
+    async def get(self, timeout):
+        """Siguiente evento, o None si no llega ninguno en timeout segundos"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessStatusBroker:
+    """
+    Pub/sub en memoria del proceso. Solo entrega eventos publicados en el mismo proceso
+    que atiende la conexión: sirve con un único proceso ASGI que también ejecuta la
+    extracción y la generación. Con varios procesos se usa RedisStatusBroker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # El event loop del suscriptor ya se cerró
+                self.unsubscribe(subscription)
+
+    async def subscribe(self, channel):
+        subscription = LocalSubscription(self, channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class RedisSubscription:
+    """Suscripción a un canal de Redis con el cliente asyncio de redis-py"""
+
+    def __init__(self, client, pubsub):
+        self._client = client
+        self._pubsub = pubsub
+
+    async def get(self, timeout):
+        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    async def close(self):
+        try:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+            await self._client.aclose()
+        except redis.RedisError as e:
+            logger.warning(f"Error cerrando la suscripción de Redis: {e}")
+
+
+class RedisStatusBroker:
+    """
+    Pub/sub sobre Redis para despliegues con varios procesos (workers de extracción
+    separados del servidor ASGI, varios workers web): cualquier proceso publica y el
+    que atiende la conexión del usuario recibe. Si Redis falla al publicar se registra
+    y se sigue; el cliente recupera el estado al reconectar.
+    """
+
+    def __init__(self, url, prefix='car2data:status:'):
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, event):
+        try:
+            self._client.publish(self.prefix + channel, json.dumps(event, cls=DjangoJSONEncoder))
+        except redis.RedisError as e:
+            logger.warning(f"No se pudo publicar el evento en Redis: {e}")
+
+    async def subscribe(self, channel):
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.prefix + channel)
+        return RedisSubscription(client, pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_status_broker():
+    """
+    Broker de eventos de estado del proceso: Redis si STATUS_EVENTS_REDIS_URL está
+    configurado y redis-py instalado, si no el broker en memoria
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                redis_url = getattr(settings, 'STATUS_EVENTS_REDIS_URL', '')
+                if redis_url and REDIS_AVAILABLE:
+                    _broker = RedisStatusBroker(redis_url)
+                    logger.info("Eventos de estado publicados en Redis")
+                else:
+                    if redis_url:
+                        logger.warning("STATUS_EVENTS_REDIS_URL configurado pero redis no está instalado; se usa el broker en memoria")
+                    _broker = InProcessStatusBroker()
+    return _broker
+
+
+def reset_status_broker():
+    """Descarta el broker (p. ej. en el hijo tras un fork: la conexión y los suscriptores son del padre)"""
+    global _broker, _broker_lock
+    _broker = None
+    _broker_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_status_broker)
+
+
+def publish_status(user_id, event):
+    """
+    Publica un cambio de estado para el usuario cuando se confirma la transacción, para
+    que quien lo reciba y consulte la base de datos vea el estado nuevo. Un fallo al
+    publicar nunca interrumpe el procesamiento.
+    """
+    def send():
+        try:
+            get_status_broker().publish(user_channel(user_id), event)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el evento de estado {event['type']} {event['id']}: {e}")
+
+    transaction.on_commit(send)
+
+
+def publish_document_status(document):
+    publish_status(document.user_id, document_event(document))
+
+
+def publish_form_job_status(job):
+    publish_status(job.user_id, form_job_event(job))
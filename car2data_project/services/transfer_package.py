@@ -0,0 +1,155 @@
+import os
+import logging
+from django.conf import settings
+from services.form_rendering import build_form_data, generated_file_name, split_apellidos_nombres, tramite_base_data
+from services.generation_cache import GenerationCache
+from services.render_pool import get_render_pool
+
+logger = logging.getLogger(__name__)
+
+# Documentos del paquete de traspaso, en el orden del PDF combinado
+PACKAGE_FORM_TYPES = ('contrato_compraventa', 'contrato_mandato', 'formulario_tramite')
+
+EMPTY_PERSON = {'nombre': '', 'documento': '', 'direccion': '', 'telefono': '', 'ciudad': ''}
+
+
+class TransferPackageError(Exception):
+    """No se pudo generar alguno de los documentos del paquete"""
+
+
+def package_form_data(extracted_data, data):
+    """
+    Datos de los tres documentos del traspaso a partir de una sola lectura de los datos
+    estructurados del documento y de los datos comunes de la venta (data): vendedor,
+    comprador, mandatario opcional, valor y forma de pago, ciudad y fecha del contrato,
+    organismo de tránsito y trámites autorizados. El vendedor firma el mandato como
+    mandante y figura como propietario en el formulario de trámite (sus datos tienen
+    prioridad sobre los extraídos).
+    """
+    vendedor = data.get('vendedor') or {}
+    comprador = data.get('comprador') or {}
+    vehiculo = extracted_data.get('vehiculo', {}) or {}
+    organismo_transito = data.get('organismo_transito') or extracted_data.get('registro', {}).get('organismo_transito') or ''
+
+    compraventa = build_form_data('contrato_compraventa', extracted_data, {
+        'vendedor': vendedor,
+        'comprador': comprador,
+        'valor_venta': data.get('valor_venta'),
+        'forma_pago': data.get('forma_pago', ''),
+        'ciudad_contrato': data.get('ciudad_contrato', ''),
+        'fecha_contrato': data.get('fecha_contrato'),
+        'organismo_transito': organismo_transito,
+    })
+
+    mandato = build_form_data('contrato_mandato', extracted_data, {
+        'mandante': vendedor,
+        'mandatario': data.get('mandatario') or EMPTY_PERSON,
+        'vehiculo': vehiculo,
+        'placa': vehiculo.get('placa', ''),
+        'tramites_autorizados': data.get('tramites_autorizados', ''),
+        'organismo_transito': organismo_transito,
+        'ciudad_contrato': data.get('ciudad_contrato', ''),
+        'fecha_contrato': data.get('fecha_contrato'),
+    })
+
+    vendedor_ap1, vendedor_ap2, vendedor_nombres = split_apellidos_nombres(vendedor.get('nombre'))
+    ap1, ap2, nombres = split_apellidos_nombres(comprador.get('nombre'))
+    tramite = tramite_base_data(extracted_data)
+    sale_fields = {
+        'propietario_primer_apellido': vendedor_ap1,
+        'propietario_segundo_apellido': vendedor_ap2,
+        'propietario_nombres': vendedor_nombres,
+        'propietario_documento': vendedor.get('documento'),
+        'propietario_direccion': vendedor.get('direccion'),
+        'propietario_ciudad': vendedor.get('ciudad'),
+        'propietario_telefono': vendedor.get('telefono'),
+        'comprador_primer_apellido': ap1,
+        'comprador_segundo_apellido': ap2,
+        'comprador_nombres': nombres,
+        'comprador_documento': comprador.get('documento'),
+        'comprador_direccion': comprador.get('direccion'),
+        'comprador_ciudad': comprador.get('ciudad'),
+        'comprador_telefono': comprador.get('telefono'),
+        'organismo_transito': organismo_transito,
+    }
+    # Igual que en la vista, los campos vacíos no sobrescriben los extraídos
+    tramite.update({key: value for key, value in sale_fields.items() if value is not None and value != ''})
+    tramite = build_form_data('formulario_tramite', extracted_data, tramite)
+
+    return {
+        'contrato_compraventa': compraventa,
+        'contrato_mandato': mandato,
+        'formulario_tramite': tramite,
+    }
+
+
+def generate_transfer_package(document, data):
+    """
+    Genera la compraventa, el mandato y el formulario de trámite de un documento con los
+    mismos datos de la venta. Los que ya existan en la caché de generación se reutilizan;
+    el resto se renderiza a la vez en el pool de renderizado. Retorna los tres
+    GeneratedForm en el orden de PACKAGE_FORM_TYPES, o lanza TransferPackageError sin
+    crear ninguno si falla alguno. Como la generación en lote, no guarda Vehiculo,
+    Persona ni contratos en la base de datos.
+    """
+    from apps.forms_generation.models import GeneratedForm
+
+    if document.status != 'completed':
+        raise TransferPackageError('El documento no ha sido procesado')
+
+    payloads = package_form_data(document.get_structured_data(), data)
+
+    cache = GenerationCache()
+    with cache.releasing_on_error([]) as held:
+        planned = []  # (tipo, archivo, artefacto o None, clave, datos si hay que renderizar)
+        for form_type in PACKAGE_FORM_TYPES:
+            form_data = payloads[form_type]
+            key = cache.make_key(form_type, form_data)
+            artifact = cache.acquire(key)
+            if artifact is not None:
+                held.append(artifact)
+                planned.append((form_type, artifact.file.name, artifact, key, None))
+            else:
+                planned.append((form_type, generated_file_name(form_type, document.id), None, key, form_data))
+
+        pending = [entry for entry in planned if entry[4] is not None]
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'generated_forms'), exist_ok=True)
+        successes = get_render_pool().render([
+            (form_type, form_data, os.path.join(settings.MEDIA_ROOT, file_name))
+            for form_type, file_name, _, _, form_data in pending
+        ])
+
+        if not all(successes):
+            failed = [entry[0] for entry, success in zip(pending, successes) if not success]
+            # Nada queda a medias: se borran los renderizados y, al salir con la excepción,
+            # se devuelven las referencias tomadas
+            for _, file_name, artifact, _, form_data in planned:
+                if artifact is None and os.path.exists(os.path.join(settings.MEDIA_ROOT, file_name)):
+                    os.remove(os.path.join(settings.MEDIA_ROOT, file_name))
+            logger.error(f"Paquete de traspaso del documento {document.id}: fallaron {', '.join(failed)}")
+            raise TransferPackageError(f"Error al generar: {', '.join(failed)}")
+
+        forms = []
+        for form_type, file_name, artifact, key, form_data in planned:
+            if form_data is not None:
+                artifact = cache.store(key, form_type, file_name)
+                if artifact is not None:
+                    held.append(artifact)
+            generated_form = GeneratedForm(
+                user=document.user,
+                document=document,
+                form_type=form_type,
+                generated_file=file_name,
+                artifact=artifact,
+            )
+            # bulk_create no llama a save(): se copian aquí la placa y la etiqueta del vehículo
+            generated_form.set_vehicle_fields()
+            forms.append(generated_form)
+
+        forms = GeneratedForm.objects.bulk_create(forms)
+
+    logger.info(
+        f"Paquete de traspaso del documento {document.id}: {len(pending)} renderizados, "
+        f"{len(planned) - len(pending)} desde caché"
+    )
+    return forms
@@ -0,0 +1,74 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+# Valores mostrados cuando el usuario no tiene suscripción
+DEFAULT_SUBSCRIPTION_CONTEXT = {
+    'subscription': None,
+    'documents_used': 0,
+    'documents_limit': 3,
+    'documents_remaining': 3,
+    'can_upload': True,
+    'plan_name': 'Starter',
+}
+
+
+def _cache_key(user_id):
+    return f'user_stats:{user_id}'
+
+
+def get_subscription_context(user):
+    """Datos de la suscripción usados por el dashboard y el historial"""
+    try:
+        subscription = user.subscription
+    except Exception:
+        return dict(DEFAULT_SUBSCRIPTION_CONTEXT)
+    return {
+        'subscription': subscription,
+        'documents_used': subscription.documents_used,
+        'documents_limit': subscription.get_documents_limit(),
+        'documents_remaining': subscription.get_remaining_documents(),
+        'can_upload': subscription.can_generate_document(),
+        'plan_name': subscription.get_plan_display(),
+    }
+
+
+def get_document_counts(user_id):
+    """Totales de documentos del usuario por estado, con una sola consulta agrupada"""
+    from apps.documents.models import Document
+
+    by_status = dict(
+        Document.objects.filter(user_id=user_id)
+        .order_by()
+        .values_list('status')
+        .annotate(total=Count('id'))
+    )
+    return {
+        'total_documents': sum(by_status.values()),
+        'processed_documents': by_status.get('completed', 0),
+        'processing_documents': by_status.get('pending', 0) + by_status.get('processing', 0),
+        'error_documents': by_status.get('error', 0),
+    }
+
+
+def get_user_stats(user):
+    """
+    Contadores de documentos y datos de la suscripción del usuario, cacheados
+    USER_STATS_CACHE_TTL segundos. Las señales de apps.documents invalidan la entrada
+    cuando cambia el estado de un documento o la suscripción; el TTL acota el desfase
+    cuando el cambio ocurre en otro proceso y la caché no es compartida.
+    """
+    key = _cache_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = get_document_counts(user.pk)
+        stats.update(get_subscription_context(user))
+        cache.set(key, stats, getattr(settings, 'USER_STATS_CACHE_TTL', 30))
+    return stats
+
+
+def invalidate_user_stats(user_id):
+    cache.delete(_cache_key(user_id))
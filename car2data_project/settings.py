@@ -217,6 +217,117 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
+# Caché de extracción (resultados de Gemini indexados por hash del PDF)
+EXTRACTION_CACHE_ENABLED = os.environ.get('EXTRACTION_CACHE_ENABLED', 'True') == 'True'
+EXTRACTION_CACHE_TTL_SECONDS = int(os.environ.get('EXTRACTION_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', 5000))
+
+# Cola de extracción: pool de workers de tamaño fijo
+# En producción conviene EXTRACTION_WORKERS_IN_PROCESS=False y ejecutar `manage.py run_extraction_workers`
+EXTRACTION_WORKERS_IN_PROCESS = os.environ.get('EXTRACTION_WORKERS_IN_PROCESS', 'True') == 'True'
+EXTRACTION_WORKER_CONCURRENCY = int(os.environ.get('EXTRACTION_WORKER_CONCURRENCY', 2))
+EXTRACTION_JOB_POLL_INTERVAL = float(os.environ.get('EXTRACTION_JOB_POLL_INTERVAL', 2))
+EXTRACTION_JOB_STALE_SECONDS = int(os.environ.get('EXTRACTION_JOB_STALE_SECONDS', 600))
+# Segundos de reserva de un trabajo en ejecución; el worker la renueva cada tercio mientras
+# lo procesa (también durante los reintentos del modelo) y solo se retoma si vence
+EXTRACTION_JOB_LEASE_SECONDS = int(os.environ.get('EXTRACTION_JOB_LEASE_SECONDS', 90))
+# Segundos entre revisiones de trabajos abandonados mientras el pool está activo
+EXTRACTION_JOB_RECOVERY_INTERVAL = int(os.environ.get('EXTRACTION_JOB_RECOVERY_INTERVAL', 60))
+
+# Lotes: documentos por petición al modelo (1 = sin lotes) y espera máxima para completar un lote
+EXTRACTION_BATCH_SIZE = int(os.environ.get('EXTRACTION_BATCH_SIZE', 1))
+EXTRACTION_BATCH_MAX_WAIT = float(os.environ.get('EXTRACTION_BATCH_MAX_WAIT', 2.0))
+
+# Planificación por plan: peso por plan, envejecimiento y equidad por usuario
+EXTRACTION_PLAN_WEIGHTS = {'enterprise': 3, 'pro': 2, 'starter': 1}
+EXTRACTION_AGING_SECONDS = int(os.environ.get('EXTRACTION_AGING_SECONDS', 60))
+EXTRACTION_MAX_WAIT_SECONDS = int(os.environ.get('EXTRACTION_MAX_WAIT_SECONDS', 900))
+EXTRACTION_MAX_RUNNING_PER_USER = int(os.environ.get('EXTRACTION_MAX_RUNNING_PER_USER', 2))
+
+# Estado de salud del modelo: fallos para abrir el circuito e intervalo de la prueba en segundo plano
+MODEL_HEALTH_FAILURE_THRESHOLD = int(os.environ.get('MODEL_HEALTH_FAILURE_THRESHOLD', 3))
+MODEL_HEALTH_PROBE_INTERVAL = int(os.environ.get('MODEL_HEALTH_PROBE_INTERVAL', 60))
+
+# Backend de extracción: 'gemini' (producción) o 'local' (respuestas de fixture sin red, para pruebas de carga)
+EXTRACTION_BACKEND = os.environ.get('EXTRACTION_BACKEND', 'gemini')
+EXTRACTION_FIXTURE_PATH = os.environ.get('EXTRACTION_FIXTURE_PATH', '')
+EXTRACTION_FIXTURE_LATENCY = float(os.environ.get('EXTRACTION_FIXTURE_LATENCY', 0.5))
+EXTRACTION_FIXTURE_JITTER = float(os.environ.get('EXTRACTION_FIXTURE_JITTER', 0.0))
+EXTRACTION_FIXTURE_FAILURE_RATE = float(os.environ.get('EXTRACTION_FIXTURE_FAILURE_RATE', 0.0))
+
+# Extracción local previa (capa de texto del PDF y OCR con Tesseract); Gemini llena los campos
+# que no se obtuvieron localmente. El OCR se omite si la capa de texto ya trae todos los
+# EXTRACTION_LOCAL_REQUIRED_FIELDS (por defecto, todos los campos con regla local)
+EXTRACTION_LOCAL_ENABLED = os.environ.get('EXTRACTION_LOCAL_ENABLED', 'True') == 'True'
+EXTRACTION_LOCAL_MAX_PAGES = int(os.environ.get('EXTRACTION_LOCAL_MAX_PAGES', 2))
+EXTRACTION_OCR_ENABLED = os.environ.get('EXTRACTION_OCR_ENABLED', 'True') == 'True'
+EXTRACTION_OCR_DPI = int(os.environ.get('EXTRACTION_OCR_DPI', 300))
+EXTRACTION_OCR_LANG = os.environ.get('EXTRACTION_OCR_LANG', 'spa')
+
+# Reducción del PDF antes de enviarlo al modelo (páginas relevantes e imágenes a menor resolución)
+EXTRACTION_PREPROCESS_ENABLED = os.environ.get('EXTRACTION_PREPROCESS_ENABLED', 'True') == 'True'
+EXTRACTION_PREPROCESS_MAX_PAGES = int(os.environ.get('EXTRACTION_PREPROCESS_MAX_PAGES', 2))
+EXTRACTION_PREPROCESS_TARGET_DPI = int(os.environ.get('EXTRACTION_PREPROCESS_TARGET_DPI', 150))
+EXTRACTION_PREPROCESS_JPEG_QUALITY = int(os.environ.get('EXTRACTION_PREPROCESS_JPEG_QUALITY', 75))
+# Supuestos para estimar el tiempo ahorrado por documento
+EXTRACTION_UPLOAD_BYTES_PER_SECOND = int(os.environ.get('EXTRACTION_UPLOAD_BYTES_PER_SECOND', 1000000))
+EXTRACTION_MODEL_SECONDS_PER_PAGE = float(os.environ.get('EXTRACTION_MODEL_SECONDS_PER_PAGE', 0.5))
+
+# Resiliencia de las llamadas a Gemini: límites por minuto (por proceso) y reintentos
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 10))
+GEMINI_TOKENS_PER_MINUTE = int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', 1000000))
+GEMINI_RATE_LIMIT_MAX_WAIT = float(os.environ.get('GEMINI_RATE_LIMIT_MAX_WAIT', 30))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', 3))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get('GEMINI_RETRY_BASE_DELAY', 1.0))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get('GEMINI_RETRY_MAX_DELAY', 30.0))
+# Intentos máximos de un trabajo aplazado por indisponibilidad del modelo antes de marcarlo fallido
+EXTRACTION_JOB_MAX_ATTEMPTS = int(os.environ.get('EXTRACTION_JOB_MAX_ATTEMPTS', 10))
+
+# Contadores del dashboard e historial: segundos en caché (las señales invalidan la entrada
+# en el mismo proceso; con workers en otro proceso y caché local, el TTL acota el desfase)
+USER_STATS_CACHE_TTL = int(os.environ.get('USER_STATS_CACHE_TTL', 30))
+
+# Descargas de PDFs generados: '' (Django envía el archivo por bloques), 'x-accel' (nginx sirve
+# FILE_DOWNLOAD_ACCEL_PREFIX + ruta relativa desde una location internal) o 'x-sendfile' (Apache/lighttpd)
+FILE_DOWNLOAD_OFFLOAD = os.environ.get('FILE_DOWNLOAD_OFFLOAD', '')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# Motor de rellenado de plantillas PDF: 'merge' (combina el overlay en el contenido de la página),
+# 'xobject' (la plantilla se precalcula como Form XObject y cada página solo agrega el overlay)
+# o 'incremental' (bytes originales de la plantilla + actualización incremental con el overlay)
+PDF_FILL_ENGINE = os.environ.get('PDF_FILL_ENGINE', 'merge')
+
+# Caché de PDFs generados (mismos datos + misma plantilla reutilizan el archivo)
+GENERATION_CACHE_ENABLED = os.environ.get('GENERATION_CACHE_ENABLED', 'True') == 'True'
+GENERATION_CACHE_TTL_SECONDS = int(os.environ.get('GENERATION_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+GENERATION_CACHE_MAX_BYTES = int(os.environ.get('GENERATION_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+# Procesos del pool persistente que renderiza varios formularios a la vez (paquete de traspaso
+# y generación en lote); 0 = según los núcleos disponibles, máx. 4; 1 = en el mismo proceso
+RENDER_POOL_WORKERS = int(os.environ.get('RENDER_POOL_WORKERS', 0))
+# Segundos que se conservan los PDF combinados de la generación en lote (se descargan al crearse)
+BULK_MERGED_PDF_RETENTION_SECONDS = int(os.environ.get('BULK_MERGED_PDF_RETENTION_SECONDS', 3600))
+
+# Generación de formularios en segundo plano: la petición redirige a una página de progreso
+# y el PDF se renderiza en un executor del proceso con este máximo de renderizados a la vez
+FORM_GENERATION_ASYNC = os.environ.get('FORM_GENERATION_ASYNC', 'True') == 'True'
+FORM_GENERATION_MAX_CONCURRENT = int(os.environ.get('FORM_GENERATION_MAX_CONCURRENT', 2))
+# Segundos tras los que un trabajo de generación sin terminar se considera abandonado y se
+# reencola; los de un proceso de este host que ya no existe se reencolan de inmediato
+FORM_GENERATION_STALE_SECONDS = int(os.environ.get('FORM_GENERATION_STALE_SECONDS', 600))
+
+# Canal server-sent events de estados (documents:events). Con varios procesos (workers de
+# extracción aparte, varios workers ASGI) los eventos se reparten por Redis; si no, en memoria
+STATUS_EVENTS_REDIS_URL = os.environ.get('STATUS_EVENTS_REDIS_URL', '')
+# Segundos entre comentarios keepalive y duración máxima de una conexión antes de reconectar
+STATUS_EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('STATUS_EVENTS_HEARTBEAT_SECONDS', 15))
+STATUS_EVENTS_STREAM_SECONDS = int(os.environ.get('STATUS_EVENTS_STREAM_SECONDS', 300))
+# Milisegundos que espera el navegador para reconectar tras cerrarse una conexión ASGI
+STATUS_EVENTS_RETRY_MS = int(os.environ.get('STATUS_EVENTS_RETRY_MS', 2000))
+# Bajo WSGI (gunicorn) cada reconexión es una consulta: no menos que el antiguo sondeo de 3 s.
+# El envío inmediato de cada cambio requiere ASGI y, con varios procesos, STATUS_EVENTS_REDIS_URL
+STATUS_EVENTS_WSGI_RETRY_MS = int(os.environ.get('STATUS_EVENTS_WSGI_RETRY_MS', 3000))
+
 # Email Configuration
 if DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'